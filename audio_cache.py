@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+logger = logging.getLogger('discord')
+
+_INDEX_FILE = 'index.json'
+_PARTIAL_SUFFIXES = ('.part', '.ytdl', '.tmp')
+_MAX_FILE_SHARE = 0.1  # 單一檔案最多佔快取容量上限的比例
+
+
+# 不適合快取的歌曲（直播、過長或檔案過大）
+class NotCacheable(Exception):
+    pass
+
+
+# 在背景執行緒中下載音訊檔（不轉檔，直接保留 YouTube 提供的音訊格式）
+# 先只取得資訊，直播或超過長度上限的影片不下載；max_filesize 讓 yt-dlp 跳過已知大小超過上限的格式
+def download_audio(url: str, directory: str, max_filesize: int, max_duration: float) -> dict:
+    ytdl_opts = {
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+        'quiet': True,
+        'noplaylist': True,
+        'max_filesize': max_filesize,
+        'outtmpl': os.path.join(directory, '%(id)s.%(ext)s'),
+    }
+    with yt_dlp.YoutubeDL(ytdl_opts) as ytdl:
+        info = ytdl.extract_info(url, download=False)
+        if info.get('is_live') or info.get('live_status') in ('is_live', 'is_upcoming', 'post_live'):
+            raise NotCacheable('直播')
+        duration = info.get('duration')
+        if max_duration and (duration is None or duration > max_duration):
+            raise NotCacheable(f'長度 {duration} 秒超過上限 {max_duration:g} 秒')
+        info = ytdl.process_ie_result(info, download=True)
+        downloads = info.get('requested_downloads') or [{}]
+        path = downloads[0].get('filepath') or ytdl.prepare_filename(info)
+        if not os.path.isfile(path):
+            # 超過 max_filesize 時 yt-dlp 不下載也不報錯
+            raise NotCacheable(f'檔案超過 {max_filesize / 1024 / 1024:.1f} MB')
+        return {'path': path, 'codec': info.get('acodec')}
+
+
+class CachedFile:
+    __slots__ = ('path', 'size', 'codec', 'hits', 'last_access')
+
+    def __init__(self, path, size, codec=None, hits=0, last_access=0.0):
+        self.path = path
+        self.size = size
+        self.codec = codec
+        self.hits = hits
+        self.last_access = last_access
+
+
+# 熱門歌曲的本機音訊快取：以影片 ID 為鍵，總大小超過上限時淘汰播放次數最少（同次數時最久未用）的檔案
+# 直播、長度超過 max_duration 秒或大於容量上限一定比例的檔案不快取
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int, min_plays: int = 2, max_duration: float = 1800):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = int(max_bytes * _MAX_FILE_SHARE)
+        self.max_duration = max_duration
+        self.min_plays = min_plays
+        self._files = {}               # video_id -> CachedFile
+        self._play_counts = Counter()  # video_id -> 播放次數，用來決定是否值得下載
+        self._downloading = set()
+        self._rejected = set()         # 不適合快取的影片，不再重試
+        self._tasks = set()            # 下載中的 asyncio.Task，保留參考並在關閉時取消
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-cache')
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.download_errors = 0
+        self.rejected = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        try:
+            with open(os.path.join(self.directory, _INDEX_FILE), encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        self._play_counts.update(index.get('plays', {}))
+        meta = index.get('files', {})
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name == _INDEX_FILE or not os.path.isfile(path):
+                continue
+            if name.endswith(_PARTIAL_SUFFIXES):
+                # 上次中斷的下載留下的暫存檔，不計入容量上限，直接刪除
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"刪除未完成的音訊快取檔案失敗 {path}: {e}")
+                continue
+            video_id = os.path.splitext(name)[0]
+            info = meta.get(video_id, {})
+            size = os.path.getsize(path)
+            self._files[video_id] = CachedFile(
+                path, size, info.get('codec'), info.get('hits', 0), info.get('last_access', os.path.getmtime(path))
+            )
+            self.total_bytes += size
+        logger.info(f"音訊快取：{len(self._files)} 個檔案，共 {self.total_bytes / 1024 / 1024:.1f} MB")
+        self._evict()
+
+    def lookup(self, video_id: str):
+        cached = self._files.get(video_id) if video_id else None
+        if cached is None:
+            self.misses += 1
+            return None
+        cached.hits += 1
+        cached.last_access = time.time()
+        self.hits += 1
+        return cached
+
+    # 查詢檔案路徑（不計入命中統計）
+    def path(self, video_id: str):
+        cached = self._files.get(video_id) if video_id else None
+        return cached.path if cached else None
+
+    # 記錄一次播放，播放次數達到門檻且尚未快取時在背景下載
+    def record_play(self, video_id: str, url: str):
+        if not video_id:
+            return
+        self._play_counts[video_id] += 1
+        if (self._play_counts[video_id] >= self.min_plays
+                and video_id not in self._files and video_id not in self._downloading
+                and video_id not in self._rejected):
+            self._downloading.add(video_id)
+            task = asyncio.create_task(self._download(video_id, url))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _download(self, video_id: str, url: str):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._executor, download_audio, url, self.directory, self.max_file_bytes, self.max_duration
+            )
+            size = os.path.getsize(result['path'])
+            if size > self.max_file_bytes:
+                # 下載前不知道大小的格式，下載後才能檢查
+                os.remove(result['path'])
+                raise NotCacheable(f'檔案 {size / 1024 / 1024:.1f} MB 超過 {self.max_file_bytes / 1024 / 1024:.1f} MB')
+        except NotCacheable as e:
+            self._rejected.add(video_id)
+            self.rejected += 1
+            logger.info(f"不快取音訊 {url}: {e}")
+            return
+        except Exception as e:
+            self.download_errors += 1
+            logger.warning(f"下載音訊快取失敗 {url}: {e}")
+            return
+        finally:
+            self._downloading.discard(video_id)
+
+        self._files[video_id] = CachedFile(result['path'], size, result['codec'], 0, time.time())
+        self.total_bytes += size
+        self.downloads += 1
+        logger.info(f"已快取音訊 {video_id}（{size / 1024 / 1024:.1f} MB）")
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._files:
+            video_id = min(self._files, key=lambda k: (self._play_counts[k], self._files[k].last_access))
+            cached = self._files.pop(video_id)
+            try:
+                os.remove(cached.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # 檔案可能正在播放（Windows 無法刪除開啟中的檔案），下次再試
+                logger.warning(f"刪除音訊快取檔案失敗 {cached.path}: {e}")
+                self._files[video_id] = cached
+                break
+            self.total_bytes -= cached.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'files': len(self._files),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'downloads': self.downloads,
+            'download_errors': self.download_errors,
+            'rejected': self.rejected,
+            'evictions': self.evictions,
+        }
+
+    # 在事件迴圈上取得索引內容，實際寫入交給 write_index()
+    def snapshot_index(self) -> dict:
+        return {
+            'plays': dict(self._play_counts.most_common(10000)),
+            'files': {
+                video_id: {'codec': f.codec, 'hits': f.hits, 'last_access': f.last_access}
+                for video_id, f in self._files.items()
+            },
+        }
+
+    def write_index(self, index: dict):
+        path = os.path.join(self.directory, _INDEX_FILE)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.error(f"寫入音訊快取索引時發生錯誤: {e}")
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.write_index(self.snapshot_index())
@@ -0,0 +1,321 @@
+# 熱路徑的元件效能測試（完全離線）
+#
+# 用法：
+#   python benchmarks/bench_components.py [--ops 2000] [--only queue_move,play_command]
+#   python benchmarks/bench_components.py --save-baseline      # 更新 baselines.json
+#   python benchmarks/bench_components.py --fail-over 25       # 比基準慢超過 25% 時回傳非 0
+#
+# 以 fakes.py 的假語音連線、假 YoutubeDL 與空音源執行播放迴圈、搜尋結果轉換、隊列操作、
+# 播放清單嵌入訊息與 /play 指令流程。每個項目先量測延遲（ops/s、p50、p99），
+# 再另外跑一輪以 tracemalloc 統計每次操作的暫時配置量（會拖慢執行，因此不與計時混在一起）。
+# 基準數值與機器及 --ops 有關，換機器後請先以 --save-baseline 重建；操作次數與基準不同的項目不做比較。
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import fakes
+from fakes import bot
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(cls):
+        BENCHMARKS[name] = cls
+        return cls
+    return register
+
+
+# 每個測試：setup() 建立狀態，op(i) 執行一次操作，teardown() 清理
+class Benchmark:
+    async def setup(self):
+        pass
+
+    async def op(self, i: int):
+        raise NotImplementedError
+
+    async def teardown(self):
+        pass
+
+
+@benchmark('queue_append_popleft')
+class QueueAppendPopleft(Benchmark):
+    async def setup(self):
+        self.queue = bot.Playlist(fakes.make_song(n) for n in range(5000))
+        self.song = fakes.make_song(0)
+
+    async def op(self, i):
+        self.queue.append(self.song)
+        self.queue.popleft()
+
+
+@benchmark('queue_move')
+class QueueMove(Benchmark):
+    async def setup(self):
+        self.queue = bot.Playlist(fakes.make_song(n) for n in range(5000))
+        rng = random.Random(1)
+        self.moves = [(rng.randrange(5000), rng.randrange(5000)) for _ in range(1024)]
+
+    async def op(self, i):
+        source, destination = self.moves[i % len(self.moves)]
+        self.queue.move(source, destination)
+
+
+@benchmark('queue_remove_insert')
+class QueueRemoveInsert(Benchmark):
+    async def setup(self):
+        self.queue = bot.Playlist(fakes.make_song(n) for n in range(5000))
+        rng = random.Random(2)
+        self.indexes = [rng.randrange(4999) for _ in range(1024)]
+
+    async def op(self, i):
+        index = self.indexes[i % len(self.indexes)]
+        self.queue.insert(index, self.queue.pop(index))
+
+
+# 搜尋結果轉換：每次都是快取未命中，經過解析工作池與 Song 建立
+@benchmark('search_songs_miss')
+class SearchSongsMiss(Benchmark):
+    async def setup(self):
+        await fakes.reset_bot_state()
+
+    async def op(self, i):
+        songs = await bot.search_songs(f'benchmark query {i} {time.perf_counter_ns()}', guild_id=1)
+        assert len(songs) == 5
+
+    async def teardown(self):
+        bot.metadata_cache._entries.clear()
+
+
+@benchmark('search_songs_hit')
+class SearchSongsHit(Benchmark):
+    async def setup(self):
+        await fakes.reset_bot_state()
+        await bot.search_songs('benchmark cached query', guild_id=1)
+
+    async def op(self, i):
+        await bot.search_songs('benchmark cached query', guild_id=1)
+
+    async def teardown(self):
+        bot.metadata_cache._entries.clear()
+
+
+class _PlayerBenchmark(Benchmark):
+    queue_size = 5000
+
+    async def setup(self):
+        await fakes.reset_bot_state()
+        fakes.use_null_sources()
+        self.ctx = fakes.FakeContext()
+        self.player = bot.MusicPlayer(self.ctx, self.ctx.bot.loop)
+        bot.players[self.ctx.guild.id] = self.player
+        for n in range(self.queue_size):
+            self.player.queue.append(fakes.make_song(n))
+
+    async def teardown(self):
+        await fakes.reset_bot_state()
+
+
+# 翻頁：隊列沒變動時應直接使用快取的頁面
+@benchmark('queue_embed_page_turn')
+class QueueEmbedPageTurn(_PlayerBenchmark):
+    async def setup(self):
+        await super().setup()
+        self.player.task.cancel()
+        self.view = bot.QueueEmbedView(self.player, self.ctx)
+
+    async def op(self, i):
+        self.view.page = i % self.view.total_pages
+        self.view.generate_embed()
+
+
+# 每次產生前隊列都有變動（快取失效），量測重新排版單一頁面的成本
+@benchmark('queue_embed_after_change')
+class QueueEmbedAfterChange(_PlayerBenchmark):
+    async def setup(self):
+        await super().setup()
+        self.player.task.cancel()
+        self.view = bot.QueueEmbedView(self.player, self.ctx)
+
+    async def op(self, i):
+        self.player.queue.move(0, len(self.player.queue) - 1)
+        self.view.page = i % self.view.total_pages
+        self.view.generate_embed()
+
+
+# 換曲：從目前歌曲結束到下一首呼叫 play() 的時間（包含串流網址解析與建立音源）
+@benchmark('player_loop_track_change')
+class PlayerLoopTrackChange(_PlayerBenchmark):
+    async def setup(self):
+        await super().setup()
+        self.voice_client = self.ctx.voice_client
+        await self._wait_started()
+
+    async def _wait_started(self):
+        await self.voice_client.started.wait()
+        self.voice_client.started.clear()
+
+    async def op(self, i):
+        # 手動跳過，避免被當成「過早結束」而重試
+        self.player.skipped = True
+        self.voice_client.finish()
+        await self._wait_started()
+
+
+# /play 指令流程：貼上單一影片網址（快取未命中）直到歌曲加入隊列
+@benchmark('play_command_url')
+class PlayCommandUrl(_PlayerBenchmark):
+    queue_size = 0
+
+    async def setup(self):
+        await super().setup()
+        self.player.task.cancel()
+        self.player.schedule_prefetch = lambda: None
+
+    async def op(self, i):
+        await bot.play.callback(self.ctx, search=f'https://www.youtube.com/watch?v={fakes.fake_video_id(10_000_000 + i)}')
+
+    async def teardown(self):
+        await super().teardown()
+        bot.metadata_cache._entries.clear()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_benchmark(name: str, ops: int, warmup: int) -> dict:
+    instance = BENCHMARKS[name]()
+
+    # 計時
+    await instance.setup()
+    try:
+        for i in range(warmup):
+            await instance.op(i)
+        gc.collect()
+        samples = []
+        total_started = time.perf_counter()
+        for i in range(warmup, warmup + ops):
+            started = time.perf_counter()
+            await instance.op(i)
+            samples.append(time.perf_counter() - started)
+        total = time.perf_counter() - total_started
+    finally:
+        await instance.teardown()
+
+    # 配置量
+    instance = BENCHMARKS[name]()
+    await instance.setup()
+    try:
+        for i in range(warmup):
+            await instance.op(i)
+        alloc_ops = min(ops, 500)
+        peaks = []
+        tracemalloc.start()
+        try:
+            for i in range(warmup, warmup + alloc_ops):
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                await instance.op(i)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+        finally:
+            tracemalloc.stop()
+    finally:
+        await instance.teardown()
+
+    return {
+        'ops_per_sec': ops / total,
+        'p50_us': percentile(samples, 0.50) * 1e6,
+        'p99_us': percentile(samples, 0.99) * 1e6,
+        'alloc_bytes': statistics.mean(peaks),
+    }
+
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compare(result: dict, baseline: dict, ops: int):
+    if not baseline:
+        return '', 0.0
+    # 延遲與操作次數有關（例如翻頁會重複用到已算過的頁面），次數不同時不比較
+    if baseline.get('ops') != ops:
+        return 'ops≠', 0.0
+    # 以 p50 判斷快慢；正值表示變慢
+    change = (result['p50_us'] - baseline['p50_us']) / baseline['p50_us'] * 100 if baseline['p50_us'] else 0.0
+    return f"{change:+.1f}%", change
+
+
+async def main_async(args):
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"未知的測試項目: {', '.join(unknown)}（可用: {', '.join(BENCHMARKS)}）")
+
+    baselines = load_baselines()
+    stored = baselines.get('results', {})
+    results = {}
+    regressions = []
+
+    print(f"{'benchmark':<28}{'ops/s':>12}{'p50 µs':>10}{'p99 µs':>10}{'alloc B/op':>12}{'vs base':>10}")
+    for name in names:
+        result = await run_benchmark(name, args.ops, args.warmup)
+        results[name] = result
+        delta, change = compare(result, stored.get(name), args.ops)
+        if args.fail_over is not None and change > args.fail_over:
+            regressions.append(name)
+        print(
+            f"{name:<28}{result['ops_per_sec']:>12.0f}{result['p50_us']:>10.1f}"
+            f"{result['p99_us']:>10.1f}{result['alloc_bytes']:>12.0f}{delta:>10}",
+            flush=True
+        )
+
+    if args.save_baseline:
+        stored.update({
+            name: {'ops': args.ops, **{k: round(v, 2) for k, v in result.items()}}
+            for name, result in results.items()
+        })
+        baselines = {
+            'machine': f"{platform.system()} {platform.machine()} / Python {platform.python_version()}",
+            'results': stored,
+        }
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"已寫入基準：{BASELINE_PATH}")
+
+    if regressions:
+        print(f"比基準慢超過 {args.fail_over}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='元件效能測試（離線）')
+    parser.add_argument('--ops', type=int, default=2000, help='每個項目量測的操作次數')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--only', default=None, help='只執行指定項目（逗號分隔）')
+    parser.add_argument('--save-baseline', action='store_true', help='將結果寫入 baselines.json')
+    parser.add_argument('--fail-over', type=float, default=None, help='p50 比基準慢超過此百分比時回傳非 0')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == '__main__':
+    main()
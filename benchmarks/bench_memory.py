@@ -0,0 +1,136 @@
+# 測量大量排隊歌曲的記憶體用量
+#
+# 用法：
+#   python benchmarks/bench_memory.py [--guilds 500] [--tracks 200] [--unique 5000]
+#
+# 模擬多個伺服器同時排隊：每首歌都像從 yt-dlp 回傳的 JSON 一樣以新的字串物件建立，
+# 歌曲依 Zipf 分布挑選（熱門歌曲會在許多伺服器重複出現）。
+# 以 tracemalloc 計算每首排隊歌曲佔用的位元組，並回報行程的 RSS。
+# 另外以舊版（沒有 __slots__、每首都存預設縮圖字串）的 Song 做對照。
+# 每種變體在獨立的子行程中測量，避免字串駐留表等狀態互相影響。
+import argparse
+import gc
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+
+import fakes  # noqa: F401  先設定隔離的環境變數（不讀寫 data/、log/）再匯入 bot
+from fakes import bot
+from playlist import Playlist
+
+
+# 舊版 Song：一般類別，每個實例都有 __dict__
+class LegacySong:
+    def __init__(self, source_url, webpage_url, title, thumbnail):
+        self.source_url = source_url
+        self.webpage_url = webpage_url
+        self.title = title
+        self.thumbnail = thumbnail
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def make_catalog(unique: int):
+    catalog = []
+    for i in range(unique):
+        video_id = f'{i:011d}'
+        has_thumbnail = i % 3 != 0
+        catalog.append((
+            f'https://www.youtube.com/watch?v={video_id}',
+            f'Artist {i % 700} - Some Popular Song Title Number {i} (Official Music Video)',
+            f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg' if has_thumbnail else None,
+        ))
+    return catalog
+
+
+def fresh(text):
+    # 模擬解析 JSON 產生的新字串物件
+    return None if text is None else text.encode().decode()
+
+
+def build_queues(factory, catalog, guilds, tracks, seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(catalog))]
+    queues = []
+    for _ in range(guilds):
+        queue = Playlist()
+        for webpage_url, title, thumbnail in rng.choices(catalog, weights, k=tracks):
+            queue.append(factory(fresh(webpage_url), fresh(title), fresh(thumbnail)))
+        queues.append(queue)
+    return queues
+
+
+def measure(name, factory, catalog, args):
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queues = build_queues(factory, catalog, args.guilds, args.tracks, args.seed)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    rss_after = rss_bytes()
+    songs = args.guilds * args.tracks
+    print(
+        f"{name:<22}{songs:>10}{allocated / songs:>14.1f}"
+        f"{allocated / 1024 / 1024:>14.1f}{(rss_after - rss_before) / 1024 / 1024:>14.1f}"
+    )
+    del queues
+    gc.collect()
+
+
+VARIANTS = {
+    'legacy': 'legacy (dict)',
+    'slots': 'Song (__slots__)',
+    'compact': 'Song (compact)',
+}
+
+
+def run_variant(variant, args):
+    catalog = make_catalog(args.unique)
+    if variant == 'legacy':
+        def factory(url, title, thumb):
+            return LegacySong(None, url, title, thumb or bot.DEFAULT_THUMBNAIL.encode().decode())
+    else:
+        bot.COMPACT_SONGS = variant == 'compact'
+
+        def factory(url, title, thumb):
+            return bot.Song(None, url, title, thumb)
+    measure(VARIANTS[variant], factory, catalog, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='排隊歌曲記憶體用量測試')
+    parser.add_argument('--guilds', type=int, default=500)
+    parser.add_argument('--tracks', type=int, default=200)
+    parser.add_argument('--unique', type=int, default=5000, help='不重複的歌曲數量')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--variant', choices=VARIANTS, help='只測量單一變體（內部使用）')
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args)
+        return
+
+    print(f"{'variant':<22}{'songs':>10}{'bytes/song':>14}{'traced MB':>14}{'RSS delta MB':>14}", flush=True)
+    for variant in VARIANTS:
+        subprocess.run([
+            sys.executable, os.path.abspath(__file__), '--variant', variant,
+            '--guilds', str(args.guilds), '--tracks', str(args.tracks),
+            '--unique', str(args.unique), '--seed', str(args.seed),
+        ], check=True)
+
+
+if __name__ == '__main__':
+    main()
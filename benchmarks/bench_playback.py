@@ -0,0 +1,100 @@
+# 比較 PCM 解碼 + Python 端 Opus 編碼 與 Opus 直通兩種播放路徑的 CPU 用量
+#
+# 用法：
+#   python benchmarks/bench_playback.py <音訊檔或串流網址> [--seconds 60] [--codec opus]
+#
+# 每條路徑都以與機器人相同的方式讀取 20ms 音框（PCM 路徑另外用 libopus 編碼，
+# 等同 VoiceClient 送出前做的事），並統計本行程與 FFmpeg 子行程的 CPU 時間。
+# 需要 ffmpeg 與 libopus，並使用 resource 模組，僅能在 Linux/macOS 上執行。
+import argparse
+import resource
+import time
+
+import discord
+from discord.opus import Encoder
+
+FRAME_SECONDS = 0.02
+
+
+def child_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_path(name: str, make_source, max_frames: int, encode: bool) -> dict:
+    encoder = Encoder() if encode else None
+    child_before = child_cpu()
+    self_before = time.process_time()
+    wall_before = time.perf_counter()
+
+    source = make_source()
+    frames = 0
+    try:
+        while frames < max_frames:
+            data = source.read()
+            if not data:
+                break
+            if encoder is not None:
+                encoder.encode(data, Encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    finally:
+        # cleanup 會等待 FFmpeg 結束，子行程的 CPU 時間才會被計入
+        source.cleanup()
+
+    self_cpu = time.process_time() - self_before
+    ffmpeg_cpu = child_cpu() - child_before
+    audio_seconds = frames * FRAME_SECONDS
+    return {
+        'name': name,
+        'audio_seconds': audio_seconds,
+        'wall': time.perf_counter() - wall_before,
+        'self_cpu': self_cpu,
+        'ffmpeg_cpu': ffmpeg_cpu,
+        'cpu_per_stream': (self_cpu + ffmpeg_cpu) / audio_seconds if audio_seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='播放路徑 CPU 用量比較')
+    parser.add_argument('source', help='本機音訊檔或串流網址')
+    parser.add_argument('--seconds', type=float, default=60, help='每條路徑最多讀取的音訊秒數')
+    parser.add_argument('--codec', default=None, help='來源編碼（例如 opus）；為 opus 時直通路徑使用 copy')
+    parser.add_argument('--bitrate', type=int, default=128, help='需要轉碼時的 Opus 位元率（kbps）')
+    parser.add_argument('--before-options', default=None, help='傳給 FFmpeg 的 before_options')
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+    max_frames = int(args.seconds / FRAME_SECONDS)
+
+    results = [
+        run_path(
+            'pcm (decode + libopus)',
+            lambda: discord.FFmpegPCMAudio(args.source, before_options=args.before_options),
+            max_frames,
+            encode=True,
+        ),
+        run_path(
+            f"opus ({'copy' if args.codec == 'opus' else 'transcode'})",
+            lambda: discord.FFmpegOpusAudio(
+                args.source,
+                codec='copy' if args.codec == 'opus' else None,
+                bitrate=args.bitrate,
+                before_options=args.before_options,
+            ),
+            max_frames,
+            encode=False,
+        ),
+    ]
+
+    print(f"{'path':<26}{'audio s':>10}{'wall s':>10}{'python cpu':>12}{'ffmpeg cpu':>12}{'cpu/stream':>12}")
+    for r in results:
+        print(
+            f"{r['name']:<26}{r['audio_seconds']:>10.1f}{r['wall']:>10.2f}"
+            f"{r['self_cpu']:>12.3f}{r['ffmpeg_cpu']:>12.3f}{r['cpu_per_stream']:>11.2%}"
+        )
+    # cpu/stream：每秒音訊耗用的 CPU 秒數，即一個串流即時播放時佔用的單核比例
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+# 離線測試用的假物件：不連線 Discord、不呼叫 YouTube、不啟動 FFmpeg
+#
+# 匯入本模組時會先設定環境變數再匯入 bot，並把 yt_dlp.YoutubeDL 換成回傳固定資料的 FakeYoutubeDL。
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+os.environ['CACHE_PATH'] = ''
+os.environ['AUDIO_CACHE_DIR'] = ''
+os.environ['LOG_DIR'] = ''
+os.environ.setdefault('LOG_CONSOLE_LEVEL', 'WARNING')
+os.environ['METRICS_PORT'] = '0'
+os.environ['STATE_PATH'] = ''
+os.environ['TITLE_INDEX_PATH'] = ''
+os.environ['LOUDNESS_PATH'] = ''
+
+import discord  # noqa: E402
+import yt_dlp  # noqa: E402
+
+import bot  # noqa: E402
+
+_ids = itertools.count()
+
+
+def fake_video_id(n: int) -> str:
+    return f'{n:011d}'[-11:]
+
+
+def video_info(video_id: str, title: str = None) -> dict:
+    return {
+        'id': video_id,
+        'url': f'https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&expire={int(time.time()) + 21600}',
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'title': title or f'Artist {video_id[-3:]} - Benchmark Song {video_id} (Official Audio)',
+        'thumbnail': f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg',
+        'acodec': 'opus',
+        'duration': 215,
+    }
+
+
+# 扁平解析（extract_flat）的項目：只有 ID、標題、長度與縮圖，沒有串流網址
+def flat_entry(video_id: str, title: str = None) -> dict:
+    info = video_info(video_id, title)
+    return {
+        '_type': 'url',
+        'ie_key': 'Youtube',
+        'id': video_id,
+        'url': info['webpage_url'],
+        'title': info['title'],
+        'duration': info['duration'],
+        'thumbnails': [{'url': info['thumbnail']}],
+    }
+
+
+# 依查詢內容回傳固定格式的資料：網址回傳單一影片，關鍵字回傳五筆搜尋結果（flat 時為扁平項目）
+def canned_info(query: str, flat: bool = False) -> dict:
+    if query.startswith('http'):
+        return video_info(bot.video_id(query) or fake_video_id(next(_ids)))
+    make_entry = flat_entry if flat else video_info
+    return {
+        '_type': 'playlist',
+        'title': query,
+        'entries': [make_entry(fake_video_id(next(_ids)), f'{query} #{i}') for i in range(5)],
+    }
+
+
+class FakeYoutubeDL:
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, query, download=False):
+        return canned_info(query, flat=bool(self.params.get('extract_flat')))
+
+    def sanitize_info(self, info):
+        return info
+
+
+yt_dlp.YoutubeDL = FakeYoutubeDL
+
+
+# 不產生任何音訊的音源
+class NullAudioSource(discord.AudioSource):
+    def __init__(self, url=None, frames: int = 0):
+        self.url = url
+        self.frames = frames
+        self.cleaned = False
+
+    def read(self) -> bytes:
+        if self.frames <= 0:
+            return b''
+        self.frames -= 1
+        return b'\xf8\xff\xfe'  # Opus 靜音音框
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+async def null_create_source(self, url, codec, before_options, gain=None):
+    return NullAudioSource(url)
+
+
+def use_null_sources():
+    bot.MusicPlayer.create_source = null_create_source
+
+
+# 假的語音連線：play() 只記錄音源，歌曲何時結束由呼叫端決定（finish()）
+class FakeVoiceClient:
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.channel = None
+        self.source = None
+        self.played = 0
+        self._after = None
+        self._playing = False
+        self._paused = False
+        self._connected = True
+        self.started = asyncio.Event()
+
+    def is_playing(self) -> bool:
+        return self._playing
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def play(self, source, *, after=None, **kwargs):
+        self.source = source
+        self._after = after
+        self._playing = True
+        self._paused = False
+        self.played += 1
+        self.started.set()
+
+    def finish(self, error=None):
+        if self._playing or self._paused:
+            self._playing = self._paused = False
+            after, self._after = self._after, None
+            self.source.cleanup()
+            if after:
+                after(error)
+
+    def stop(self):
+        self.finish()
+
+    def pause(self):
+        if self._playing:
+            self._playing = False
+            self._paused = True
+
+    def resume(self):
+        if self._paused:
+            self._paused = False
+            self._playing = True
+
+    async def disconnect(self, *, force=False):
+        self._connected = False
+        self.finish()
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, content=None, embed=None, view=None, latency: float = 0.0):
+        self.id = next(self._ids)
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.view = view
+        self.latency = latency  # 模擬 Discord HTTP API 的往返時間
+        self.edits = 0
+
+    async def edit(self, *, content=None, embed=None, view=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if view is not None:
+            self.view = view
+        return self
+
+
+class FakeChannel:
+    def __init__(self, voice_client: FakeVoiceClient):
+        self.voice_client = voice_client
+        self.members = []
+
+    async def connect(self, **kwargs):
+        return self.voice_client
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeAuthor:
+    _ids = itertools.count(1000)
+
+    def __init__(self, voice_channel=None):
+        self.id = next(self._ids)
+        self.display_name = f'user{self.id}'
+        self.mention = f'<@{self.id}>'
+        self.avatar = None
+        self.bot = False
+        self.voice = FakeVoiceState(voice_channel) if voice_channel else None
+
+
+class FakeGuild:
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.voice_client = None
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+# 模擬文字指令的 Context（interaction 為 None，走 ctx.send 的路徑）
+class FakeContext:
+    def __init__(self, guild: FakeGuild = None, voice_client: FakeVoiceClient = None, send_latency: float = 0.0):
+        loop = asyncio.get_running_loop()
+        self.guild = guild or FakeGuild()
+        self.voice_client = voice_client or FakeVoiceClient(loop)
+        self.voice_client.channel = FakeChannel(self.voice_client)
+        self.guild.voice_client = self.voice_client
+        self.author = FakeAuthor(self.voice_client.channel)
+        self.interaction = None
+        self.bot = FakeBot(loop)
+        self.command = None
+        self.send_latency = send_latency
+        self.sent = 0
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        return FakeMessage(content, embed, view, self.send_latency)
+
+    async def defer(self, **kwargs):
+        pass
+
+    async def trigger_typing(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise RuntimeError('互動已回應過')
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeMessage(content, embed, view, self.latency)
+
+
+# 按鈕與選單的互動（只有 callback 會用到的屬性）
+class FakeInteraction:
+    def __init__(self, ctx: FakeContext, latency: float = 0.0):
+        self.user = ctx.author
+        self.guild = ctx.guild
+        self.guild_id = ctx.guild.id
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse(latency)
+        self.followup = FakeFollowup(latency)
+
+
+def make_song(n: int) -> bot.Song:
+    info = video_info(fake_video_id(n))
+    return bot.Song(None, info['webpage_url'], info['title'], info['thumbnail'])
+
+
+# 清掉 bot 的全域狀態，讓每個測試從相同狀態開始
+async def reset_bot_state():
+    for player in list(bot.players.values()):
+        await player.destroy()
+    bot.players.clear()
+    bot.metadata_cache._entries.clear()
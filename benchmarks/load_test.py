@@ -0,0 +1,516 @@
+# 端到端負載測試：以指令序列（trace）模擬多個伺服器同時使用機器人（完全離線）
+#
+# 用法：
+#   python benchmarks/load_test.py [--guilds 10,50,100,200] [--step-seconds 30]
+#   python benchmarks/load_test.py --save-trace trace.jsonl     # 另存產生的指令序列
+#   python benchmarks/load_test.py --trace trace.jsonl          # 重播錄製（或之前另存）的指令序列
+#
+# 以 fakes.py 的假 Context 直接呼叫 bot.py 的指令（/play、/skip、/queue）、搜尋結果選單與控制按鈕的 callback；
+# yt-dlp 由假的 YoutubeDL 回應（在解析工作池的執行緒中等待 --extract-latency 秒），
+# 送出/編輯訊息與回應互動都等待 --http-latency 秒，模擬 Discord HTTP API 的往返時間。
+# 語音連線以 PacedVoiceClient 模擬：與 discord.py 的 AudioPlayer 一樣，每個連線一條執行緒、每 20ms 讀取一個音框，
+# 並記錄實際送出間隔，事件迴圈或 GIL 忙碌造成的延遲會直接反映在音框抖動上。
+#
+# 負載逐步增加：--guilds 的每個數值為一個階段，每階段持續 --step-seconds 秒，前一階段的伺服器持續運作。
+# 每個階段回報：事件迴圈延遲、各指令從排定時間到完成的 p50/p99（開放式負載，不因回應變慢而減少送出的指令）、
+# 音框間隔與 20ms 的偏差（中位數伺服器與最差伺服器的 p99）、遲到超過 --late-ms 的音框比例、CPU 使用率與 FFmpeg 名額狀態。
+# 第一個超過 --max-command-p99 或 --max-jitter-p99 的階段視為開始劣化。
+#
+# trace 為 JSON Lines，每行一個指令：
+#   {"at": 秒數, "guild": 伺服器編號, "action": "play" | "skip" | "queue" | "button", "arg": 參數}
+# play 的 arg 為網址或關鍵字（關鍵字會在 --select-delay 秒後選取第一個結果），button 的 arg 為 pause / skip / loop / queue。
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import statistics
+import sys
+import threading
+import time
+
+import fakes
+import yt_dlp
+from fakes import bot
+
+FRAME_SECONDS = 0.02
+ACTIONS = ('play', 'skip', 'queue', 'button')
+BUTTONS = {
+    'pause': 'pause_resume_button',
+    'skip': 'skip_button',
+    'loop': 'loop_button',
+    'queue': 'view_queue_button',
+}
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def format_ms(value) -> str:
+    return '-' if value is None else f'{value * 1000:.0f}'
+
+
+# --- 假的外部服務 ---
+
+# 模擬 yt-dlp 的網路延遲：在解析工作池的執行緒中等待，與真正的解析一樣佔用工作執行緒
+class SlowYoutubeDL(fakes.FakeYoutubeDL):
+    latency = 0.0
+
+    def extract_info(self, query, download=False):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        return super().extract_info(query, download)
+
+
+# 固定長度的 Opus 靜音音源
+class TimedAudioSource(fakes.NullAudioSource):
+    track_seconds = 30.0
+
+    def __init__(self, url=None):
+        super().__init__(url, int(self.track_seconds / FRAME_SECONDS))
+
+
+async def timed_create_source(self, url, codec, before_options, gain=None):
+    return TimedAudioSource(url)
+
+
+# 每個伺服器的音框送出紀錄（由語音執行緒寫入，每個階段結束時由事件迴圈取走）
+class FrameRecorder:
+    def __init__(self):
+        self.intervals = []
+        self.frames = 0
+
+    def take(self):
+        intervals, self.intervals = self.intervals, []
+        return intervals
+
+
+# 與 discord.py 的 AudioPlayer 相同的送出節奏：每個音框排定在 start + n * 20ms，
+# 落後時不補送、直接接著送下一個；結束或 stop() 後在執行緒中呼叫 cleanup 與 after
+class _Playback(threading.Thread):
+    def __init__(self, client, source, after):
+        super().__init__(daemon=True, name=f'voice-{client.recorder_id}')
+        self.client = client
+        self.source = source
+        self.after = after
+        self.ended = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+
+    def run(self):
+        recorder = self.client.recorder
+        error = None
+        try:
+            start = time.perf_counter()
+            last = None
+            loops = 0
+            while not self.ended.is_set():
+                if not self.resumed.is_set():
+                    self.resumed.wait()
+                    start = time.perf_counter()
+                    last = None
+                    loops = 0
+                    continue
+                data = self.source.read()
+                if not data:
+                    break
+                now = time.perf_counter()
+                if last is not None:
+                    recorder.intervals.append(now - last)
+                last = now
+                recorder.frames += 1
+                loops += 1
+                delay = start + FRAME_SECONDS * loops - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            self.source.cleanup()
+            self.ended.set()
+            if self.after is not None:
+                self.after(error)
+
+
+class PacedVoiceClient(fakes.FakeVoiceClient):
+    _ids = itertools.count(1)
+
+    def __init__(self, loop=None):
+        super().__init__(loop)
+        self.recorder_id = next(self._ids)
+        self.recorder = FrameRecorder()
+        self._playback = None
+        self.thread = None  # 最近一次播放的執行緒，結束測試時等待它呼叫完 after
+
+    def is_playing(self) -> bool:
+        playback = self._playback
+        return playback is not None and not playback.ended.is_set() and playback.resumed.is_set()
+
+    def is_paused(self) -> bool:
+        playback = self._playback
+        return playback is not None and not playback.ended.is_set() and not playback.resumed.is_set()
+
+    def play(self, source, *, after=None, **kwargs):
+        if self.is_playing() or self.is_paused():
+            raise RuntimeError('Already playing audio.')
+        self.source = source
+        self.played += 1
+        self._playback = self.thread = _Playback(self, source, after)
+        self._playback.start()
+        self.started.set()
+
+    def stop(self):
+        playback, self._playback = self._playback, None
+        if playback is not None:
+            playback.ended.set()
+            playback.resumed.set()
+
+    finish = stop
+
+    def pause(self):
+        if self.is_playing():
+            self._playback.resumed.clear()
+
+    def resume(self):
+        if self.is_paused():
+            self._playback.resumed.set()
+
+    async def disconnect(self, *, force=False):
+        self._connected = False
+        self.stop()
+
+
+# --- 指令序列 ---
+
+class Event:
+    __slots__ = ('at', 'guild', 'action', 'arg')
+
+    def __init__(self, at, guild, action, arg=None):
+        self.at = at
+        self.guild = guild
+        self.action = action
+        self.arg = arg
+
+    def to_dict(self) -> dict:
+        return {'at': round(self.at, 3), 'guild': self.guild, 'action': self.action, 'arg': self.arg}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if data['action'] not in ACTIONS:
+            raise ValueError(f"未知的指令: {data['action']}")
+        return cls(float(data['at']), int(data['guild']), data['action'], data.get('arg'))
+
+
+def load_trace(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        events = [Event.from_dict(json.loads(line)) for line in f if line.strip()]
+    events.sort(key=lambda e: e.at)
+    return events
+
+
+def save_trace(path: str, events: list):
+    with open(path, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event.to_dict(), ensure_ascii=False) + '\n')
+
+
+# 產生逐步增加伺服器數量的指令序列：
+# 每個伺服器一加入就先 /play 兩首，之後以指數分布的間隔（平均 think_time 秒）隨機送出指令；
+# 影片依 Zipf 分布挑選，熱門歌曲會同時出現在多個伺服器（測試快取與合併解析）
+def synthetic_trace(steps: list, step_seconds: float, think_time: float, keyword_ratio: float,
+                    catalog: int, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(catalog)]
+    videos = [fakes.fake_video_id(20_000_000 + n) for n in range(catalog)]
+    mix = [('play', 0.40), ('skip', 0.15), ('queue', 0.15), ('button', 0.30)]
+    duration = step_seconds * len(steps)
+
+    def play_arg():
+        if rng.random() < keyword_ratio:
+            return f'load test song {rng.randrange(catalog)}'
+        return f'https://www.youtube.com/watch?v={rng.choices(videos, weights)[0]}'
+
+    events = []
+    guild = 0
+    for index, count in enumerate(steps):
+        step_start = index * step_seconds
+        while guild < count:
+            at = step_start + rng.uniform(0, min(step_seconds, 2.0))
+            events.append(Event(at, guild, 'play', play_arg()))
+            events.append(Event(at + 0.5, guild, 'play', play_arg()))
+            at += rng.expovariate(1 / think_time)
+            while at < duration:
+                action = rng.choices([name for name, _ in mix], [w for _, w in mix])[0]
+                arg = play_arg() if action == 'play' else rng.choice(list(BUTTONS)) if action == 'button' else None
+                events.append(Event(at, guild, action, arg))
+                at += rng.expovariate(1 / think_time)
+            guild += 1
+    events.sort(key=lambda e: e.at)
+    return events
+
+
+# --- 執行 ---
+
+class Window:
+    def __init__(self, index: int, started: float):
+        self.index = index
+        self.started = started
+        self.lag = []
+        self.latency = {}     # 指令 -> [秒]
+        self.errors = {}      # 指令 -> 次數
+        self.cpu_started = time.process_time()
+
+    def record(self, command: str, seconds: float, ok: bool = True):
+        self.latency.setdefault(command, []).append(seconds)
+        if not ok:
+            self.errors[command] = self.errors.get(command, 0) + 1
+
+
+class LoadTest:
+    def __init__(self, events: list, args):
+        self.events = events
+        self.args = args
+        self.contexts = {}    # guild 編號 -> FakeContext
+        self.window = None
+        self.tasks = set()
+        self.reports = []
+
+    def context(self, guild: int):
+        ctx = self.contexts.get(guild)
+        if ctx is None:
+            voice_client = PacedVoiceClient(asyncio.get_running_loop())
+            ctx = RecordingContext(voice_client=voice_client, send_latency=self.args.http_latency)
+            self.contexts[guild] = ctx
+        return ctx
+
+    async def monitor_loop(self):
+        interval = 0.05
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.window.lag.append(max(0.0, time.perf_counter() - started - interval))
+
+    async def run_event(self, event: Event, scheduled: float):
+        ctx = self.context(event.guild)
+        command = event.action if event.action != 'button' else f'button:{event.arg}'
+        ok = True
+        try:
+            if event.action == 'play':
+                await bot.play.callback(ctx, search=event.arg)
+            elif event.action == 'skip':
+                await bot.skip.callback(ctx)
+            elif event.action == 'queue':
+                await bot.queue_.callback(ctx)
+            else:
+                player = bot.players.get(ctx.guild.id)
+                if player is not None:
+                    button = getattr(player.control_view, BUTTONS[event.arg])
+                    await button.callback(fakes.FakeInteraction(ctx, self.args.http_latency))
+        except Exception as e:
+            ok = False
+            if self.args.verbose:
+                print(f'  {command} 失敗（伺服器 {event.guild}）: {e!r}', file=sys.stderr)
+        self.window.record(command, time.perf_counter() - scheduled, ok)
+
+        # 關鍵字搜尋會顯示選單：模擬使用者稍後選取第一個結果
+        if event.action == 'play' and ok and ctx.select_views:
+            view = ctx.select_views.pop(0)
+            await asyncio.sleep(self.args.select_delay)
+            select = view.children[0]
+            select._values = ['0']
+            started = time.perf_counter()
+            try:
+                await select.callback(fakes.FakeInteraction(ctx, self.args.http_latency))
+                self.window.record('select', time.perf_counter() - started)
+            except Exception:
+                self.window.record('select', time.perf_counter() - started, ok=False)
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def close_window(self, now: float):
+        window = self.window
+        elapsed = now - window.started
+        jitters = {}
+        late = frames = 0
+        for guild, ctx in self.contexts.items():
+            intervals = ctx.voice_client.recorder.take()
+            if not intervals:
+                continue
+            deviations = [abs(interval - FRAME_SECONDS) for interval in intervals]
+            jitters[guild] = percentile(deviations, 0.99)
+            late += sum(1 for interval in intervals if interval - FRAME_SECONDS > self.args.late_ms / 1000)
+            frames += len(intervals)
+        ffmpeg = bot.ffmpeg_supervisor.stats()
+        report = {
+            'step': window.index,
+            'guilds': len(self.contexts),
+            'playing': sum(1 for ctx in self.contexts.values() if ctx.voice_client.is_playing()),
+            'commands': sum(len(samples) for samples in window.latency.values()),
+            'errors': sum(window.errors.values()),
+            'cpu': (time.process_time() - window.cpu_started) / elapsed if elapsed else 0.0,
+            'lag_p50': percentile(window.lag, 0.50),
+            'lag_p99': percentile(window.lag, 0.99),
+            'lag_max': max(window.lag, default=None),
+            'command_p50': {name: percentile(samples, 0.50) for name, samples in window.latency.items()},
+            'command_p99': {name: percentile(samples, 0.99) for name, samples in window.latency.items()},
+            'jitter_median_guild': statistics.median(jitters.values()) if jitters else None,
+            'jitter_worst_guild': max(jitters.items(), key=lambda item: item[1]) if jitters else None,
+            'jitter_per_guild': jitters,
+            'late_ratio': late / frames if frames else 0.0,
+            'ffmpeg_waiting': ffmpeg['waiting'],
+            'ffmpeg_timeouts': ffmpeg['timeouts'],
+            'ffmpeg_in_use': ffmpeg['in_use'],
+        }
+        self.reports.append(report)
+        self.print_report(report)
+        self.window = Window(window.index + 1, now)
+
+    def print_report(self, r: dict):
+        p99 = r['command_p99']
+        worst = r['jitter_worst_guild']
+        print(
+            f"{r['step']:>4}{r['guilds']:>8}{r['playing']:>8}{r['commands']:>9}{r['errors']:>7}{r['cpu']:>7.0%}"
+            f"{format_ms(r['lag_p99']):>9}{format_ms(r['lag_max']):>9}"
+            f"{format_ms(p99.get('play')):>9}{format_ms(p99.get('select')):>9}{format_ms(p99.get('skip')):>9}"
+            f"{format_ms(p99.get('queue')):>9}"
+            f"{format_ms(max((v for k, v in p99.items() if k.startswith('button:')), default=None)):>9}"
+            f"{format_ms(r['jitter_median_guild']):>9}"
+            f"{format_ms(worst[1] if worst else None):>9}{r['late_ratio']:>8.2%}"
+            f"{r['ffmpeg_in_use']:>6}/{r['ffmpeg_waiting']:<4}",
+            flush=True
+        )
+        if self.args.per_guild and r['jitter_per_guild']:
+            for guild, jitter in sorted(r['jitter_per_guild'].items()):
+                print(f'        伺服器 {guild:>4}: 音框抖動 p99 {jitter * 1000:.1f} ms')
+
+    # 依排定時間送出指令，不等待前一個指令完成
+    async def dispatch(self, started: float):
+        for event in self.events:
+            scheduled = started + event.at
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.spawn(self.run_event(event, scheduled))
+
+    async def run(self, steps: int):
+        step_seconds = self.args.step_seconds
+        print(
+            f"{'step':>4}{'guilds':>8}{'playing':>8}{'cmds':>9}{'errs':>7}{'cpu':>7}"
+            f"{'lag99':>9}{'lagmax':>9}{'play99':>9}{'sel99':>9}{'skip99':>9}{'queue99':>9}{'btn99':>9}"
+            f"{'jit50g':>9}{'jitmax':>9}{'late':>8}{'ffmpeg':>11}"
+        )
+        print('（時間單位為毫秒；jit50g 為中位數伺服器的音框抖動 p99，jitmax 為最差伺服器；ffmpeg 為使用中/等待中的名額）')
+        started = time.perf_counter()
+        self.window = Window(0, started)
+        monitor = asyncio.create_task(self.monitor_loop())
+        dispatcher = asyncio.create_task(self.dispatch(started))
+        try:
+            for index in range(steps):
+                delay = started + step_seconds * (index + 1) - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.close_window(time.perf_counter())
+        finally:
+            monitor.cancel()
+            dispatcher.cancel()
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await fakes.reset_bot_state()
+            threads = [ctx.voice_client.thread for ctx in self.contexts.values() if ctx.voice_client.thread]
+            for ctx in self.contexts.values():
+                ctx.voice_client.stop()
+            # 語音執行緒結束時會透過事件迴圈呼叫 after，須在事件迴圈關閉前等它們結束
+            await asyncio.to_thread(lambda: [thread.join() for thread in threads])
+            await asyncio.sleep(0)
+        self.summarize()
+
+    def summarize(self):
+        for report in self.reports:
+            reasons = []
+            slowest = max(
+                ((name, v) for name, v in report['command_p99'].items() if v is not None),
+                key=lambda item: item[1], default=None
+            )
+            if slowest and slowest[1] > self.args.max_command_p99:
+                reasons.append(f"{slowest[0]} p99 {slowest[1] * 1000:.0f} ms")
+            worst = report['jitter_worst_guild']
+            if worst and worst[1] > self.args.max_jitter_p99 / 1000:
+                reasons.append(f"伺服器 {worst[0]} 音框抖動 p99 {worst[1] * 1000:.1f} ms")
+            if reasons:
+                break
+        else:
+            print(f"全部階段都在門檻內（指令 p99 ≤ {self.args.max_command_p99:g} 秒，音框抖動 p99 ≤ {self.args.max_jitter_p99:g} ms）")
+            return
+        previous = [r for r in self.reports if r['step'] < report['step']]
+        summary = f"第 {report['step']} 階段（{report['guilds']} 個伺服器）開始超過門檻：{'、'.join(reasons)}"
+        if previous:
+            summary += f"；可承受約 {previous[-1]['guilds']} 個伺服器"
+        print(summary)
+
+
+# 保留 /play 送出的搜尋結果選單，之後模擬使用者選取
+class RecordingContext(fakes.FakeContext):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.select_views = []
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        if isinstance(view, bot.SongSelectView):
+            self.select_views.append(view)
+        return await super().send(content, embed=embed, view=view, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端負載測試（離線）')
+    parser.add_argument('--guilds', default='10,50,100,200', help='每個階段的伺服器數量（逗號分隔，遞增）')
+    parser.add_argument('--step-seconds', type=float, default=30, help='每個階段的秒數')
+    parser.add_argument('--trace', default=None, help='重播指定的指令序列（JSON Lines），不產生合成序列')
+    parser.add_argument('--save-trace', default=None, help='將合成的指令序列另存到檔案')
+    parser.add_argument('--think-time', type=float, default=10, help='每個伺服器兩次指令之間的平均秒數')
+    parser.add_argument('--keyword-ratio', type=float, default=0.3, help='/play 使用關鍵字（而非網址）的比例')
+    parser.add_argument('--catalog', type=int, default=2000, help='合成序列中不同影片的數量')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--select-delay', type=float, default=1.0, help='關鍵字搜尋後幾秒選取第一個結果')
+    parser.add_argument('--track-seconds', type=float, default=30, help='每首歌的長度')
+    parser.add_argument('--extract-latency', type=float, default=0.3, help='假 yt-dlp 每次解析的平均秒數')
+    parser.add_argument('--http-latency', type=float, default=0.05, help='假 Discord API 每個請求的秒數')
+    parser.add_argument('--late-ms', type=float, default=5, help='音框間隔超過 20ms 多少毫秒算遲到')
+    parser.add_argument('--max-command-p99', type=float, default=2.0, help='指令 p99（秒）的劣化門檻')
+    parser.add_argument('--max-jitter-p99', type=float, default=20, help='最差伺服器音框抖動 p99（毫秒）的劣化門檻')
+    parser.add_argument('--per-guild', action='store_true', help='列出每個伺服器的音框抖動')
+    parser.add_argument('--verbose', action='store_true', help='顯示失敗的指令')
+    args = parser.parse_args()
+
+    if args.trace:
+        events = load_trace(args.trace)
+        steps = max(1, math.ceil((events[-1].at if events else 0.0) / args.step_seconds))
+    else:
+        steps = [int(n) for n in args.guilds.split(',')]
+        if steps != sorted(steps):
+            raise SystemExit('--guilds 必須遞增')
+        events = synthetic_trace(steps, args.step_seconds, args.think_time, args.keyword_ratio,
+                                 args.catalog, args.seed)
+        if args.save_trace:
+            save_trace(args.save_trace, events)
+            print(f"已寫入指令序列：{args.save_trace}（{len(events)} 個指令）")
+        steps = len(steps)
+
+    SlowYoutubeDL.latency = args.extract_latency
+    yt_dlp.YoutubeDL = SlowYoutubeDL
+    TimedAudioSource.track_seconds = args.track_seconds
+    bot.MusicPlayer.create_source = timed_create_source
+
+    asyncio.run(LoadTest(events, args).run(steps))
+
+
+if __name__ == '__main__':
+    main()
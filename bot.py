@@ -1,38 +1,56 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import yt_dlp
 import asyncio
+import hashlib
+import json
 import os
+import sys
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
 import re
-from datetime import datetime, timedelta
-
-# 設置日誌
-current_time = datetime.now().strftime('%Y_%m_%d_%H_%M')
-log_folder = r'C:\Users\jtjty\Desktop\mod\DC BOT\MC BOT\log'
-os.makedirs(log_folder, exist_ok=True)
-log_file = os.path.join(log_folder, f'{current_time}.log')
+import time
+from urllib.parse import parse_qs, urlparse
+from datetime import datetime, timedelta, timezone
+from discord.ext import tasks
+from extractor import ExtractionPool, ExtractionTimeout, SingleFlight, extract_info
+from cache import MetadataCache, canonical_url, normalize_query, stream_expiry, video_id
+from audio_cache import AudioCache
+from playlist import Playlist
+from log_setup import parse_mapping, setup_logging
+import metrics
+from cluster import IPCClient, format_shard_ids, parse_shard_ids
+from state_store import PlayerStateStore
+from title_index import TitleIndex
+from ffmpeg_supervisor import PRIORITY_PLAY, PRIORITY_PREFETCH, FFmpegBusy, FFmpegSupervisor
+from loudness import LoudnessCache
+
+# 加載環境變數（日誌設定也來自 api.env，需先載入）
+load_dotenv(dotenv_path='api.env')
 
+# yt-dlp 解析工作池設定
+# process 模式會在建構時 fork 出子行程，必須在設定日誌（啟動日誌執行緒）與其他背景執行緒之前建立
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '4'))
+EXTRACT_MODE = os.getenv('EXTRACT_MODE', 'thread')  # thread 或 process
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', '30'))
+extraction_pool = ExtractionPool(EXTRACT_WORKERS, EXTRACT_MODE, EXTRACT_TIMEOUT)
+
+# 設置日誌：紀錄先放進佇列，由背景執行緒寫入檔案（依大小或時間輪替）與主控台
+log_listener = setup_logging(
+    directory=os.getenv('LOG_DIR', 'log'),
+    filename=os.getenv('LOG_FILE', 'bot.log'),
+    file_level=os.getenv('LOG_FILE_LEVEL', 'INFO'),
+    console_level=os.getenv('LOG_CONSOLE_LEVEL', 'INFO'),
+    rotate=os.getenv('LOG_ROTATE', 'size'),  # size 或 time
+    max_bytes=int(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024,
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+    when=os.getenv('LOG_ROTATE_WHEN', 'midnight'),
+    levels=parse_mapping(os.getenv('LOG_LEVELS', '')),
+    rate_limits=parse_mapping(os.getenv('LOG_RATE_LIMITS', 'discord.gateway=20,discord.voice_state=20')),
+)
 logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-
-debug_handler = logging.FileHandler(log_file, encoding='utf-8')
-debug_handler.setLevel(logging.DEBUG)
-debug_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
-debug_handler.setFormatter(debug_formatter)
-logger.addHandler(debug_handler)
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s')
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
-
-# 加載環境變數
-load_dotenv(dotenv_path='api.env')
 TOKEN = os.getenv('DISCORD_TOKEN')
 
 # 檢查必要的環境變數
@@ -45,24 +63,222 @@ intents.message_content = True
 intents.voice_states = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix='/', intents=intents, help_command=None)
-
-# 定義一個簡單的歌曲資料結構
+# 分片設定：SHARD_COUNT 留空為單一連線；auto 依 Discord 建議；數字為總分片數
+# 由 launcher.py 啟動時會另外指定本行程負責的 SHARD_IDS 與 CLUSTER_ID
+SHARD_COUNT = os.getenv('SHARD_COUNT', '').strip()
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS', ''))
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+IPC_ADDRESS = os.getenv('IPC_ADDRESS', '')
+IPC_SECRET = os.getenv('IPC_SECRET', '')
+ipc_client = None
+started_at = time.time()
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        help_command=None,
+        shard_count=None if SHARD_COUNT == 'auto' else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS or None
+    )
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents, help_command=None)
+
+INTERACTION_TTL = timedelta(minutes=15)  # 互動 token 的有效時間
+
+extraction_calls = SingleFlight()  # 進行中的解析，相同請求共用同一個結果
+
+# 搜尋結果快取設定
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join('data', 'metadata_cache.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2048'))
+CACHE_METADATA_TTL = float(os.getenv('CACHE_METADATA_TTL', '86400'))
+CACHE_STREAM_TTL = float(os.getenv('CACHE_STREAM_TTL', '14400'))
+
+metadata_cache = MetadataCache(CACHE_PATH or None, CACHE_MAX_ENTRIES, CACHE_METADATA_TTL, CACHE_STREAM_TTL)
+
+# /play 自動完成的標題索引：播放紀錄存到 TITLE_INDEX_PATH，搜尋快取中的歌曲啟動時加入
+TITLE_INDEX_PATH = os.getenv('TITLE_INDEX_PATH', os.path.join('data', 'title_index.sqlite3'))
+TITLE_INDEX_MAX_ENTRIES = int(os.getenv('TITLE_INDEX_MAX_ENTRIES', '10000'))
+
+title_index = TitleIndex(TITLE_INDEX_PATH or None, TITLE_INDEX_MAX_ENTRIES)
+for data in metadata_cache.songs():
+    title_index.add(canonical_url(data['webpage_url']), data['title'])
+
+# 串流網址解析設定
+STREAM_REFRESH_MARGIN = float(os.getenv('STREAM_REFRESH_MARGIN', '600'))  # 距離到期不足此秒數即重新解析
+RESOLVE_RETRIES = int(os.getenv('RESOLVE_RETRIES', '3'))
+EARLY_END_MARGIN = float(os.getenv('EARLY_END_MARGIN', '5'))  # 比歌曲長度提早超過此秒數結束才視為串流失效
+
+# 播放清單載入設定
+PLAYLIST_FIRST_BATCH = int(os.getenv('PLAYLIST_FIRST_BATCH', '5'))  # 第一批少量載入，讓第一首盡快開始播放
+PLAYLIST_BATCH_SIZE = int(os.getenv('PLAYLIST_BATCH_SIZE', '50'))
+PLAYLIST_MAX_ITEMS = int(os.getenv('PLAYLIST_MAX_ITEMS', '500'))
+PLAYLIST_PROGRESS_INTERVAL = 3.0  # 進度訊息最短更新間隔（秒）
+
+# /playmany 一次加入多首歌曲的設定
+PLAYMANY_MAX_ITEMS = int(os.getenv('PLAYMANY_MAX_ITEMS', '50'))
+PLAYMANY_CONCURRENCY = int(os.getenv('PLAYMANY_CONCURRENCY', '4'))  # 同時解析的數量
+PLAYMANY_MAX_FILE_BYTES = 64 * 1024  # 附件大小上限
+
+# 預先載入下一首歌曲的設定
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') != '0'
+PREWARM_MAX_AGE = float(os.getenv('PREWARM_MAX_AGE', '300'))  # 預先開啟的音源超過此秒數就重新開啟
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+# 播放模式：opus 直接輸出 Opus（來源為 Opus 時不重新編碼），pcm 為舊的 PCM 解碼路徑
+PLAYBACK_MODE = os.getenv('PLAYBACK_MODE', 'opus')
+OPUS_BITRATE = int(os.getenv('OPUS_BITRATE', '128'))  # 需要轉碼時的位元率（kbps）
+
+# FFmpeg 行程管理：全域同時執行的解碼行程上限（0 表示不限制），名額用完時等待的最長秒數
+FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', '64'))
+FFMPEG_ACQUIRE_TIMEOUT = float(os.getenv('FFMPEG_ACQUIRE_TIMEOUT', '30'))
+FFMPEG_SAMPLE_INTERVAL = float(os.getenv('FFMPEG_SAMPLE_INTERVAL', '15'))  # 取樣 CPU/記憶體並清除孤兒行程的間隔
+FFMPEG_BUSY_BACKOFF = float(os.getenv('FFMPEG_BUSY_BACKOFF', '5'))  # 名額已滿時重試前等待的秒數（每次加倍，最多 60 秒）
+
+ffmpeg_supervisor = FFmpegSupervisor(FFMPEG_MAX_PROCESSES, FFMPEG_ACQUIRE_TIMEOUT)
+
+# 響度標準化（預設關閉）：第一次播放時在背景測量整首歌的響度，之後播放以固定增益調整音量；
+# 需要調整的歌曲必須重新編碼，無法直接複製 Opus 封包
+LOUDNESS_ENABLED = os.getenv('LOUDNESS_ENABLED', '0') == '1'
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', '-16'))  # 目標整合響度（LUFS）
+LOUDNESS_MAX_GAIN = float(os.getenv('LOUDNESS_MAX_GAIN', '12'))  # 最多增加或減少的音量（dB）
+LOUDNESS_CONCURRENCY = int(os.getenv('LOUDNESS_CONCURRENCY', '1'))  # 同時測量的歌曲數
+LOUDNESS_PATH = os.getenv('LOUDNESS_PATH', os.path.join('data', 'loudness.sqlite3'))
+
+loudness_cache = LoudnessCache(
+    LOUDNESS_PATH or None, LOUDNESS_TARGET, LOUDNESS_MAX_GAIN, concurrency=LOUDNESS_CONCURRENCY
+) if LOUDNESS_ENABLED else None
+
+# 本機音訊快取（預設關閉，設定 AUDIO_CACHE_DIR 後啟用）
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', '')
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_MB', '2048')) * 1024 * 1024
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', '2'))  # 播放幾次後才下載
+AUDIO_CACHE_MAX_DURATION = float(os.getenv('AUDIO_CACHE_MAX_DURATION', '1800'))  # 超過此長度（秒）的影片不下載
+
+audio_cache = AudioCache(
+    AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MIN_PLAYS, AUDIO_CACHE_MAX_DURATION
+) if AUDIO_CACHE_DIR else None
+
+# 閒置回收設定
+IDLE_TIMEOUT = float(os.getenv('IDLE_TIMEOUT', '300'))  # 沒有播放且隊列為空超過此秒數就離開
+EMPTY_CHANNEL_TIMEOUT = float(os.getenv('EMPTY_CHANNEL_TIMEOUT', '60'))  # 語音頻道沒有其他人超過此秒數就離開
+REAPER_INTERVAL = float(os.getenv('REAPER_INTERVAL', '30'))
+DISCONNECT_GRACE = float(os.getenv('DISCONNECT_GRACE', '60'))  # 語音連線中斷（例如重新連線中）超過此秒數才回收
+
+CONTROL_EDIT_INTERVAL = float(os.getenv('CONTROL_EDIT_INTERVAL', '1.5'))  # 控制訊息最短編輯間隔（秒）
+
+QUEUE_PAGE_SIZE = int(os.getenv('QUEUE_PAGE_SIZE', '10'))  # 播放清單每頁顯示的歌曲數
+QUEUE_TITLE_LIMIT = 80  # 標題過長時截斷，確保整頁不超過嵌入描述的字數上限
+
+# 斜線指令同步設定
+COMMAND_SYNC_STATE = os.getenv('COMMAND_SYNC_STATE', os.path.join('data', 'command_sync.json'))
+# 開發用：設定伺服器 ID（逗號分隔）後只同步到這些伺服器（立即生效），不做全域同步
+COMMAND_SYNC_GUILDS = [int(g) for g in os.getenv('COMMAND_SYNC_GUILDS', '').split(',') if g.strip()]
+
+# 播放器狀態持久化設定（STATE_PATH 留空則不保存，重新啟動後不會恢復播放）
+STATE_PATH = os.getenv('STATE_PATH', os.path.join('data', 'player_state.sqlite3'))
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '5'))
+RESTORE_CONCURRENCY = int(os.getenv('RESTORE_CONCURRENCY', '2'))  # 同時恢復的伺服器數量
+RESTORE_INTERVAL = float(os.getenv('RESTORE_INTERVAL', '1'))  # 每個伺服器恢復後的間隔（秒）
+
+state_store = PlayerStateStore(STATE_PATH) if STATE_PATH else None
+restore_task = None
+
+# 指標端點設定（METRICS_PORT 為 0 時不啟動 HTTP 端點，/stats 仍可使用）
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+metrics_server = None
+
+COMMAND_LATENCY = metrics.histogram('bot_command_seconds', '指令從呼叫到完成的時間', ('command', 'status'))
+EXTRACTION_LATENCY = metrics.histogram('bot_extraction_seconds', 'yt-dlp 解析時間（含排隊）', ('kind', 'status'))
+EXTRACTIONS_COALESCED = metrics.counter('bot_extractions_coalesced_total', '與進行中的相同解析合併（省下的 yt-dlp 呼叫）次數', ('kind',))
+SOURCE_OPEN_LATENCY = metrics.histogram('bot_source_open_seconds', '建立音源（含啟動 FFmpeg）的時間', ('origin',))
+FIRST_FRAME_LATENCY = metrics.histogram('bot_first_frame_seconds', '開始播放到 FFmpeg 產出第一個音框的時間')
+TRACK_GAP = metrics.histogram('bot_track_gap_seconds', '上一首結束到下一首開始的間隔')
+PLAYBACK_ERRORS = metrics.counter('bot_playback_errors_total', '播放相關錯誤次數', ('stage',))
+CONTROL_UPDATES = metrics.counter('bot_control_message_updates_total', '控制訊息更新結果', ('result',))
+CONTROL_EDIT_LATENCY = metrics.histogram('bot_control_message_edit_seconds', '編輯或發送控制訊息的 API 延遲')
+AUTOCOMPLETE_LATENCY = metrics.histogram('bot_autocomplete_seconds', '/play 自動完成查詢標題索引的時間')
+
+DEFAULT_THUMBNAIL = 'https://i.imgur.com/your-default-image.png'
+# 精簡模式：YouTube 縮圖不另外儲存，需要時由影片 ID 推導
+COMPACT_SONGS = os.getenv('COMPACT_SONGS', '0') == '1'
+
+# 定義一個簡單的歌曲資料結構（使用 __slots__，大量排隊時節省記憶體）
 class Song:
-    def __init__(self, source_url: str, webpage_url: str, title: str, thumbnail: str):
-        self.source_url = source_url      # 用於播放的音頻流URL
-        self.webpage_url = webpage_url    # YouTube影片連結
-        self.title = title
+    __slots__ = ('webpage_url', 'title', '_thumbnail', 'source_url', 'codec', 'stream_expires', 'duration')
+
+    def __init__(self, source_url: str, webpage_url: str, title: str, thumbnail: str, codec: str = None,
+                 duration: int = None):
+        # 同一首歌常同時出現在多個伺服器的隊列中，駐留字串讓它們共用同一份
+        self.webpage_url = sys.intern(webpage_url)  # YouTube影片連結
+        self.title = sys.intern(title or '未知標題')
         self.thumbnail = thumbnail        # 封面圖屬性
-        
+        self.duration = duration          # 長度（秒），未知時為 None
+        self.set_stream(source_url, codec)  # 用於播放的音頻流URL，可為 None，播放前才解析
+
     def __repr__(self):
         return f"Song(title={self.title}, source_url={self.source_url}, webpage_url={self.webpage_url})"
 
+    def set_stream(self, source_url: str, codec: str = None):
+        self.source_url = source_url
+        self.codec = codec                # 串流的音訊編碼（例如 opus），未知時為 None
+        if source_url:
+            self.stream_expires = stream_expiry(source_url) or time.time() + CACHE_STREAM_TTL
+        else:
+            self.stream_expires = None
+
+    # 串流網址不存在或即將過期
+    def needs_stream(self, margin: float = 0) -> bool:
+        return not self.source_url or self.stream_expires - margin <= time.time()
+
+    @property
+    def video_id(self):
+        return video_id(self.webpage_url)
+
+    # 預設圖片與（精簡模式下）可推導的 YouTube 縮圖都不儲存
+    @property
+    def thumbnail(self) -> str:
+        if self._thumbnail is not None:
+            return self._thumbnail
+        if COMPACT_SONGS:
+            vid = self.video_id
+            if vid:
+                return f'https://i.ytimg.com/vi/{vid}/hqdefault.jpg'
+        return DEFAULT_THUMBNAIL
+
+    @thumbnail.setter
+    def thumbnail(self, value: str):
+        if not value or value == DEFAULT_THUMBNAIL or (COMPACT_SONGS and 'i.ytimg.com/vi' in value):
+            value = None
+        self._thumbnail = value
+
+    # 放入隊列時只保留識別資訊，串流網址留到播放前再解析
+    def lightweight(self):
+        if self.source_url is None:
+            return self
+        return Song(None, self.webpage_url, self.title, self._thumbnail, duration=self.duration)
+
+    def to_dict(self) -> dict:
+        return {
+            'source_url': self.source_url,
+            'webpage_url': self.webpage_url,
+            'title': self.title,
+            'thumbnail': self._thumbnail,
+            'codec': self.codec,
+            'duration': self.duration,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data['source_url'], data['webpage_url'], data['title'], data['thumbnail'], data.get('codec'),
+                   data.get('duration'))
+
 # 音樂播放隊列
 class MusicPlayer:
     def __init__(self, ctx, loop):
         self.ctx = ctx
-        self.queue = asyncio.Queue()
+        self.queue = Playlist()
         self.next = asyncio.Event()
         self.current = None
         self.loop_flag = False
@@ -70,85 +286,305 @@ class MusicPlayer:
         self.voice_client = ctx.voice_client
         self.loop = loop
         self.control_view = MusicControls(self.ctx, self)  # 儲存控制視圖
-        self.control_message = None  # 儲存控制訊息
+        self.renderer = NowPlayingRenderer(self)  # 負責控制訊息的建立與更新
+        self.queue_pages = QueuePages(self.queue)  # 播放清單分頁顯示的快取
+        self.skipped = False  # 本首歌是否被手動跳過/停止
+        self.play_error = None  # 本首歌播放結束時 after 回報的錯誤
+        self.stopped = False  # 是否已停止播放並清空隊列
+        self.prefetch_task = None
+        self.prefetch_song = None
+        self.prewarmed = None  # (song, source, 開啟時間)
+        self.last_gap = None
+        self.ingest_tasks = set()  # 背景載入中的播放清單與選取的搜尋結果
+        self.idle_since = time.monotonic()  # 開始閒置的時間，播放中為 None
+        self.empty_since = None  # 語音頻道只剩機器人的開始時間
+        self.disconnected_since = None  # 語音連線中斷的開始時間
+        self.destroyed = False
         self.task = asyncio.create_task(self.player_loop())
 
+    # 開啟歌曲的音源：本機快取有檔案就直接讀檔，否則解析串流網址
+    # FFmpeg 行程由 ffmpeg_supervisor 統一分配名額，預先載入的音源在名額不足時會被收回
+    async def open_source(self, song: Song, priority: int = PRIORITY_PLAY):
+        cached = audio_cache.lookup(song.video_id) if audio_cache else None
+        if cached is not None:
+            origin, url, codec, before_options = 'cache', cached.path, cached.codec, None
+        else:
+            await resolve_stream(song, self.ctx.guild.id)
+            origin, url, codec, before_options = 'stream', song.source_url, song.codec, FFMPEG_BEFORE_OPTIONS
+        gain = loudness_cache.gain(song.video_id) if loudness_cache else None
+
+        async def spawn():
+            with SOURCE_OPEN_LATENCY.time(origin=origin):
+                return await self.create_source(url, codec, before_options, gain)
+
+        preempt = self.release_prewarmed if priority == PRIORITY_PREFETCH else None
+        return await ffmpeg_supervisor.open(self.ctx.guild.id, priority, spawn, preempt)
+
+    # 建立播放用的音源；gain 為響度標準化的增益（dB），以 volume 濾鏡套用
+    async def create_source(self, url: str, codec: str, before_options: str, gain: float = None):
+        options = f'-af volume={gain}dB' if gain is not None else None
+        if PLAYBACK_MODE == 'opus':
+            if gain is not None:
+                # 套用濾鏡必須重新編碼
+                return discord.FFmpegOpusAudio(
+                    url,
+                    bitrate=OPUS_BITRATE,
+                    before_options=before_options,
+                    options=options
+                )
+            if codec is None:
+                # 不知道來源編碼時用 ffprobe 探測，是 Opus 就直接複製封包
+                return await discord.FFmpegOpusAudio.from_probe(
+                    url,
+                    before_options=before_options
+                )
+            # 來源已是 Opus（YouTube 的 WebM 音訊）時直接複製封包，否則才轉碼
+            return discord.FFmpegOpusAudio(
+                url,
+                codec='copy' if codec == 'opus' else None,
+                bitrate=OPUS_BITRATE,
+                before_options=before_options
+            )
+        return discord.FFmpegPCMAudio(
+            url,
+            before_options=before_options,
+            options=options
+        )
+
+    def peek_next(self):
+        return self.queue.peek()
+
+    # 在目前歌曲播放時預先解析下一首並開啟 FFmpeg，使換曲幾乎沒有空檔
+    def schedule_prefetch(self):
+        if not PREFETCH_ENABLED or self.current is None:
+            return
+        song = self.peek_next()
+        if self.prewarmed and self.prewarmed[0] is not song:
+            # 隊列順序改變，預先開啟的音源已不是下一首
+            self.discard_prewarmed()
+        if song is None:
+            return
+        if self.prewarmed:
+            return
+        if self.prefetch_task and not self.prefetch_task.done():
+            if self.prefetch_song is song:
+                return
+            self.prefetch_task.cancel()
+        self.prefetch_song = song
+        self.prefetch_task = asyncio.create_task(self.prefetch(song))
+
+    async def prefetch(self, song: Song):
+        try:
+            source = await self.open_source(song, PRIORITY_PREFETCH)
+            if self.prefetch_song is not song:
+                source.cleanup()
+                return
+            self.discard_prewarmed()
+            self.prewarmed = (song, source, time.monotonic())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 預載失敗不影響播放，輪到該曲時會再解析一次
+            logger.warning(f"預先載入下一首歌曲失敗 {song.webpage_url}: {e}")
+
+    # 取得下一首歌曲的音源：優先使用預先開啟的音源
+    async def take_source(self, song: Song):
+        if self.prefetch_task and not self.prefetch_task.done():
+            if self.prefetch_song is song:
+                # 預載已在進行中，等它完成即可（不因預載被取消而中斷播放迴圈）
+                await asyncio.wait({self.prefetch_task})
+            else:
+                self.prefetch_task.cancel()
+        if self.prewarmed and self.prewarmed[0] is song:
+            _, source, opened_at = self.prewarmed
+            self.prewarmed = None
+            # 讀本機檔案時 source_url 為 None，不需檢查串流網址是否過期
+            if (not source.closed and time.monotonic() - opened_at <= PREWARM_MAX_AGE
+                    and (song.source_url is None or not song.needs_stream())):
+                ffmpeg_supervisor.promote(source)
+                return source
+            source.cleanup()
+        self.discard_prewarmed()
+        return await self.open_source(song)
+
+    # 搜尋結果只有扁平資料（不含串流網址），使用者選取後立即在背景解析；
+    # 若輪到播放時還沒完成，播放迴圈的解析會與這次合併，不會重複呼叫 yt-dlp
+    def resolve_selected(self, song: Song):
+        if not song.needs_stream(STREAM_REFRESH_MARGIN):
+            return
+        if audio_cache and audio_cache.path(song.video_id):
+            return
+        task = asyncio.create_task(self._resolve_selected(song))
+        self.ingest_tasks.add(task)
+        task.add_done_callback(self.ingest_tasks.discard)
+
+    async def _resolve_selected(self, song: Song):
+        try:
+            await resolve_stream(song, self.ctx.guild.id, kind='select')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 輪到該曲時會再解析一次
+            logger.warning(f"解析選取的歌曲失敗 {song.webpage_url}: {e}")
+
+    # 第一次播放的歌曲在背景測量響度（使用 FFmpeg 名額中優先順序最低的一個）
+    def schedule_loudness(self, song: Song):
+        if not loudness_cache.needs_measurement(song.video_id):
+            return
+        path = audio_cache.path(song.video_id) if audio_cache else None
+        if path:
+            loudness_cache.schedule(song.video_id, path, None, ffmpeg_supervisor.reserve)
+        else:
+            loudness_cache.schedule(song.video_id, song.source_url, FFMPEG_BEFORE_OPTIONS, ffmpeg_supervisor.reserve)
+
+    def discard_prewarmed(self):
+        if self.prewarmed:
+            self.prewarmed[1].cleanup()
+            self.prewarmed = None
+
+    # FFmpeg 名額不足時由 ffmpeg_supervisor 呼叫，收回預先開啟的音源
+    def release_prewarmed(self, source):
+        if self.prewarmed and self.prewarmed[1] is source:
+            self.prewarmed = None
+        source.cleanup()
+
+    # 這個 FFmpeg 行程是否仍是正在播放或預先開啟的音源
+    def owns_source(self, source) -> bool:
+        if self.prewarmed and self.prewarmed[1] is source:
+            return True
+        current = getattr(self.voice_client, 'source', None)
+        return getattr(current, 'original', current) is source
+
+    def cancel_prefetch(self):
+        if self.prefetch_task and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        self.prefetch_song = None
+        self.discard_prewarmed()
+
     async def player_loop(self):
+        retry_song = None
+        gap_start = None
+        busy_retries = 0
         while True:
             self.next.clear()
+            retrying = retry_song is not None
+            if retrying:
+                song, retry_song = retry_song, None
+            else:
+                try:
+                    # 从队列中获取下一首歌曲
+                    song = await self.queue.get()
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.error(f"從隊列中獲取歌曲時發生錯誤: {e}")
+                    continue
+
+            self.current = song
             try:
-                # 从队列中获取下一首歌曲
-                song = await self.queue.get()
+                source = await self.take_source(song)
             except asyncio.CancelledError:
                 break
+            except FFmpegBusy as e:
+                # 名額用完是容量不足而非音源失效：把歌曲放回隊列最前面，等待後再試
+                PLAYBACK_ERRORS.inc(stage='ffmpeg_busy')
+                self.current = None
+                self.queue.appendleft(song)
+                busy_retries += 1
+                delay = min(FFMPEG_BUSY_BACKOFF * 2 ** (busy_retries - 1), 60)
+                logger.warning(f"FFmpeg 名額已滿，{delay:g} 秒後重試 {song.webpage_url}（第 {busy_retries} 次）: {e}")
+                if busy_retries == 1:
+                    try:
+                        await self.ctx.send(f"⏳ 目前播放人數較多，**[{song.title}]({song.webpage_url})** 會在有空位時自動開始播放。")
+                    except Exception as send_error:
+                        logger.error(f"發送等待通知時出錯: {send_error}")
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    break
+                continue
             except Exception as e:
-                logger.error(f"從隊列中獲取歌曲時發生錯誤: {e}")
+                logger.error(f"無法取得串流網址，跳過歌曲 {song.webpage_url}: {e}")
+                PLAYBACK_ERRORS.inc(stage='source')
+                self.current = None
+                try:
+                    await self.ctx.send(f"⚠️ 無法取得 **[{song.title}]({song.webpage_url})** 的音訊，已跳過。")
+                except Exception as send_error:
+                    logger.error(f"發送跳過通知時出錯: {send_error}")
                 continue
-            
-            self.current = song
+            busy_retries = 0
+
             try:
-                if not hasattr(song, 'source_url') or not hasattr(song, 'webpage_url'):
-                    raise AttributeError("Song object is missing 'source_url' or 'webpage_url' attribute.")
-    
                 # 如果当前正在播放音频，先停止
                 if self.voice_client.is_playing():
                     self.voice_client.stop()
     
-                # 创建新的 FFmpegPCMAudio 对象播放音频
-                source = discord.FFmpegPCMAudio(
-                    song.source_url,
-                    before_options='-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-                )
-                self.voice_client.play(
-                    source,
-                    after=self.after_play
-                )
-    
-                # 获取当前时间并转换为 UTC+8
-                now_time = datetime.utcnow() + timedelta(hours=8)
-                formatted_time = now_time.strftime('%Y-%m-%d %H:%M:%S')
-    
-                # 准备嵌入消息
-                embed = discord.Embed(
-                    title="🎶 正在播放",
-                    description=f"[{song.title}]({song.webpage_url})",
-                    color=discord.Color.green(),
-                    timestamp=now_time
-                )
-                embed.set_thumbnail(url=song.thumbnail)
-                embed.add_field(
-                    name="循環狀態",
-                    value="🔁 循環已啟用" if self.loop_flag else "🔁 循環已停用",
-                    inline=False
-                )
-                embed.set_footer(
-                    text=f"請求者: {self.ctx.author.display_name} • {formatted_time}",
-                    icon_url=self.ctx.author.avatar.url if self.ctx.author.avatar else None
-                )
-    
-                # 更新控制訊息嵌入
-                if not self.control_message or not hasattr(self.control_message, "edit"):
-                    controls = MusicControls(self.ctx, self)
-                    self.control_message = await self.ctx.send(embed=embed, view=controls)
-                else:
-                    try:
-                        await self.control_message.edit(embed=embed, view=self.control_message.view)
-                    except Exception as e:
-                        logger.error(f"編輯控制訊息失敗，重新發送控制訊息：{e}")
-                        controls = MusicControls(self.ctx, self)
-                        self.control_message = await self.ctx.send(embed=embed, view=controls)
+                self.skipped = False
+                self.stopped = False
+                self.play_error = None
+                self.idle_since = None
+                started_at = time.monotonic()
+                source = FirstFrameTimer(source)
+                try:
+                    self.voice_client.play(
+                        source,
+                        after=self.after_play
+                    )
+                except Exception:
+                    source.cleanup()
+                    raise
+
+                # 記錄上一首結束到這一首開始的間隔
+                if gap_start is not None:
+                    self.last_gap = started_at - gap_start
+                    TRACK_GAP.observe(self.last_gap)
+                    logger.debug(f"換曲間隔: {self.last_gap * 1000:.1f} ms")
+                    gap_start = None
+                self.schedule_prefetch()
+                if audio_cache:
+                    audio_cache.record_play(song.video_id, song.webpage_url)
+                title_index.record_play(canonical_url(song.webpage_url), song.title, self.ctx.guild.id)
+                if loudness_cache:
+                    self.schedule_loudness(song)
     
+                # 更新控制訊息嵌入（由 renderer 合併短時間內的多次更新）
+                self.renderer.track_started()
+
             except Exception as e:
                 logger.error(f"播放歌曲時發生錯誤: {e}")
+                PLAYBACK_ERRORS.inc(stage='play')
                 self.current = None
                 continue
             
             # 等待歌曲播放完成或被跳过
             await self.next.wait()
+            ended_at = time.monotonic()
+
+            # 串流網址失效時 FFmpeg 會立刻結束；強制重新解析後重播一次。
+            # 已知長度時只有實際播放時間遠短於長度才重試（避免很短的歌曲被誤判），
+            # 播放回報錯誤時也重試；長度未知時沿用「兩秒內結束」的判斷
+            elapsed = ended_at - started_at
+            if song.duration:
+                ended_early = elapsed < 2.0 and song.duration - elapsed > EARLY_END_MARGIN
+            else:
+                ended_early = elapsed < 2.0
+            if not self.skipped and not retrying and (ended_early or self.play_error is not None):
+                logger.warning(f"歌曲過早結束，重新解析串流網址後重試: {song.webpage_url}")
+                song.set_stream(None)
+                metadata_cache.invalidate('url:' + canonical_url(song.webpage_url))
+                retry_song = song
+                continue
     
-            # 循环逻辑
-            if self.loop_flag or self.queue_loop:
-                await self.queue.put(song)
+            # 循环逻辑：單曲循環放回隊列最前面（手動跳過時除外），清單循環放回最後面
+            if self.stopped:
+                pass
+            elif self.loop_flag and not self.skipped:
+                self.queue.appendleft(song)
+            elif self.loop_flag or self.queue_loop:
+                self.queue.append(song)
+
+            # 只有下一首已在隊列中時才計算換曲間隔
+            gap_start = ended_at if not self.queue.empty() else None
     
             # 更新嵌入消息为播放清单状态
             if self.queue.empty():
@@ -165,35 +601,247 @@ class MusicPlayer:
     def after_play(self, error):
         if error:
             logger.error(f"播放出錯: {error}")
+            PLAYBACK_ERRORS.inc(stage='after_play')
+        self.play_error = error
         self.loop.call_soon_threadsafe(self.next.set)
         self.loop.call_soon_threadsafe(self.clear_current)
 
     def clear_current(self):
         self.current = None
+        self.idle_since = time.monotonic()
+
+    # 釋放播放器的所有資源：停止播放迴圈與背景工作、結束 FFmpeg、離開語音頻道
+    async def destroy(self, reason: str = None):
+        if self.destroyed:
+            return
+        self.destroyed = True
+        if players.get(self.ctx.guild.id) is self:
+            del players[self.ctx.guild.id]
+
+        self.task.cancel()
+        for task in list(self.ingest_tasks):
+            task.cancel()
+        self.cancel_prefetch()
+        self.queue.clear()
+        self.renderer.close()
+        if state_store and not bot.is_closed():
+            # 關閉機器人時保留狀態，下次啟動才能恢復
+            state_store.forget(self.ctx.guild.id)
+        self.control_view.stop()
+
+        voice_client = self.ctx.guild.voice_client or self.voice_client
+        if voice_client:
+            try:
+                if voice_client.is_playing() or voice_client.is_paused():
+                    voice_client.stop()
+                if voice_client.is_connected():
+                    await voice_client.disconnect(force=True)
+            except Exception as e:
+                logger.error(f"離開語音頻道時發生錯誤: {e}")
+
+        logger.info(f"已釋放伺服器 {self.ctx.guild.id} 的播放器（{reason or '手動'}）")
+        if reason:
+            try:
+                await self.ctx.send(f'👋 {reason}，已離開語音頻道。')
+            except Exception as e:
+                logger.warning(f"發送離開通知時出錯: {e}")
 
     def add_song(self, song: Song):
-        self.queue.put_nowait(song)
+        self.queue.append(song.lightweight())
+        self.schedule_prefetch()
+
+    # 以下索引皆從 0 開始
+    def remove(self, index: int) -> Song:
+        song = self.queue.pop(index)
+        self.schedule_prefetch()
+        return song
+
+    def move(self, source: int, destination: int) -> Song:
+        song = self.queue.move(source, destination)
+        self.schedule_prefetch()
+        return song
+
+    def shuffle(self):
+        self.queue.shuffle()
+        self.schedule_prefetch()
+
+    # 跳到指定歌曲：丟棄其前方的歌曲並跳過目前歌曲（清單循環時被跳過的歌曲移到最後）
+    def jump(self, index: int):
+        skipped = self.queue.popleft_many(index)
+        if self.queue_loop:
+            self.queue.extend(skipped)
+        self.schedule_prefetch()
+        self.skip()
 
     def skip(self):
         if self.voice_client.is_playing():
+            self.skipped = True
             self.voice_client.stop()
 
     def pause(self):
         if self.voice_client.is_playing():
             self.voice_client.pause()
+            self.renderer.request_update()
 
     def resume(self):
         if self.voice_client.is_paused():
             self.voice_client.resume()
+            self.renderer.request_update()
+
+    def toggle_loop(self) -> bool:
+        self.loop_flag = not self.loop_flag
+        self.renderer.request_update()
+        return self.loop_flag
 
     def stop(self):
-        self.queue = asyncio.Queue()
+        self.stopped = True
+        self.queue.clear()
+        self.cancel_prefetch()
+        for task in self.ingest_tasks:
+            task.cancel()
         if self.voice_client.is_playing():
+            self.skipped = True
             self.voice_client.stop()
 
     def get_queue_snapshot(self):
-        return list(self.queue._queue)
+        return self.queue.snapshot()
     
+# 包裝音源，記錄從開始播放到讀到第一個音框的時間（read 在語音執行緒中呼叫）
+class FirstFrameTimer(discord.AudioSource):
+    def __init__(self, original: discord.AudioSource):
+        self.original = original
+        self.started = time.perf_counter()
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if self.started is not None and data:
+            FIRST_FRAME_LATENCY.observe(time.perf_counter() - self.started)
+            self.started = None
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+# 控制訊息（正在播放）的渲染器：
+# 短時間內的多次狀態變化只會合併成一次編輯，每則訊息同時最多一個請求、
+# 兩次編輯至少間隔 CONTROL_EDIT_INTERVAL 秒；遇到 429 時依 retry_after 延後。
+# 重複使用 player.control_view，只有原訊息確實不存在時才重新發送。
+class NowPlayingRenderer:
+    def __init__(self, player: MusicPlayer):
+        self.player = player
+        self.message = None
+        self.started_at = None
+        self._dirty = False
+        self._task = None
+        self._next_edit = 0.0
+        self._closed = False
+
+    def track_started(self):
+        # 获取当前时间并转换为 UTC+8
+        self.started_at = datetime.utcnow() + timedelta(hours=8)
+        self.request_update()
+
+    def request_update(self):
+        if self._closed:
+            return
+        if self._task is not None and not self._task.done():
+            if self._dirty:
+                CONTROL_UPDATES.inc(result='coalesced')
+            self._dirty = True
+            return
+        self._dirty = True
+        self._task = asyncio.create_task(self._flush())
+
+    def close(self):
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def build_embed(self):
+        player = self.player
+        song = player.current
+        if song is None or self.started_at is None:
+            return None
+        paused = player.voice_client.is_paused()
+        formatted_time = self.started_at.strftime('%Y-%m-%d %H:%M:%S')
+
+        # 准备嵌入消息
+        embed = discord.Embed(
+            title="🎶 已暫停" if paused else "🎶 正在播放",
+            description=f"[{song.title}]({song.webpage_url})",
+            color=discord.Color.orange() if paused else discord.Color.green(),  # 更改顏色以反映暫停狀態
+            timestamp=self.started_at
+        )
+        embed.set_thumbnail(url=song.thumbnail)
+        embed.add_field(
+            name="循環狀態",
+            value="🔁 循環已啟用" if player.loop_flag else "🔁 循環已停用",
+            inline=False
+        )
+        embed.set_footer(
+            text=f"請求者: {player.ctx.author.display_name} • {formatted_time}",
+            icon_url=player.ctx.author.avatar.url if player.ctx.author.avatar else None
+        )
+        return embed
+
+    # 依播放器狀態更新按鈕外觀
+    def sync_view(self):
+        view = self.player.control_view
+        if self.player.voice_client.is_paused():
+            view.pause_resume_button.label = '繼續'
+            view.pause_resume_button.emoji = '▶️'
+            view.pause_resume_button.style = discord.ButtonStyle.success
+        else:
+            view.pause_resume_button.label = '暫停'
+            view.pause_resume_button.emoji = '⏸️'
+            view.pause_resume_button.style = discord.ButtonStyle.secondary
+        view.loop_button.style = discord.ButtonStyle.success if self.player.loop_flag else discord.ButtonStyle.danger
+
+    async def _flush(self):
+        while self._dirty:
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._dirty = False
+            embed = self.build_embed()
+            if embed is None:
+                return
+            self.sync_view()
+            self._next_edit = time.monotonic() + CONTROL_EDIT_INTERVAL
+            await self._render(embed)
+
+    async def _render(self, embed: discord.Embed):
+        view = self.player.control_view
+        if self.message is not None:
+            try:
+                with CONTROL_EDIT_LATENCY.time():
+                    await self.message.edit(embed=embed, view=view)
+                CONTROL_UPDATES.inc(result='edit')
+                return
+            except discord.NotFound:
+                # 原訊息已被刪除，改為重新發送
+                self.message = None
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    CONTROL_UPDATES.inc(result='rate_limited')
+                    retry_after = getattr(e, 'retry_after', None) or CONTROL_EDIT_INTERVAL
+                    self._next_edit = time.monotonic() + retry_after
+                    self._dirty = True
+                else:
+                    CONTROL_UPDATES.inc(result='error')
+                    logger.error(f"編輯控制訊息失敗：{e}")
+                return
+        try:
+            with CONTROL_EDIT_LATENCY.time():
+                self.message = await self.player.ctx.send(embed=embed, view=view)
+            CONTROL_UPDATES.inc(result='send')
+        except discord.HTTPException as e:
+            CONTROL_UPDATES.inc(result='error')
+            logger.error(f"發送控制訊息失敗：{e}")
+
 players = {}
 
 # is_url判斷是否為URL
@@ -213,41 +861,301 @@ def is_url(search: str) -> bool:
         r'(?:/\S*)?$', re.IGNORECASE)
     return re.match(url_pattern, search) is not None
 
-# 搜尋返回多個歌曲結果
-async def search_songs(search: str) -> list:
+# 經由解析工作池執行 yt-dlp，並記錄延遲與結果
+async def _extract(kind: str, guild_id, ytdl_opts: dict, query: str):
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        return await extraction_pool.run(guild_id, extract_info, ytdl_opts, query)
+    except ExtractionTimeout:
+        status = 'timeout'
+        raise
+    except asyncio.CancelledError:
+        status = 'cancelled'
+        raise
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        EXTRACTION_LATENCY.observe(time.perf_counter() - started, kind=kind, status=status)
+
+# 相同的解析（同樣的選項與網址/關鍵字）同時只執行一次，例如熱門連結被多人或多個伺服器同時 /play；
+# 結果只取決於選項與網址，不同用途（kind）的相同解析也會合併，延遲記在最先發起的用途下；
+# timeout 只限制這個呼叫者等待的時間，共用的解析本身以工作池的逾時為上限
+async def run_extraction(kind: str, guild_id, ytdl_opts: dict, query: str, timeout: float = None):
+    key = (repr(sorted(ytdl_opts.items())), query)
+    if key in extraction_calls:
+        EXTRACTIONS_COALESCED.inc(kind=kind)
+    return await extraction_calls.run(key, lambda: _extract(kind, guild_id, ytdl_opts, query), timeout)
+
+# 搜尋返回多個歌曲結果：
+# 關鍵字搜尋只做扁平解析（影片 ID、標題、長度、縮圖），不解析五個候選的格式與串流網址，
+# 使用者選定後才解析該首（MusicPlayer.resolve_selected / resolve_stream）；網址則直接完整解析
+async def search_songs(search: str, guild_id: int = None, deadline: datetime = None) -> list:
     ytdl_opts = {
         'format': 'bestaudio/best',
         'quiet': True,
         'default_search': 'ytsearch5',
         # 'source_address': '0.0.0.0'  # 已移除
     }
+    flat = not is_url(search)
+    if flat:
+        ytdl_opts = {
+            'quiet': True,
+            'extract_flat': 'in_playlist',
+            'default_search': 'ytsearch5',
+        }
+    else:
+        # 帶有 list= 的影片連結只取該影片
+        ytdl_opts['noplaylist'] = True
+
+    # 互動過期後便無法回覆，解析時間不可超過互動的剩餘時間
+    timeout = EXTRACT_TIMEOUT
+    if deadline is not None:
+        timeout = min(timeout, (deadline - datetime.now(timezone.utc)).total_seconds())
+        if timeout <= 0:
+            raise ExtractionTimeout('互動已過期')
+
+    # 先查快取：網址以正規化後的影片連結為鍵，關鍵字以正規化後的字串為鍵
+    if flat:
+        cache_key = 'q:' + normalize_query(search)
+    else:
+        cache_key = 'url:' + canonical_url(search)
+    cached = metadata_cache.get(cache_key, need_stream=False)
+    if cached is not None:
+        return [Song.from_dict(data) for data in cached]
 
     try:
-        with yt_dlp.YoutubeDL(ytdl_opts) as ytdl:
-            info = ytdl.extract_info(search, download=False)
-            if 'entries' in info:
-                return [
-                    Song(
-                        entry['url'],                        # source_url 用於播放
-                        entry['webpage_url'],                # YouTube影片連結
-                        entry.get('title', '未知標題'),
-                        entry.get('thumbnail', 'https://i.imgur.com/your-default-image.png')  # 提取封面圖，若無則設置預設圖片
-                    )
-                    for entry in info['entries']
-                ]
-            else:
-                return [
-                    Song(
-                        info['url'],                         # source_url 用於播放
-                        info['webpage_url'],                 # YouTube影片連結
-                        info.get('title', '未知標題'),
-                        info.get('thumbnail', 'https://i.imgur.com/your-default-image.png')  # 提取封面圖，若無則設置預設圖片
-                    )
-                ]
+        info = await run_extraction('search' if flat else 'url', guild_id, ytdl_opts, search, timeout=timeout)
+        if flat:
+            songs = [song for song in map(song_from_flat_entry, filter(None, info.get('entries') or [])) if song]
+        elif 'entries' in info:
+            songs = [
+                Song(
+                    entry['url'],                        # source_url 用於播放
+                    entry['webpage_url'],                # YouTube影片連結
+                    entry.get('title', '未知標題'),
+                    entry.get('thumbnail', DEFAULT_THUMBNAIL),  # 提取封面圖，若無則設置預設圖片
+                    entry.get('acodec'),
+                    entry.get('duration')
+                )
+                for entry in info['entries']
+            ]
+        else:
+            songs = [
+                Song(
+                    info['url'],                         # source_url 用於播放
+                    info['webpage_url'],                 # YouTube影片連結
+                    info.get('title', '未知標題'),
+                    info.get('thumbnail', DEFAULT_THUMBNAIL),  # 提取封面圖，若無則設置預設圖片
+                    info.get('acodec'),
+                    info.get('duration')
+                )
+            ]
+    except ExtractionTimeout:
+        raise
     except Exception as e:
         logger.error(f"搜索歌曲時發生錯誤: {e}")
         return []
 
+    metadata_cache.put(cache_key, [song.to_dict() for song in songs])
+    for song in songs:
+        # 同時以影片連結為鍵存入，之後直接貼上該連結（或從自動完成選取）也能命中；
+        # 扁平結果沒有串流網址，不覆蓋已含串流網址的項目
+        url_key = 'url:' + canonical_url(song.webpage_url)
+        if song.source_url or url_key not in metadata_cache:
+            metadata_cache.put(url_key, [song.to_dict()])
+        title_index.add(canonical_url(song.webpage_url), song.title)
+    return songs
+
+# 播放前解析（或重新解析即將過期的）串流網址，失敗時自動重試
+async def resolve_stream(song: Song, guild_id: int = None, kind: str = 'resolve') -> Song:
+    if not song.needs_stream(STREAM_REFRESH_MARGIN):
+        return song
+
+    cache_key = 'url:' + canonical_url(song.webpage_url)
+    cached = metadata_cache.get(cache_key)
+    if cached and cached[0].get('source_url'):
+        song.set_stream(cached[0]['source_url'], cached[0].get('codec'))
+        if not song.needs_stream(STREAM_REFRESH_MARGIN):
+            return song
+
+    ytdl_opts = {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'noplaylist': True,
+    }
+    last_error = None
+    for attempt in range(1, RESOLVE_RETRIES + 1):
+        try:
+            info = await run_extraction(kind, guild_id, ytdl_opts, song.webpage_url)
+            song.set_stream(info['url'], info.get('acodec'))
+            if song.duration is None:
+                song.duration = info.get('duration')
+            metadata_cache.put(cache_key, [song.to_dict()])
+            return song
+        except Exception as e:
+            last_error = e
+            logger.warning(f"解析串流網址失敗（第 {attempt}/{RESOLVE_RETRIES} 次）{song.webpage_url}: {e}")
+            if attempt < RESOLVE_RETRIES:
+                await asyncio.sleep(2 ** (attempt - 1))
+    raise last_error
+
+# 判斷是否為 YouTube 播放清單連結：
+# 分享按鈕產生的 watch?v=X&list=... 與 youtu.be/X?list=... 指向單一影片；
+# RD 開頭的「合輯」是自動產生、沒有盡頭的清單，一律不當成播放清單載入
+def is_playlist_url(search: str) -> bool:
+    if not is_url(search):
+        return False
+    parsed = urlparse(search)
+    if 'youtube.com' not in parsed.netloc and 'youtu.be' not in parsed.netloc:
+        return False
+    query = parse_qs(parsed.query)
+    playlist_id = (query.get('list') or [''])[0]
+    if not playlist_id or playlist_id.startswith('RD'):
+        return False
+    if 'youtu.be' in parsed.netloc or 'v' in query:
+        return False
+    return True
+
+# 將扁平解析的播放清單項目轉成不含串流網址的 Song
+def song_from_flat_entry(entry: dict):
+    if entry.get('title') in ('[Private video]', '[Deleted video]'):
+        return None
+    url = entry.get('webpage_url') or entry.get('url')
+    if entry.get('id') and (not url or not url.startswith('http')):
+        url = f"https://www.youtube.com/watch?v={entry['id']}"
+    if not url:
+        return None
+    thumbnails = entry.get('thumbnails')
+    thumbnail = entry.get('thumbnail') or (thumbnails[-1]['url'] if thumbnails else None)
+    duration = entry.get('duration')
+    return Song(None, canonical_url(url), entry.get('title') or '未知標題', thumbnail,
+                duration=int(duration) if duration else None)
+
+# 以扁平解析分批取得播放清單項目（不解析格式與串流網址）
+async def fetch_playlist_batch(url: str, start: int, end: int, guild_id: int = None):
+    ytdl_opts = {
+        'quiet': True,
+        'extract_flat': 'in_playlist',
+        'playlist_items': f'{start}-{end}',
+    }
+    info = await run_extraction('playlist', guild_id, ytdl_opts, url)
+    return info.get('title'), [entry for entry in info.get('entries') or [] if entry]
+
+# 分批把播放清單加入隊列，並定期更新進度訊息
+async def ingest_playlist(player, url: str, progress_message):
+    added = 0
+    start, size = 1, PLAYLIST_FIRST_BATCH
+    title = None
+    last_update = time.monotonic()
+    try:
+        while start <= PLAYLIST_MAX_ITEMS:
+            end = min(start + size - 1, PLAYLIST_MAX_ITEMS)
+            title, entries = await fetch_playlist_batch(url, start, end, player.ctx.guild.id)
+            for entry in entries:
+                song = song_from_flat_entry(entry)
+                if song:
+                    player.add_song(song)
+                    added += 1
+            if len(entries) < end - start + 1:
+                break
+            start, size = end + 1, PLAYLIST_BATCH_SIZE
+
+            if time.monotonic() - last_update >= PLAYLIST_PROGRESS_INTERVAL:
+                last_update = time.monotonic()
+                try:
+                    await progress_message.edit(content=f"⏳ 正在載入播放清單 **{title}**… 已加入 {added} 首")
+                except Exception as e:
+                    logger.warning(f"更新播放清單進度訊息失敗: {e}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"載入播放清單時發生錯誤 {url}: {e}")
+        content = f"⚠️ 載入播放清單時發生錯誤，已加入 {added} 首：{e}"
+    else:
+        content = f"✅ 已從播放清單 **{title}** 加入 {added} 首歌曲"
+        if start > PLAYLIST_MAX_ITEMS:
+            content += f"（上限 {PLAYLIST_MAX_ITEMS} 首）"
+    try:
+        await progress_message.edit(content=content)
+    except Exception as e:
+        logger.warning(f"更新播放清單進度訊息失敗: {e}")
+
+# 將多行文字拆成查詢：每行（或以 | 分隔）一個網址或關鍵字，略過空行與 # 開頭的註解
+def parse_queries(text: str) -> list:
+    queries = []
+    for line in re.split(r'[\r\n|]+', text or ''):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            queries.append(line)
+    return queries
+
+# 同時解析多個查詢（最多 PLAYMANY_CONCURRENCY 個），並依原本的順序加入隊列：
+# 前面的項目都已解析完成時立刻加入，不必等全部完成；關鍵字直接取第一個搜尋結果
+async def ingest_many(player, queries: list, progress_message, deadline: datetime = None, dropped: int = 0):
+    results = [None] * len(queries)  # (Song, None) 或 (None, 錯誤原因)
+    done = [asyncio.Event() for _ in queries]
+    indexes = iter(range(len(queries)))
+    added = 0
+    failures = []
+    last_update = time.monotonic()
+
+    async def resolve(index: int):
+        query = queries[index]
+        if is_playlist_url(query):
+            return None, '播放清單連結請使用 /play'
+        try:
+            songs = await search_songs(query, guild_id=player.ctx.guild.id, deadline=deadline)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return None, str(e) or type(e).__name__
+        if not songs:
+            return None, '沒有找到相關歌曲'
+        return songs[0], None
+
+    async def worker():
+        for index in indexes:
+            results[index] = await resolve(index)
+            done[index].set()
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(PLAYMANY_CONCURRENCY, len(queries)))]
+    try:
+        for index, query in enumerate(queries):
+            await done[index].wait()
+            song, error = results[index]
+            if song is None:
+                failures.append((index, query, error))
+                continue
+            player.add_song(song)
+            added += 1
+            if time.monotonic() - last_update >= PLAYLIST_PROGRESS_INTERVAL:
+                last_update = time.monotonic()
+                try:
+                    await progress_message.edit(content=f"⏳ 正在加入歌曲… {index + 1}/{len(queries)}")
+                except Exception as e:
+                    logger.warning(f"更新進度訊息失敗: {e}")
+    finally:
+        for task in workers:
+            task.cancel()
+
+    content = f"✅ 已加入 {added}/{len(queries)} 首歌曲"
+    if dropped:
+        content += f"（超過 {PLAYMANY_MAX_ITEMS} 首上限，另外 {dropped} 首未處理）"
+    if failures:
+        lines = [f"`{index + 1}.` {discord.utils.escape_markdown(query[:80])}：{error}" for index, query, error in failures]
+        content += f"，{len(failures)} 首失敗：\n"
+        while lines and len(content) + sum(len(line) + 1 for line in lines) > 1900:
+            lines.pop()
+        content += '\n'.join(lines)
+        if len(lines) < len(failures):
+            content += f"\n…另外 {len(failures) - len(lines)} 首"
+    try:
+        await progress_message.edit(content=content)
+    except Exception as e:
+        logger.warning(f"更新進度訊息失敗: {e}")
+
 # 定義 SongSelect 類
 class SongSelect(discord.ui.Select):
     def __init__(self, songs: list, player: MusicPlayer, ctx: commands.Context):
@@ -256,7 +1164,11 @@ class SongSelect(discord.ui.Select):
         self.ctx = ctx
 
         options = [
-            discord.SelectOption(label=song.title, description=f"选择 {i+1}", value=str(i))
+            discord.SelectOption(
+                label=song.title,
+                description=f"选择 {i+1}" + (f" • {format_duration(song.duration)}" if song.duration else ''),
+                value=str(i)
+            )
             for i, song in enumerate(songs[:5])  # 仅展示前5首歌曲
         ]
 
@@ -266,8 +1178,9 @@ class SongSelect(discord.ui.Select):
         selected_index = int(self.values[0])  # 获取用户选择的索引
         selected_song = self.songs[selected_index]
 
-        # 将选定的歌曲添加到播放队列
+        # 将选定的歌曲添加到播放队列，搜索结果只有扁平资料，此时才解析这一首
         self.player.add_song(selected_song)
+        self.player.resolve_selected(selected_song)
         await interaction.response.send_message(
             f"➕ 已加入播放列表：**[{selected_song.title}]({selected_song.webpage_url})**", ephemeral=True
         )
@@ -291,6 +1204,58 @@ class SongSelectView(discord.ui.View):
             return False
         return True
 
+# 將秒數格式化成 3:45 或 1:02:03
+def format_duration(seconds) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+# 將歌曲格式化成播放清單中的一行（不含編號）
+def format_queue_line(song: Song) -> str:
+    title = song.title
+    if len(title) > QUEUE_TITLE_LIMIT:
+        title = title[:QUEUE_TITLE_LIMIT - 1] + '…'
+    title = discord.utils.escape_markdown(title).replace('[', '\\[').replace(']', '\\]')
+    return f'[{title}]({song.webpage_url})'
+
+# 播放清單分頁快取：
+# - 每首歌的文字只格式化一次
+# - 每頁只取出該頁的歌曲（Playlist.slice），與隊列總長度無關
+# - 以 Playlist.version 判斷隊列是否變動，變動後才重新產生頁面
+class QueuePages:
+    def __init__(self, queue: Playlist, page_size: int = QUEUE_PAGE_SIZE):
+        self.queue = queue
+        self.page_size = page_size
+        self._version = None
+        self._pages = {}  # 頁碼 -> 頁面文字
+        self._lines = {}  # id(song) -> (song, 格式化後的文字)
+
+    @property
+    def total_pages(self) -> int:
+        return max(1, (len(self.queue) + self.page_size - 1) // self.page_size)
+
+    def _line(self, song: Song) -> str:
+        cached = self._lines.get(id(song))
+        if cached is None or cached[0] is not song:
+            cached = (song, format_queue_line(song))
+            self._lines[id(song)] = cached
+        return cached[1]
+
+    def page(self, index: int) -> str:
+        if self._version != self.queue.version:
+            self._version = self.queue.version
+            self._pages.clear()
+            if len(self._lines) > 2 * len(self.queue) + self.page_size * 4:
+                # 已離開隊列的歌曲不再需要快取
+                self._lines.clear()
+        text = self._pages.get(index)
+        if text is None:
+            start = index * self.page_size
+            songs = self.queue.slice(start, start + self.page_size)
+            text = "\n".join(f"{i}. {self._line(song)}" for i, song in enumerate(songs, start=start + 1))
+            self._pages[index] = text
+        return text
+
 # 定義 QueueEmbedView 類
 class QueueEmbedView(discord.ui.View):
     def __init__(self, player: MusicPlayer, ctx: commands.Context):
@@ -298,9 +1263,7 @@ class QueueEmbedView(discord.ui.View):
         self.player = player
         self.ctx = ctx
         self.page = 0
-        self.songs_per_page = 5
-        queue_size = self.player.queue.qsize()
-        self.total_pages = max(1, (queue_size + self.songs_per_page - 1) // self.songs_per_page)
+        self.pages = player.queue_pages
 
         self.previous_button = discord.ui.Button(label="上一頁", style=discord.ButtonStyle.primary, emoji="⬅️")
         self.previous_button.callback = self.previous_page
@@ -309,9 +1272,13 @@ class QueueEmbedView(discord.ui.View):
         self.add_item(self.previous_button)
         self.add_item(self.next_button)
 
+    # 隊列長度會變動，每次都重新計算總頁數
+    @property
+    def total_pages(self) -> int:
+        return self.pages.total_pages
+
     def generate_embed(self):
-        queue_snapshot = self.player.get_queue_snapshot()  # 獲取隊列快照
-        if not queue_snapshot:
+        if self.player.queue.empty():
             embed = discord.Embed(
                 title="📜 播放清單",
                 description="目前播放清單為空。",
@@ -319,21 +1286,11 @@ class QueueEmbedView(discord.ui.View):
             )
             return embed
 
-        # 計算當前頁面的索引
-        start_index = self.page * self.songs_per_page
-        end_index = start_index + self.songs_per_page
-        upcoming = queue_snapshot[start_index:end_index]
-        
-        # 整合歌曲列表到描述中
-        song_list = "\n".join(
-            [f"{i}. [{song.title}]({song.webpage_url})" for i, song in enumerate(upcoming, start=start_index + 1)]
-        )
-        
+        # 隊列縮短後，目前頁碼可能已超出範圍
+        self.page = min(self.page, self.total_pages - 1)
         embed = discord.Embed(
             title="📜 播放清單",
-            description=f"第 {self.page + 1}/{self.total_pages} 頁\n\n" + "\n".join(
-                [f"{i}. [{song.title}]({song.webpage_url})" for i, song in enumerate(upcoming, start=start_index + 1)]
-            ),
+            description=f"第 {self.page + 1}/{self.total_pages} 頁（共 {len(self.player.queue)} 首）\n\n" + self.pages.page(self.page),
             color=discord.Color.blue()
         )
 
@@ -406,33 +1363,15 @@ class MusicControls(discord.ui.View):
         self.add_item(self.view_queue_button)
 
     async def pause_resume(self, interaction: discord.Interaction):
+        # 嵌入訊息與按鈕外觀由 renderer 合併更新
         if self.player.voice_client.is_playing():
             self.player.pause()
-            self.pause_resume_button.label = '繼續'
-            self.pause_resume_button.emoji = '▶️'
-            self.pause_resume_button.style = discord.ButtonStyle.success
             await interaction.response.send_message("⏸️ 已暫停播放！", ephemeral=True)
         elif self.player.voice_client.is_paused():
             self.player.resume()
-            self.pause_resume_button.label = '暫停'
-            self.pause_resume_button.emoji = '⏸️'
-            self.pause_resume_button.style = discord.ButtonStyle.danger
             await interaction.response.send_message("▶️ 已恢復播放！", ephemeral=True)
-
-        # 更新嵌入訊息
-        message = interaction.message
-        if message.embeds:
-            embed = message.embeds[0]
-            if self.player.voice_client.is_paused():
-                embed.title = "🎶 已暫停"
-                embed.color = discord.Color.orange()  # 更改顏色以反映暫停狀態
-            else:
-                embed.title = "🎶 正在播放"
-                embed.color = discord.Color.green()
-            try:
-                await self.player.control_message.edit(embed=embed, view=self.player.control_view)
-            except AttributeError as e:
-                logger.error(f"無法編輯控制訊息：{e}")
+        else:
+            await interaction.response.send_message("目前沒有播放音樂。", ephemeral=True)
 
     async def skip(self, interaction: discord.Interaction):
         if self.player.voice_client.is_playing():
@@ -440,35 +1379,10 @@ class MusicControls(discord.ui.View):
             await interaction.response.send_message("⏭️ 已跳過當前歌曲！", ephemeral=True)
 
     async def toggle_loop(self, interaction: discord.Interaction):
-        self.player.loop_flag = not self.player.loop_flag
-        if self.player.loop_flag:
-            self.loop_button.style = discord.ButtonStyle.success
-            status = '啟用'
-        else:
-            self.loop_button.style = discord.ButtonStyle.danger
-            status = '停用'
-
+        # 嵌入訊息中的循環狀態與按鈕顏色由 renderer 合併更新
+        status = '啟用' if self.player.toggle_loop() else '停用'
         await interaction.response.send_message(f"🔁 循環播放已 {status}！", ephemeral=True)
 
-        # 更新嵌入訊息中的循環狀態
-        message = interaction.message
-        if message.embeds:
-            embed = message.embeds[0]
-            # 更新循環狀態字段
-            for idx, field in enumerate(embed.fields):
-                if field.name == "循環狀態":
-                    embed.set_field_at(
-                        index=idx,
-                        name="循環狀態",
-                        value="🔁 循環已啟用" if self.player.loop_flag else "🔁 循環已停用",
-                        inline=False
-                    )
-                    break
-            try:
-                await self.player.control_message.edit(embed=embed, view=self.player.control_view)
-            except AttributeError as e:
-                logger.error(f"無法編輯控制訊息：{e}")
-
     async def view_queue(self, interaction: discord.Interaction):
         if not self.player.queue.empty():
             view = QueueEmbedView(self.player, self.ctx)
@@ -498,32 +1412,566 @@ async def on_application_command_error(interaction: discord.Interaction, error):
         else:
             await interaction.response.send_message(f'發生錯誤: {error}', ephemeral=True)
 
+# 定期將快取變更寫入磁碟（在背景執行緒中寫入，不阻塞事件迴圈）
+@tasks.loop(seconds=60)
+async def flush_caches():
+    rows, deleted = metadata_cache.collect_changes()
+    await asyncio.to_thread(metadata_cache.write, rows, deleted)
+    rows, deleted = title_index.collect_changes()
+    await asyncio.to_thread(title_index.write, rows, deleted)
+    if loudness_cache:
+        await asyncio.to_thread(loudness_cache.write, loudness_cache.collect_changes())
+    if audio_cache:
+        await asyncio.to_thread(audio_cache.write_index, audio_cache.snapshot_index())
+
+# 播放器要保存的狀態（不含隊列）
+def player_state(player: MusicPlayer) -> dict:
+    voice_client = player.ctx.guild.voice_client
+    return {
+        'text_channel_id': player.ctx.channel.id,
+        'voice_channel_id': voice_client.channel.id if voice_client and voice_client.channel else None,
+        'control_message_id': player.renderer.message.id if player.renderer.message else None,
+        'requester_id': player.ctx.author.id,
+        'current': player.current.to_dict() if player.current else None,
+        'loop_flag': player.loop_flag,
+        'queue_loop': player.queue_loop,
+    }
+
+# 隊列中的歌曲只保存中繼資料，串流網址在播放前重新解析
+def serialize_queued(song: Song) -> dict:
+    return dict(song.to_dict(), source_url=None, codec=None)
+
+def collect_player_state() -> list:
+    ops = state_store.collect_forgotten()
+    for guild_id, player in list(players.items()):
+        if not player.destroyed:
+            ops.extend(state_store.collect(guild_id, player_state(player), player.queue, serialize_queued))
+    return ops
+
+# 定期將播放器狀態的變更寫入 SQLite（在背景執行緒中寫入）
+@tasks.loop(seconds=STATE_FLUSH_INTERVAL)
+async def persist_players():
+    ops = collect_player_state()
+    if ops:
+        await asyncio.to_thread(state_store.write, ops)
+
+# 恢復播放器時使用的 Context：沒有觸發指令的訊息，回覆直接送到原本的文字頻道
+class RestoredContext:
+    def __init__(self, guild: discord.Guild, channel, author):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.interaction = None
+        self.bot = bot
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        kwargs.pop('ephemeral', None)
+        return await self.channel.send(*args, **kwargs)
+
+async def restore_player(state: dict):
+    guild = bot.get_guild(state['guild_id'])
+    if guild is None:
+        return  # 不屬於這個分片／叢集，或已離開該伺服器
+    if guild.id in players:
+        return
+    voice_channel = guild.get_channel(state['voice_channel_id']) if state['voice_channel_id'] else None
+    text_channel = guild.get_channel(state['text_channel_id'])
+    if voice_channel is None or text_channel is None or channel_is_empty(voice_channel):
+        # 頻道已不存在或沒有人在聽，不恢復
+        state_store.forget(guild.id)
+        return
+
+    queued = await asyncio.to_thread(state_store.load_queue, guild.id)
+    songs = [Song.from_dict(data) for data in ([state['current']] if state['current'] else []) + queued]
+    if not songs:
+        state_store.forget(guild.id)
+        return
+
+    if guild.voice_client is None:
+        await voice_channel.connect()
+    if guild.id in players:
+        return  # 連線期間已有人使用 /play
+    author = guild.get_member(state['requester_id']) or guild.me
+    ctx = RestoredContext(guild, text_channel, author)
+    player = MusicPlayer(ctx, bot.loop)
+    players[guild.id] = player
+    player.loop_flag = state['loop_flag']
+    player.queue_loop = state['queue_loop']
+    if state['control_message_id']:
+        # 沿用原本的控制訊息；訊息已被刪除時 renderer 會重新發送
+        player.renderer.message = text_channel.get_partial_message(state['control_message_id'])
+    # 不預先解析任何串流網址，輪到播放（或預載下一首）時才解析
+    player.queue.extend(songs)
+    logger.info(f"已恢復伺服器 {guild.id} 的播放器（{len(songs)} 首）")
+    try:
+        await ctx.send(f"🔄 機器人已重新啟動，繼續播放清單（共 {len(songs)} 首）。")
+    except discord.HTTPException as e:
+        logger.warning(f"發送恢復通知失敗: {e}")
+
+# 啟動後逐一恢復各伺服器的播放器，限制同時進行的數量，避免語音連線與解析同時湧入
+async def restore_players():
+    saved = await asyncio.to_thread(state_store.load_players)
+    if not saved:
+        return
+    logger.info(f"找到 {len(saved)} 個已保存的播放器，開始恢復")
+    semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+    async def restore(state):
+        async with semaphore:
+            try:
+                await restore_player(state)
+            except Exception as e:
+                logger.error(f"恢復伺服器 {state['guild_id']} 的播放器失敗: {e}")
+            await asyncio.sleep(RESTORE_INTERVAL)
+
+    await asyncio.gather(*(restore(state) for state in saved))
+
+# 沒有播放器在使用的 FFmpeg 行程（播放器已釋放、音源被遺漏而沒有 cleanup）
+def ffmpeg_orphan(handle) -> bool:
+    player = players.get(handle.guild_id)
+    return player is None or player.destroyed or not player.owns_source(handle.source)
+
+# 定期取樣 FFmpeg 行程的 CPU/記憶體用量，並結束孤兒行程
+@tasks.loop(seconds=FFMPEG_SAMPLE_INTERVAL)
+async def supervise_ffmpeg():
+    ffmpeg_supervisor.sample()
+    ffmpeg_supervisor.reap(ffmpeg_orphan, grace=FFMPEG_SAMPLE_INTERVAL * 2)
+
+# 目前存活的播放器與工作數量，用來觀察是否有資源洩漏
+def player_gauges() -> dict:
+    return {
+        'players': len(players),
+        'player_tasks': sum(1 for player in players.values() if not player.task.done()),
+        'voice_clients': len(bot.voice_clients),
+        'asyncio_tasks': len(asyncio.all_tasks()),
+    }
+
+# 本行程（叢集）的狀態，回報給啟動器彙整
+def cluster_stats() -> dict:
+    gauges = player_gauges()
+    latencies = bot.latencies if isinstance(bot, commands.AutoShardedBot) else [(0, bot.latency)]
+    return {
+        'cluster_id': CLUSTER_ID,
+        'pid': os.getpid(),
+        'shards': format_shard_ids(shard_id for shard_id, _ in latencies),
+        'guilds': len(bot.guilds),
+        'players': gauges['players'],
+        'voice_clients': gauges['voice_clients'],
+        'queued': sum(len(player.queue) for player in players.values()),
+        'ffmpeg': len(ffmpeg_supervisor.handles),
+        # 尚未連線的分片延遲為 NaN（NaN != NaN），不列入計算
+        'latency_ms': round(max((latency for _, latency in latencies if latency == latency), default=0) * 1000),
+        'uptime': round(time.time() - started_at),
+    }
+
+async def ipc_stats(data):
+    return cluster_stats()
+
+async def ipc_shutdown(data):
+    logger.info("收到啟動器的關閉要求")
+    asyncio.get_running_loop().call_later(0.1, lambda: asyncio.create_task(bot.close()))
+    return {'ok': True}
+
+# 收集時才計算的量表
+metrics.gauge('bot_players', '播放器數量').set_function(lambda: len(players))
+metrics.gauge('bot_voice_clients', '語音連線數量').set_function(lambda: len(bot.voice_clients))
+metrics.gauge('bot_asyncio_tasks', '事件迴圈上的 asyncio 工作數量').set_function(lambda: len(asyncio.all_tasks()))
+metrics.gauge('bot_gateway_latency_seconds', '各分片的 gateway 延遲', ('shard',)).set_function(
+    lambda: {(str(shard_id),): latency for shard_id, latency in bot.latencies if latency == latency}
+    if isinstance(bot, commands.AutoShardedBot) else {('0',): bot.latency}
+)
+metrics.gauge('bot_queue_depth', '各伺服器播放清單中的歌曲數', ('guild',)).set_function(
+    lambda: {(str(guild_id),): len(player.queue) for guild_id, player in players.items()}
+)
+metrics.gauge('bot_extraction_pending', '等待中的解析工作').set_function(lambda: extraction_pool.pending)
+metrics.gauge('bot_extraction_running', '執行中的解析工作').set_function(lambda: extraction_pool.running)
+metrics.gauge('bot_extraction_in_flight', '進行中的不重複解析請求').set_function(lambda: len(extraction_calls))
+metrics.gauge('bot_metadata_cache_entries', '搜尋快取項目數').set_function(lambda: len(metadata_cache))
+metrics.counter('bot_metadata_cache_lookups_total', '搜尋快取查詢次數', ('result',)).set_function(
+    lambda: {('hit',): metadata_cache.hits, ('miss',): metadata_cache.misses}
+)
+metrics.gauge('bot_ffmpeg_slots', 'FFmpeg 名額', ('state',)).set_function(
+    lambda: {('in_use',): ffmpeg_supervisor.in_use, ('waiting',): ffmpeg_supervisor.waiting,
+             ('max',): ffmpeg_supervisor.max_processes}
+)
+metrics.counter('bot_ffmpeg_events_total', 'FFmpeg 行程事件次數', ('event',)).set_function(
+    lambda: {(event,): ffmpeg_supervisor.stats()[event] for event in ('spawned', 'waits', 'timeouts', 'preempted', 'reaped')}
+)
+metrics.counter('bot_ffmpeg_slot_wait_seconds_total', '等待 FFmpeg 名額的累計時間').set_function(
+    lambda: ffmpeg_supervisor.wait_seconds
+)
+# 目前 FFmpeg 行程的資源用量（最近一次取樣的數值），依伺服器與用途加總；
+# 不以 pid 作為標籤，否則每換一首歌就多出一條永不回收的時間序列
+def ffmpeg_usage(field: str) -> dict:
+    usage = {}
+    for p in ffmpeg_supervisor.table():
+        if p[field] is not None:
+            key = (str(p['guild_id']), p['role'])
+            usage[key] = usage.get(key, 0) + p[field]
+    return usage
+
+metrics.gauge('bot_ffmpeg_cpu_percent', 'FFmpeg 行程的 CPU 使用率', ('guild', 'role')).set_function(
+    lambda: ffmpeg_usage('cpu_percent')
+)
+metrics.gauge('bot_ffmpeg_rss_bytes', 'FFmpeg 行程的常駐記憶體', ('guild', 'role')).set_function(
+    lambda: ffmpeg_usage('rss')
+)
+if loudness_cache:
+    metrics.gauge('bot_loudness_entries', '已測量響度的歌曲數').set_function(lambda: len(loudness_cache))
+    metrics.gauge('bot_loudness_pending', '測量中或等待測量的歌曲數').set_function(lambda: loudness_cache.pending)
+    metrics.counter('bot_loudness_measurements_total', '響度測量次數', ('result',)).set_function(
+        lambda: {('ok',): loudness_cache.measured, ('error',): loudness_cache.failures,
+                 ('skipped',): loudness_cache.skipped}
+    )
+if audio_cache:
+    metrics.gauge('bot_audio_cache_bytes', '音訊快取佔用的位元組').set_function(lambda: audio_cache.total_bytes)
+    metrics.counter('bot_audio_cache_lookups_total', '音訊快取查詢次數', ('result',)).set_function(
+        lambda: {('hit',): audio_cache.hits, ('miss',): audio_cache.misses}
+    )
+
+# 指令延遲：開始時記下時間，完成或失敗時記錄（斜線與文字指令都會觸發這些事件）
+@bot.listen('on_command')
+async def on_command_started(ctx: commands.Context):
+    ctx.metrics_started = time.perf_counter()
+
+def observe_command(ctx: commands.Context, status: str):
+    started = getattr(ctx, 'metrics_started', None)
+    if started is not None and ctx.command is not None:
+        COMMAND_LATENCY.observe(time.perf_counter() - started, command=ctx.command.qualified_name, status=status)
+
+@bot.listen('on_command_completion')
+async def on_command_finished(ctx: commands.Context):
+    observe_command(ctx, 'ok')
+
+@bot.listen('on_command_error')
+async def on_command_failed(ctx: commands.Context, error: commands.CommandError):
+    observe_command(ctx, 'error')
+    if isinstance(error, commands.CommandNotFound):
+        return
+    if isinstance(error, (commands.MissingPermissions, commands.CheckFailure)):
+        await ctx.send('你沒有執行這個指令的權限。', ephemeral=True)
+        return
+    logger.error(f"指令 {ctx.command} 發生錯誤: {error}", exc_info=error)
+
+def channel_is_empty(channel) -> bool:
+    return channel is not None and not any(not member.bot for member in channel.members)
+
+# 語音狀態變化：機器人被踢出或斷線時釋放播放器，頻道變空時開始計時
+@bot.event
+async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+    player = players.get(member.guild.id)
+    if player is None:
+        return
+    if member.id == bot.user.id:
+        if after.channel is None:
+            await player.destroy()
+            return
+    voice_client = member.guild.voice_client
+    if voice_client is None or voice_client.channel is None:
+        return
+    if channel_is_empty(voice_client.channel):
+        if player.empty_since is None:
+            player.empty_since = time.monotonic()
+    else:
+        player.empty_since = None
+
+_idle_voice_since = {}  # 沒有播放器的語音連線（例如只用了 /join）開始閒置的時間
+_last_gauges = None
+
+# 定期回收閒置、頻道已空或已斷線的播放器
+@tasks.loop(seconds=REAPER_INTERVAL)
+async def reap_players():
+    global _last_gauges
+    now = time.monotonic()
+    for player in list(players.values()):
+        voice_client = player.ctx.guild.voice_client
+        if voice_client is not None and voice_client.is_connected():
+            player.disconnected_since = None
+        if voice_client is None:
+            # 語音連線已移除（被踢出或已斷線），不會再自動重新連線
+            await player.destroy()
+        elif not voice_client.is_connected():
+            # 切換語音伺服器或網路不穩時 discord.py 會自動重新連線，期間 is_connected() 為 False，
+            # 持續斷線超過 DISCONNECT_GRACE 才回收
+            if player.disconnected_since is None:
+                player.disconnected_since = now
+            elif now - player.disconnected_since >= DISCONNECT_GRACE:
+                await player.destroy()
+        elif player.empty_since is not None and now - player.empty_since >= EMPTY_CHANNEL_TIMEOUT:
+            await player.destroy('語音頻道已沒有其他人')
+        elif (player.idle_since is not None and player.queue.empty()
+              and now - player.idle_since >= IDLE_TIMEOUT):
+            await player.destroy('閒置過久')
+
+    for voice_client in list(bot.voice_clients):
+        guild_id = voice_client.guild.id
+        if guild_id in players:
+            _idle_voice_since.pop(guild_id, None)
+            continue
+        since = _idle_voice_since.setdefault(guild_id, now)
+        limit = EMPTY_CHANNEL_TIMEOUT if channel_is_empty(voice_client.channel) else IDLE_TIMEOUT
+        if now - since >= limit:
+            _idle_voice_since.pop(guild_id, None)
+            try:
+                await voice_client.disconnect(force=True)
+            except Exception as e:
+                logger.error(f"離開閒置語音頻道時發生錯誤: {e}")
+    connected = {voice_client.guild.id for voice_client in bot.voice_clients}
+    for guild_id in list(_idle_voice_since):
+        if guild_id not in connected:
+            del _idle_voice_since[guild_id]
+
+    gauges = player_gauges()
+    if gauges != _last_gauges:
+        logger.info(f"播放器統計: {gauges}")
+        _last_gauges = gauges
+
 # 同步指令樹
+# 登入後、連線到 gateway 之前執行：IPC 連線不必等所有分片就緒，
+# 啟動器在分片連線期間也能查詢狀態或要求關閉
+@bot.event
+async def setup_hook():
+    global ipc_client
+    if IPC_ADDRESS and ipc_client is None:
+        ipc_client = IPCClient(IPC_ADDRESS, IPC_SECRET, CLUSTER_ID, cluster_stats)
+        ipc_client.handlers.update({'stats': ipc_stats, 'shutdown': ipc_shutdown})
+        ipc_client.start()
+
 @bot.event
 async def on_ready():
     logger.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
     logger.info('------')
+    if not flush_caches.is_running():
+        flush_caches.start()
+    if not reap_players.is_running():
+        reap_players.start()
+    if not supervise_ffmpeg.is_running():
+        supervise_ffmpeg.start()
+    global restore_task
+    if state_store and restore_task is None:
+        persist_players.start()
+        restore_task = asyncio.create_task(restore_players())
+    global metrics_server
+    if METRICS_PORT and metrics_server is None:
+        try:
+            metrics_server = await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.error(f"無法啟動指標端點: {e}")
+    if CLUSTER_ID != 0:
+        # 指令是全域的，多行程執行時只由第一個叢集同步
+        return
     try:
         # 獲取所有註冊的指令名稱
         commands_list = bot.tree.get_commands()
         logger.info(f"Registered commands: {[cmd.name for cmd in commands_list]}")
 
-        # 全域同步指令
-        synced = await bot.tree.sync()
-        logger.info(f"Successfully synced {len(synced)} commands globally.")
+        # 指令有變更時才同步（on_ready 在每次重新連線時都會觸發）
+        await sync_command_tree()
     except Exception as e:
-        logger.error(f"Failed to sync commands globally: {e}")
+        logger.error(f"Failed to sync commands: {e}")
+
+# 所有已註冊指令定義的穩定雜湊，用來判斷是否需要重新同步
+def command_tree_hash() -> str:
+    payload = [
+        cmd.to_dict(bot.tree)
+        for command_type in discord.AppCommandType
+        for cmd in bot.tree.get_commands(type=command_type)
+    ]
+    payload.sort(key=lambda c: (c.get('type', 1), c['name']))
+    data = json.dumps({'application_id': bot.application_id, 'commands': payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def load_sync_state() -> dict:
+    try:
+        with open(COMMAND_SYNC_STATE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-# 混合指令：強制同步指令（全域）
+def save_sync_state(state: dict):
+    try:
+        directory = os.path.dirname(COMMAND_SYNC_STATE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(COMMAND_SYNC_STATE + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(COMMAND_SYNC_STATE + '.tmp', COMMAND_SYNC_STATE)
+    except OSError as e:
+        logger.error(f"寫入指令同步狀態時發生錯誤: {e}")
+
+# 同步斜線指令；雜湊與上次同步相同時略過，回傳實際同步的目標數量
+async def sync_command_tree(force: bool = False) -> int:
+    digest = command_tree_hash()
+    state = load_sync_state() if COMMAND_SYNC_STATE else {}
+    if COMMAND_SYNC_GUILDS:
+        targets = [(str(guild_id), discord.Object(id=guild_id)) for guild_id in COMMAND_SYNC_GUILDS]
+    else:
+        targets = [('global', None)]
+
+    synced_targets = 0
+    for key, guild in targets:
+        if not force and state.get(key) == digest:
+            logger.info(f"指令未變更，略過同步（{key}）")
+            continue
+        if guild is not None:
+            bot.tree.copy_global_to(guild=guild)
+        synced = await bot.tree.sync(guild=guild)
+        state[key] = digest
+        synced_targets += 1
+        logger.info(f"Successfully synced {len(synced)} commands ({key}).")
+
+    if synced_targets and COMMAND_SYNC_STATE:
+        save_sync_state(state)
+    return synced_targets
+
+# 混合指令：強制同步指令（全域，或 COMMAND_SYNC_GUILDS 指定的伺服器）
 @bot.hybrid_command(name='sync', description='手動同步指令到 Discord 全域')
 async def sync_commands(ctx: commands.Context):
     await ctx.defer()  # 延迟响应
     try:
-        synced = await bot.tree.sync()
-        await ctx.send(f"已全域同步 {len(synced)} 條指令。")
+        await sync_command_tree(force=True)
+        count = len(bot.tree.get_commands())
+        if COMMAND_SYNC_GUILDS:
+            await ctx.send(f"已同步 {count} 條指令到 {len(COMMAND_SYNC_GUILDS)} 個伺服器。")
+        else:
+            await ctx.send(f"已全域同步 {count} 條指令。")
     except Exception as e:
         await ctx.send(f"同步指令時發生錯誤：{e}")
 
+# 混合指令：顯示搜尋快取統計
+@bot.hybrid_command(name='cachestats', description='顯示搜尋快取的命中率與大小')
+async def cache_stats(ctx: commands.Context):
+    stats = metadata_cache.stats()
+    await ctx.send(
+        f"快取項目: {stats['size']}/{stats['max_entries']}\n"
+        f"命中: {stats['hits']} • 未命中: {stats['misses']} • 命中率: {stats['hit_rate']:.1%}\n"
+        f"串流網址過期: {stats['stale_streams']} • 淘汰: {stats['evictions']}"
+    )
+    if audio_cache:
+        stats = audio_cache.stats()
+        await ctx.send(
+            f"音訊快取: {stats['files']} 個檔案 • {stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} MB\n"
+            f"命中: {stats['hits']} • 未命中: {stats['misses']} • 下載: {stats['downloads']} "
+            f"(失敗 {stats['download_errors']}，不快取 {stats['rejected']}) • 淘汰: {stats['evictions']}"
+        )
+
+def format_latency(histogram, **labels) -> str:
+    if not histogram.count(**labels):
+        return '無資料'
+    p50, p95, p99 = (histogram.quantile(q, **labels) for q in (0.5, 0.95, 0.99))
+    return f"p50 {p50 * 1000:.0f} ms • p95 {p95 * 1000:.0f} ms • p99 {p99 * 1000:.0f} ms（{histogram.count(**labels)} 次）"
+
+# 混合指令：顯示執行狀態與延遲統計（需要管理伺服器權限）
+@bot.hybrid_command(name='stats', description='顯示機器人的執行狀態與延遲統計')
+@commands.has_guild_permissions(manage_guild=True)
+async def stats(ctx: commands.Context):
+    gauges = player_gauges()
+    cache = metadata_cache.stats()
+    updates = CONTROL_UPDATES.values()
+    embed = discord.Embed(title="📊 執行狀態", color=discord.Color.blue())
+    embed.add_field(
+        name="播放器",
+        value=(
+            f"播放器: {gauges['players']} • 語音連線: {gauges['voice_clients']} • asyncio 工作: {gauges['asyncio_tasks']}\n"
+            f"排隊歌曲: {sum(len(player.queue) for player in players.values())} • "
+            f"解析佇列: {extraction_pool.pending} 等待 / {extraction_pool.running} 執行中 • "
+            f"合併的重複解析: {sum(EXTRACTIONS_COALESCED.values().values()):.0f}"
+        ),
+        inline=False
+    )
+    ffmpeg = ffmpeg_supervisor.stats()
+    embed.add_field(
+        name="FFmpeg",
+        value=(
+            f"行程: {ffmpeg['processes']} • 名額: {ffmpeg['in_use']}/{ffmpeg['max_processes'] or '不限'} • "
+            f"等待中: {ffmpeg['waiting']}\n"
+            f"CPU: {ffmpeg['cpu_percent']:.0f}% • 記憶體: {ffmpeg['rss'] / 1024 / 1024:.0f} MB • "
+            f"搶占: {ffmpeg['preempted']} • 逾時: {ffmpeg['timeouts']} • 清除孤兒: {ffmpeg['reaped']}"
+        ),
+        inline=False
+    )
+    embed.add_field(name="指令", value=format_latency(COMMAND_LATENCY), inline=False)
+    embed.add_field(name="/play", value=format_latency(COMMAND_LATENCY, command='play'), inline=False)
+    embed.add_field(name="解析（搜尋）", value=format_latency(EXTRACTION_LATENCY, kind='search'), inline=False)
+    embed.add_field(name="解析（選取的搜尋結果）", value=format_latency(EXTRACTION_LATENCY, kind='select'), inline=False)
+    embed.add_field(name="解析（網址）", value=format_latency(EXTRACTION_LATENCY, kind='url'), inline=False)
+    embed.add_field(name="解析（串流網址）", value=format_latency(EXTRACTION_LATENCY, kind='resolve'), inline=False)
+    embed.add_field(name="建立音源", value=format_latency(SOURCE_OPEN_LATENCY), inline=False)
+    embed.add_field(name="FFmpeg 第一個音框", value=format_latency(FIRST_FRAME_LATENCY), inline=False)
+    embed.add_field(name="換曲間隔", value=format_latency(TRACK_GAP), inline=False)
+    embed.add_field(
+        name="控制訊息",
+        value=(
+            f"編輯: {updates.get(('edit',), 0):.0f} • 發送: {updates.get(('send',), 0):.0f} • "
+            f"合併: {updates.get(('coalesced',), 0):.0f} • 429: {updates.get(('rate_limited',), 0):.0f} • "
+            f"失敗: {updates.get(('error',), 0):.0f}\n{format_latency(CONTROL_EDIT_LATENCY)}"
+        ),
+        inline=False
+    )
+    errors = PLAYBACK_ERRORS.values()
+    embed.add_field(
+        name="錯誤與快取",
+        value=(
+            f"播放錯誤: 音源 {errors.get(('source',), 0):.0f} • 播放 {errors.get(('play',), 0):.0f} • "
+            f"after_play {errors.get(('after_play',), 0):.0f} • FFmpeg 名額已滿 {errors.get(('ffmpeg_busy',), 0):.0f}\n"
+            f"搜尋快取命中率: {cache['hit_rate']:.1%}（{cache['size']}/{cache['max_entries']}）"
+        ),
+        inline=False
+    )
+    if loudness_cache:
+        loudness = loudness_cache.stats()
+        embed.add_field(
+            name="響度標準化",
+            value=(
+                f"已測量: {loudness['entries']} 首 • 測量中: {loudness['pending']} • "
+                f"失敗: {loudness['failures']} • 略過: {loudness['skipped']}"
+            ),
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
+# 混合指令：列出所有叢集的狀態（僅限機器人擁有者）
+@bot.hybrid_command(name='clusters', description='列出所有分片叢集的狀態')
+@commands.is_owner()
+async def clusters(ctx: commands.Context):
+    await ctx.defer()
+    if ipc_client is not None:
+        try:
+            stats = await ipc_client.request('cluster_stats')
+        except Exception as e:
+            await ctx.send(f"無法取得叢集狀態：{e}")
+            return
+    else:
+        stats = {str(CLUSTER_ID): cluster_stats()}
+
+    lines = [
+        f"**叢集 {cluster_id}** • 分片 {data['shards']} • 伺服器 {data['guilds']} • 播放器 {data['players']} • "
+        f"排隊 {data['queued']} • FFmpeg {data.get('ffmpeg', 0)} • 延遲 {data['latency_ms']} ms • 已運行 {data['uptime'] / 3600:.1f} 小時"
+        for cluster_id, data in stats.items()
+    ]
+    total_guilds = sum(data['guilds'] for data in stats.values())
+    total_players = sum(data['players'] for data in stats.values())
+    lines.append(f"共 {len(stats)} 個叢集 • {total_guilds} 個伺服器 • {total_players} 個播放器")
+    await ctx.send("\n".join(lines))
+
+# 混合指令：重新啟動指定叢集（僅限機器人擁有者，需由 launcher.py 啟動）
+@bot.hybrid_command(name='cluster_restart', description='重新啟動指定的分片叢集')
+@commands.is_owner()
+async def cluster_restart(ctx: commands.Context, cluster_id: int):
+    await ctx.defer()
+    if ipc_client is None:
+        await ctx.send("目前不是以叢集模式執行。")
+        return
+    try:
+        await ipc_client.request('restart', {'cluster_id': cluster_id}, timeout=15)
+        await ctx.send(f"已要求重新啟動叢集 {cluster_id}。")
+    except Exception as e:
+        await ctx.send(f"重新啟動叢集時發生錯誤：{e}")
+
 # 混合指令：加入語音頻道
 @bot.hybrid_command(name='join', description='將機器人加入到您目前所在的語音頻道')
 async def join(ctx: commands.Context):
@@ -545,8 +1993,11 @@ async def leave(ctx: commands.Context):
     await ctx.defer()  # 延迟响应
     if ctx.voice_client:
         try:
-            await ctx.voice_client.disconnect()
-            players.pop(ctx.guild.id, None)  # 清理播放器實例
+            player = players.get(ctx.guild.id)
+            if player:
+                await player.destroy()  # 清理播放器實例
+            if ctx.voice_client:
+                await ctx.voice_client.disconnect()
             await ctx.send('已離開語音頻道並清理播放資源。')
         except Exception as e:
             await ctx.send(f'離開語音頻道時發生錯誤: {e}')
@@ -574,23 +2025,15 @@ async def move(ctx: commands.Context):
     else:
         await ctx.send('你不在任何語音頻道中。')
 
-# 混合指令：播放音樂
-@bot.hybrid_command(name='play', description='根据提供的 URL 或歌名搜索并播放音乐。如果有正在播放的歌曲，则加入播放列表。')
-async def play(ctx: commands.Context, *, search: str):
-    is_interaction = hasattr(ctx, "interaction") and ctx.interaction is not None
-
-    if is_interaction:
-        await ctx.defer(ephemeral=False)
-    else:
-        await ctx.trigger_typing()
-
+# 確認使用者在語音頻道中（必要時加入），並取得或建立伺服器的播放器；失敗時回覆並回傳 None
+async def prepare_player(ctx: commands.Context, is_interaction: bool):
     if not ctx.author.voice:
         message = '❌ 你必须在一个语音频道中才能播放音乐！'
         if is_interaction:
             await ctx.interaction.followup.send(message)
         else:
             await ctx.send(message)
-        return
+        return None
 
     if not ctx.voice_client:
         try:
@@ -603,15 +2046,39 @@ async def play(ctx: commands.Context, *, search: str):
                 await ctx.interaction.followup.send(message)
             else:
                 await ctx.send(message)
-            return
+            return None
 
     player = players.get(ctx.guild.id)
     if not player:
         player = MusicPlayer(ctx, ctx.bot.loop)
         players[ctx.guild.id] = player
+    return player
 
+# 混合指令：播放音樂
+@bot.hybrid_command(name='play', description='根据提供的 URL 或歌名搜索并播放音乐。如果有正在播放的歌曲，则加入播放列表。')
+async def play(ctx: commands.Context, *, search: str):
+    is_interaction = hasattr(ctx, "interaction") and ctx.interaction is not None
+
+    if is_interaction:
+        await ctx.defer(ephemeral=False)
+    else:
+        await ctx.trigger_typing()
+
+    player = await prepare_player(ctx, is_interaction)
+    if player is None:
+        return
+
+    # 播放清單在背景分批載入，第一批加入後就會開始播放
+    if is_playlist_url(search):
+        progress_message = await ctx.send("⏳ 正在載入播放清單…")
+        task = asyncio.create_task(ingest_playlist(player, search, progress_message))
+        player.ingest_tasks.add(task)
+        task.add_done_callback(player.ingest_tasks.discard)
+        return
+
+    deadline = ctx.interaction.created_at + INTERACTION_TTL if is_interaction else None
     try:
-        songs = await search_songs(search)
+        songs = await search_songs(search, guild_id=ctx.guild.id, deadline=deadline)
     except Exception as e:
         message = f'❌ 搜索音乐时发生错误: {e}'
         if is_interaction:
@@ -646,6 +2113,78 @@ async def play(ctx: commands.Context, *, search: str):
         player.add_song(song)
         await ctx.send(f"➕ 已加入播放列表：**[{song.title}]({song.webpage_url})**")
 
+# /play 的自動完成：只查記憶體中的標題索引，選取後送出的是影片連結，可直接命中快取而不必再搜尋
+@play.autocomplete('search')
+async def play_autocomplete(interaction: discord.Interaction, current: str) -> list:
+    if is_url(current):
+        return []
+    with AUTOCOMPLETE_LATENCY.time():
+        results = title_index.search(current, interaction.guild_id, limit=25)
+    return [
+        app_commands.Choice(name=title if len(title) <= 100 else title[:99] + '…', value=url)
+        for title, url in results
+        if len(url) <= 100
+    ]
+
+# 在背景解析並依序加入多首歌曲（/playmany 與 /playfile 共用）
+async def enqueue_many(ctx: commands.Context, queries: list, is_interaction: bool):
+    if not queries:
+        message = '❌ 沒有要加入的歌曲（每行或以 | 分隔一個網址或歌名）。'
+        if is_interaction:
+            await ctx.interaction.followup.send(message)
+        else:
+            await ctx.send(message)
+        return
+
+    player = await prepare_player(ctx, is_interaction)
+    if player is None:
+        return
+
+    dropped = max(0, len(queries) - PLAYMANY_MAX_ITEMS)
+    queries = queries[:PLAYMANY_MAX_ITEMS]
+    progress_message = await ctx.send(f"⏳ 正在解析 {len(queries)} 首歌曲…")
+    deadline = ctx.interaction.created_at + INTERACTION_TTL if is_interaction else None
+    task = asyncio.create_task(ingest_many(player, queries, progress_message, deadline, dropped))
+    player.ingest_tasks.add(task)
+    task.add_done_callback(player.ingest_tasks.discard)
+
+# 混合指令：一次加入多首歌曲
+@bot.hybrid_command(name='playmany', description='一次加入多首歌曲，每行（或以 | 分隔）一個網址或歌名。')
+async def playmany(ctx: commands.Context, *, queries: str):
+    is_interaction = hasattr(ctx, "interaction") and ctx.interaction is not None
+    if is_interaction:
+        await ctx.defer(ephemeral=False)
+    else:
+        await ctx.trigger_typing()
+    await enqueue_many(ctx, parse_queries(queries), is_interaction)
+
+# 混合指令：從文字檔附件加入多首歌曲
+@bot.hybrid_command(name='playfile', description='從文字檔附件一次加入多首歌曲，每行一個網址或歌名。')
+async def playfile(ctx: commands.Context, file: discord.Attachment):
+    is_interaction = hasattr(ctx, "interaction") and ctx.interaction is not None
+    if is_interaction:
+        await ctx.defer(ephemeral=False)
+    else:
+        await ctx.trigger_typing()
+
+    if file.size > PLAYMANY_MAX_FILE_BYTES:
+        message = f'❌ 檔案太大（上限 {PLAYMANY_MAX_FILE_BYTES // 1024} KB）。'
+        if is_interaction:
+            await ctx.interaction.followup.send(message)
+        else:
+            await ctx.send(message)
+        return
+    try:
+        text = (await file.read()).decode('utf-8-sig', errors='replace')
+    except discord.HTTPException as e:
+        message = f'❌ 無法讀取附件: {e}'
+        if is_interaction:
+            await ctx.interaction.followup.send(message)
+        else:
+            await ctx.send(message)
+        return
+    await enqueue_many(ctx, parse_queries(text), is_interaction)
+
 # 混合指令：暫停音樂
 @bot.hybrid_command(name='pause', description='暫停當前播放的音樂。')
 async def pause(ctx: commands.Context):
@@ -685,8 +2224,7 @@ async def loop_song(ctx: commands.Context):
     await ctx.defer()
     player = players.get(ctx.guild.id)
     if player:
-        player.loop_flag = not player.loop_flag
-        status = '啟用' if player.loop_flag else '停用'
+        status = '啟用' if player.toggle_loop() else '停用'
         await ctx.send(f'循環當前音樂已 {status}。')
     else:
         await ctx.send('目前沒有播放音樂。')
@@ -707,11 +2245,8 @@ async def queue_(ctx: commands.Context):
     await ctx.defer()  # 延迟响应
     player = players.get(ctx.guild.id)
     if player and not player.queue.empty():
-        upcoming = list(player.queue._queue)
-        msg = '播放清單:\n'
-        for i, song in enumerate(upcoming, 1):
-            msg += f'{i}. [{song.title}]({song.webpage_url})\n'
-        await ctx.send(msg)
+        view = QueueEmbedView(player, ctx)
+        await ctx.send(embed=view.generate_embed(), view=view)
     else:
         await ctx.send('播放清單為空。')
 
@@ -727,6 +2262,51 @@ async def queue_loop(ctx: commands.Context):
     else:
         await ctx.send('目前沒有播放音樂。')
 
+# 混合指令：從播放清單移除歌曲
+@bot.hybrid_command(name='remove', description='從播放清單中移除指定編號的歌曲。')
+async def remove(ctx: commands.Context, index: int):
+    await ctx.defer()  # 延迟响应
+    player = players.get(ctx.guild.id)
+    if not player or not 1 <= index <= len(player.queue):
+        await ctx.send('無效的歌曲編號。')
+        return
+    song = player.remove(index - 1)
+    await ctx.send(f'已移除：**[{song.title}]({song.webpage_url})**')
+
+# 混合指令：移動播放清單中的歌曲
+@bot.hybrid_command(name='move_song', description='將播放清單中的歌曲移動到指定位置。')
+async def move_song(ctx: commands.Context, source: int, destination: int):
+    await ctx.defer()  # 延迟响应
+    player = players.get(ctx.guild.id)
+    if not player or not 1 <= source <= len(player.queue) or not 1 <= destination <= len(player.queue):
+        await ctx.send('無效的歌曲編號。')
+        return
+    song = player.move(source - 1, destination - 1)
+    await ctx.send(f'已將 **[{song.title}]({song.webpage_url})** 移到第 {destination} 首。')
+
+# 混合指令：隨機排序播放清單
+@bot.hybrid_command(name='shuffle', description='隨機打亂播放清單的順序。')
+async def shuffle(ctx: commands.Context):
+    await ctx.defer()  # 延迟响应
+    player = players.get(ctx.guild.id)
+    if player and not player.queue.empty():
+        player.shuffle()
+        await ctx.send('🔀 已隨機打亂播放清單。')
+    else:
+        await ctx.send('播放清單為空。')
+
+# 混合指令：跳到指定歌曲
+@bot.hybrid_command(name='jump', description='直接跳到播放清單中指定編號的歌曲。')
+async def jump(ctx: commands.Context, index: int):
+    await ctx.defer()  # 延迟响应
+    player = players.get(ctx.guild.id)
+    if not player or not 1 <= index <= len(player.queue):
+        await ctx.send('無效的歌曲編號。')
+        return
+    song = player.queue[index - 1]
+    player.jump(index - 1)
+    await ctx.send(f'⏭️ 跳到：**[{song.title}]({song.webpage_url})**')
+
 # 混合指令：顯示幫助訊息
 @bot.hybrid_command(name='help', description='顯示所有可用指令及其說明。')
 async def help_command(ctx: commands.Context):
@@ -763,6 +2343,16 @@ async def help_command(ctx: commands.Context):
         value="**根據提供的 URL 或歌名搜尋並播放音樂。如果有正在播放的歌曲，則加入播放清單。**",
         inline=False
     )
+    embed.add_field(
+        name="**/playmany <多個歌名或URL>**",
+        value="**一次加入多首歌曲，以 | 分隔（文字指令可每行一首），依原本順序加入播放清單。**",
+        inline=False
+    )
+    embed.add_field(
+        name="**/playfile <文字檔>**",
+        value="**從文字檔附件一次加入多首歌曲，每行一個歌名或 URL。**",
+        inline=False
+    )
     embed.add_field(
         name="**/pause**",
         value="**暫停當前播放的音樂。**",
@@ -798,8 +2388,32 @@ async def help_command(ctx: commands.Context):
         value="**循環播放整個播放清單。**",
         inline=False
     )
+    embed.add_field(
+        name="**/remove <編號>** • **/move_song <編號> <位置>**",
+        value="**移除播放清單中的歌曲，或將歌曲移動到指定位置。**",
+        inline=False
+    )
+    embed.add_field(
+        name="**/shuffle** • **/jump <編號>**",
+        value="**隨機打亂播放清單，或直接跳到指定的歌曲。**",
+        inline=False
+    )
     embed.set_footer(text="使用上述指令來控制音樂播放。")
     await ctx.send(embed=embed)
 
 # 啟動機器人
-bot.run(TOKEN)
+if __name__ == '__main__':
+    try:
+        bot.run(TOKEN, log_handler=None)  # 日誌已由 setup_logging 設定
+    finally:
+        extraction_pool.shutdown()
+        ffmpeg_supervisor.shutdown()
+        if state_store:
+            state_store.write(collect_player_state())
+        metadata_cache.flush()
+        title_index.flush()
+        if loudness_cache:
+            loudness_cache.shutdown()
+            loudness_cache.flush()
+        if audio_cache:
+            audio_cache.shutdown()
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger('discord')
+
+_YOUTUBE_ID = re.compile(r'(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([0-9A-Za-z_-]{11})')
+_WHITESPACE = re.compile(r'\s+')
+
+
+# 將各種 YouTube 連結格式統一成同一個鍵
+def canonical_url(url: str) -> str:
+    match = _YOUTUBE_ID.search(url)
+    if match and ('youtube.com' in url or 'youtu.be' in url):
+        return f'https://www.youtube.com/watch?v={match.group(1)}'
+    return url.strip()
+
+
+def video_id(url: str):
+    match = _YOUTUBE_ID.search(url or '')
+    return match.group(1) if match else None
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE.sub(' ', query.strip().lower())
+
+
+# 從 googlevideo 串流網址的 expire 參數取得到期時間（epoch 秒），取不到則回傳 None
+def stream_expiry(url: str):
+    try:
+        expire = parse_qs(urlparse(url).query).get('expire')
+        return float(expire[0]) if expire else None
+    except (ValueError, TypeError):
+        return None
+
+
+class _Entry:
+    __slots__ = ('songs', 'expires', 'stream_expires')
+
+    def __init__(self, songs, expires, stream_expires):
+        self.songs = songs                  # 歌曲資料（dict 列表）
+        self.expires = expires              # 中繼資料到期時間
+        self.stream_expires = stream_expires  # 串流網址到期時間
+
+
+# 搜尋與網址解析結果的快取：以 LRU 限制數量，中繼資料與串流網址各自有 TTL，並可存到 SQLite
+class MetadataCache:
+    def __init__(self, path: str = None, max_entries: int = 2048,
+                 metadata_ttl: float = 86400, stream_ttl: float = 4 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.metadata_ttl = metadata_ttl
+        self.stream_ttl = stream_ttl
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_streams = 0
+        self.evictions = 0
+
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # 不影響 LRU 順序與命中統計
+    def __contains__(self, key: str):
+        return key in self._entries
+
+    def get(self, key: str, need_stream: bool = True):
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires <= now:
+            self._remove(key)
+            self.misses += 1
+            return None
+        if need_stream and entry.stream_expires <= now:
+            # 中繼資料仍有效，但串流網址已過期，需要重新解析
+            self.stale_streams += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._dirty.add(key)  # 更新持久化檔案中的最近使用時間
+        self.hits += 1
+        return entry.songs
+
+    def put(self, key: str, songs: list):
+        now = time.time()
+        stream_expires = now + self.stream_ttl
+        for song in songs:
+            expire = stream_expiry(song.get('source_url') or '')
+            if expire is not None:
+                # 預留五分鐘緩衝，避免播放途中網址失效
+                stream_expires = min(stream_expires, expire - 300)
+        self._entries[key] = _Entry(songs, now + self.metadata_ttl, stream_expires)
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._dirty.discard(key)
+        self._deleted.add(key)
+
+    # 所有未過期項目中的歌曲資料（不影響 LRU 順序與命中統計）
+    def songs(self):
+        now = time.time()
+        for entry in list(self._entries.values()):
+            if entry.expires > now:
+                yield from entry.songs
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_streams': self.stale_streams,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    # --- 持久化 ---
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires REAL NOT NULL, '
+            'stream_expires REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        return conn
+
+    def load(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    rows = conn.execute(
+                        'SELECT key, payload, expires, stream_expires FROM entries '
+                        'WHERE expires > ? ORDER BY last_access DESC LIMIT ?',
+                        (time.time(), self.max_entries)
+                    ).fetchall()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"讀取快取檔案時發生錯誤: {e}")
+            return
+        # 由舊到新放入，使最近使用的項目位於 LRU 尾端
+        for key, payload, expires, stream_expires in reversed(rows):
+            self._entries[key] = _Entry(json.loads(payload), expires, stream_expires)
+        logger.info(f"已從 {self.path} 載入 {len(rows)} 筆快取")
+
+    # 在事件迴圈上收集待寫入的變更，實際寫入交給 write()
+    def collect_changes(self):
+        now = time.time()
+        rows = [
+            (key, json.dumps(entry.songs, ensure_ascii=False), entry.expires, entry.stream_expires, now)
+            for key in self._dirty
+            if (entry := self._entries.get(key)) is not None
+        ]
+        deleted = list(self._deleted)
+        self._dirty.clear()
+        self._deleted.clear()
+        return rows, deleted
+
+    def write(self, rows, deleted):
+        if not self.path or (not rows and not deleted):
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in deleted])
+                        conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', rows)
+                        conn.execute('DELETE FROM entries WHERE expires <= ?', (time.time(),))
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"寫入快取檔案時發生錯誤: {e}")
+
+    def flush(self):
+        self.write(*self.collect_changes())
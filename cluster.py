@@ -0,0 +1,262 @@
+import asyncio
+import itertools
+import json
+import logging
+
+logger = logging.getLogger('discord')
+
+MAX_MESSAGE = 4 * 1024 * 1024
+
+
+# 解析分片 ID 設定，例如 "0-3,8,10-11"
+def parse_shard_ids(text: str) -> list:
+    shard_ids = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        if sep:
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+
+def format_shard_ids(shard_ids) -> str:
+    shard_ids = sorted(shard_ids)
+    if not shard_ids:
+        return ''
+    if shard_ids == list(range(shard_ids[0], shard_ids[-1] + 1)):
+        return f'{shard_ids[0]}-{shard_ids[-1]}' if len(shard_ids) > 1 else str(shard_ids[0])
+    return ','.join(map(str, shard_ids))
+
+
+# 將 total 個分片平均分給 clusters 個行程（每個行程一段連續範圍）
+def shard_ranges(total: int, clusters: int) -> list:
+    clusters = max(1, min(clusters, total))
+    size, extra = divmod(total, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class IPCError(Exception):
+    pass
+
+
+# 一條 IPC 連線：每行一個 JSON 訊息 {"op", "id", "data"}；
+# 帶 id 的訊息需要回覆（op 為 "reply"，id 相同），handlers 依 op 處理收到的請求
+class IPCConnection:
+    _ids = itertools.count(1)
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handlers: dict):
+        self.reader = reader
+        self.writer = writer
+        self.handlers = handlers
+        self._pending = {}
+        self._lock = asyncio.Lock()
+        self.closed = False
+
+    async def send(self, op: str, data=None, request_id=None):
+        message = {'op': op, 'data': data}
+        if request_id is not None:
+            message['id'] = request_id
+        payload = json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n'
+        async with self._lock:
+            self.writer.write(payload)
+            await self.writer.drain()
+
+    async def request(self, op: str, data=None, timeout: float = 5.0):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.send(op, data, request_id)
+            reply = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        if isinstance(reply, dict) and reply.get('error'):
+            raise IPCError(reply['error'])
+        return reply
+
+    async def read_message(self):
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    async def serve(self):
+        try:
+            while True:
+                message = await self.read_message()
+                if message is None:
+                    break
+                op = message.get('op')
+                if op == 'reply':
+                    future = self._pending.get(message.get('id'))
+                    if future is not None and not future.done():
+                        future.set_result(message.get('data'))
+                    continue
+                asyncio.create_task(self._dispatch(message))
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"IPC 連線中斷: {e}")
+        finally:
+            self.close()
+
+    async def _dispatch(self, message: dict):
+        op = message.get('op')
+        handler = self.handlers.get(op)
+        try:
+            if handler is None:
+                raise IPCError(f'未知的 IPC 指令: {op}')
+            result = await handler(message.get('data'))
+        except Exception as e:
+            if message.get('id') is None:
+                logger.error(f"處理 IPC 訊息 {op} 時發生錯誤: {e}")
+                return
+            result = {'error': str(e)}
+        if message.get('id') is not None:
+            try:
+                await self.send('reply', result, message['id'])
+            except ConnectionError:
+                pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('IPC 連線已關閉'))
+        self.writer.close()
+
+
+# 啟動器端：接受各叢集行程的連線，保存它們回報的狀態
+class IPCServer:
+    def __init__(self, secret: str):
+        self.secret = secret
+        self.connections = {}   # cluster_id -> IPCConnection
+        self.stats = {}         # cluster_id -> 最近一次回報的狀態
+        self.handlers = {
+            'stats': self._on_stats,
+            'cluster_stats': self._on_cluster_stats,
+        }
+        self._server = None
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_MESSAGE)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        connection = IPCConnection(reader, writer, {})
+        try:
+            hello = await asyncio.wait_for(connection.read_message(), timeout=10)
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            hello = None
+        if not hello or hello.get('op') != 'hello' or (hello.get('data') or {}).get('secret') != self.secret:
+            logger.warning("拒絕未通過驗證的 IPC 連線")
+            connection.close()
+            return
+        cluster_id = hello['data']['cluster_id']
+        previous = self.connections.get(cluster_id)
+        if previous is not None:
+            previous.close()
+        connection.handlers = {op: (lambda data, h=handler: h(cluster_id, data)) for op, handler in self.handlers.items()}
+        self.connections[cluster_id] = connection
+        logger.info(f"叢集 {cluster_id} 已連線")
+        await connection.serve()
+        if self.connections.get(cluster_id) is connection:
+            del self.connections[cluster_id]
+            logger.info(f"叢集 {cluster_id} 已斷線")
+
+    async def _on_stats(self, cluster_id, data):
+        self.stats[cluster_id] = data
+
+    async def _on_cluster_stats(self, cluster_id, data):
+        return {str(cid): stats for cid, stats in sorted(self.stats.items())}
+
+    async def request(self, cluster_id: int, op: str, data=None, timeout: float = 5.0):
+        connection = self.connections.get(cluster_id)
+        if connection is None:
+            raise IPCError(f'叢集 {cluster_id} 未連線')
+        return await connection.request(op, data, timeout)
+
+    async def broadcast(self, op: str, data=None, timeout: float = 5.0) -> dict:
+        cluster_ids = list(self.connections)
+        results = await asyncio.gather(
+            *(self.request(cluster_id, op, data, timeout) for cluster_id in cluster_ids),
+            return_exceptions=True
+        )
+        return dict(zip(cluster_ids, results))
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        for connection in list(self.connections.values()):
+            connection.close()
+
+
+# 叢集行程端：連到啟動器、定期回報狀態，斷線時自動重連
+class IPCClient:
+    def __init__(self, address: str, secret: str, cluster_id: int, stats_provider, interval: float = 10.0):
+        host, _, port = address.rpartition(':')
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self.secret = secret
+        self.cluster_id = cluster_id
+        self.stats_provider = stats_provider
+        self.interval = interval
+        self.handlers = {}
+        self.connection = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_MESSAGE)
+                self.connection = IPCConnection(reader, writer, self.handlers)
+                await self.connection.send('hello', {'cluster_id': self.cluster_id, 'secret': self.secret})
+                delay = 1.0
+                reporter = asyncio.create_task(self._report())
+                try:
+                    await self.connection.serve()
+                finally:
+                    reporter.cancel()
+            except asyncio.CancelledError:
+                break
+            except OSError as e:
+                logger.warning(f"無法連線到叢集啟動器 {self.host}:{self.port}: {e}")
+            self.connection = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _report(self):
+        while True:
+            try:
+                await self.connection.send('stats', self.stats_provider())
+            except ConnectionError:
+                return
+            except Exception as e:
+                logger.warning(f"回報叢集狀態失敗: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def request(self, op: str, data=None, timeout: float = 5.0):
+        if self.connection is None or self.connection.closed:
+            raise IPCError('尚未連線到叢集啟動器')
+        return await self.connection.request(op, data, timeout)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.connection is not None:
+            self.connection.close()
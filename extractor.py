@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import yt_dlp
+
+logger = logging.getLogger('discord')
+
+# yt-dlp 第一次建立 YoutubeDL 時載入外掛，舊版相容路徑會把 sys.modules['extractor'] 換成它的外掛模組，
+# 與本模組同名；之後 process 模式無法以名稱序列化 extract_info。匯入時先讓它載入完再放回本模組
+_module = sys.modules[__name__]
+with yt_dlp.YoutubeDL({'quiet': True}):
+    pass
+sys.modules[__name__] = _module
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+_local = threading.local()
+
+
+# 每個工作執行緒/子行程依設定重用同一個 YoutubeDL，省去每次建立的成本
+def _get_ytdl(ytdl_opts: dict):
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+    key = repr(sorted(ytdl_opts.items()))
+    ytdl = instances.get(key)
+    if ytdl is None:
+        ytdl = instances[key] = yt_dlp.YoutubeDL(ytdl_opts)
+    return ytdl
+
+
+# 在工作執行緒/子行程中執行的 yt-dlp 解析（必須是頂層函式，才能被 process pool 序列化）
+def extract_info(ytdl_opts: dict, query: str) -> dict:
+    ytdl = _get_ytdl(ytdl_opts)
+    try:
+        info = ytdl.extract_info(query, download=False)
+    except yt_dlp.utils.DownloadError as e:
+        # 原本的例外帶著無法序列化的 exc_info，process 模式送回主行程時只會變成 PicklingError
+        raise yt_dlp.utils.DownloadError(str(e)) from None
+    return ytdl.sanitize_info(info)
+
+
+# 子行程的日誌：紀錄送回主行程，由主行程的 discord logger 處理（寫檔、主控台）
+def _init_worker(log_queue):
+    logger = logging.getLogger('discord')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _ready():
+    return None
+
+
+# 在主行程中把子行程送回的紀錄交給同名的 logger
+class _ForwardHandler(logging.Handler):
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'future')
+
+    def __init__(self, func, args, future):
+        self.func = func
+        self.args = args
+        self.future = future
+
+
+# 解析工作池：限制同時解析數量，並以伺服器為單位輪流排程，避免單一伺服器洗版 /play 餓死其他伺服器
+# process 模式以 fork 建立子行程：spawn/forkserver 的子行程會重新匯入主程式（bot.py），
+# 重複執行設定日誌、開啟 SQLite 快取等匯入時的初始化；不支援 fork 的平台（Windows）改用 thread 模式。
+# 對已有其他執行緒的行程 fork，子行程可能卡在 fork 當下被持有的鎖（logging、sqlite、yt-dlp），
+# 因此子行程在建構時就全部建立，必須在任何執行緒啟動（設定日誌、連線 Discord）之前建構；
+# 之後子行程異常結束也不會重新 fork，而是改用 thread 模式
+class ExtractionPool:
+    def __init__(self, max_workers: int = 4, mode: str = 'thread', timeout: float = 30.0):
+        self.max_workers = max(1, max_workers)
+        if mode == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning("此平台不支援 fork，EXTRACT_MODE=process 改用 thread 模式")
+            mode = 'thread'
+        self.mode = mode
+        self.timeout = timeout
+        self._executor = None
+        self._log_listener = None
+        self._queues = {}          # guild_id -> deque[_Job]
+        self._order = deque()      # 有待處理工作的 guild_id，輪流取用
+        self._running = 0
+        if mode == 'process':
+            self._start_processes()
+
+    def _start_processes(self):
+        context = multiprocessing.get_context('fork')
+        log_queue = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=context, initializer=_init_worker, initargs=(log_queue,)
+        )
+        # fork 模式下第一次提交工作時會一次建立所有子行程，等它完成再啟動其他執行緒
+        self._executor.submit(_ready).result()
+        self._log_listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+        self._log_listener.start()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ytdl')
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    async def run(self, guild_id, func, *args, timeout: float = None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = deque()
+            self._order.append(guild_id)
+        queue.append(_Job(func, args, future))
+        self._dispatch(loop)
+
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # wait_for 已取消 future；尚未開始的工作會在派發時被略過
+            raise ExtractionTimeout(f'解析逾時（{timeout:g} 秒）')
+
+    def _dispatch(self, loop):
+        while self._running < self.max_workers and self._order:
+            guild_id = self._order.popleft()
+            queue = self._queues[guild_id]
+            job = queue.popleft()
+            if queue:
+                self._order.append(guild_id)
+            else:
+                del self._queues[guild_id]
+
+            if job.future.done():
+                # 請求者已取消或逾時
+                continue
+
+            self._running += 1
+            try:
+                cf = loop.run_in_executor(self._get_executor(), job.func, *job.args)
+            except Exception as e:
+                self._running -= 1
+                job.future.set_exception(e)
+                continue
+            cf.add_done_callback(partial(self._on_done, job, loop))
+
+    def _on_done(self, job, loop, cf):
+        # 工作實際結束後才釋放名額，逾時的工作仍佔用執行緒直到完成
+        self._running -= 1
+        if self.mode == 'process' and not cf.cancelled() and isinstance(cf.exception(), BrokenProcessPool):
+            # 子行程異常結束；此時已有其他執行緒，重新 fork 並不安全
+            logger.error("解析子行程已失效，改用 thread 模式")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.mode = 'thread'
+        if not job.future.done():
+            if cf.cancelled():
+                job.future.cancel()
+            elif cf.exception() is not None:
+                job.future.set_exception(cf.exception())
+            else:
+                job.future.set_result(cf.result())
+        self._dispatch(loop)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+# 合併同時進行的相同請求：同一個 key 只執行一次 factory()，其他呼叫者等待同一個結果（或例外）
+# - 每個呼叫者各自的逾時與取消只影響自己；所有呼叫者都離開後才取消共用的工作
+# - 工作完成後立即移出表格，之後的呼叫會重新執行（結果的保存交給快取）
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def run(self, key, factory, timeout: float = None):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(factory()))
+            call.task.add_done_callback(lambda task: self._forget(key, call))
+        call.waiters += 1
+        try:
+            # shield：單一呼叫者被取消或逾時時不會連帶取消共用的工作
+            return await asyncio.wait_for(asyncio.shield(call.task), timeout)
+        except asyncio.TimeoutError:
+            if call.task.done():
+                raise
+            raise ExtractionTimeout(f'解析逾時（{timeout:g} 秒）')
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
@@ -0,0 +1,306 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+import discord
+
+logger = logging.getLogger('discord')
+
+# 數字越小越優先：正在等待播放的歌曲優先於預先載入的下一首，背景分析（例如響度測量）最後
+PRIORITY_PLAY = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_ANALYSIS = 2
+ROLES = {PRIORITY_PLAY: 'play', PRIORITY_PREFETCH: 'prefetch', PRIORITY_ANALYSIS: 'analysis'}
+
+try:
+    _CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _CLOCK_TICKS = _PAGE_SIZE = None
+
+
+# 從 /proc 讀取行程累計的 CPU 時間（秒）與常駐記憶體（位元組）；非 Linux 或行程已結束時回傳 None
+def read_process_usage(pid: int):
+    if _CLOCK_TICKS is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            statm = f.read()
+    except OSError:
+        return None
+    # 行程名稱可能含空白，從最後一個右括號之後開始切（第 3 欄 state 起算）
+    fields = stat[stat.rindex(b')') + 2:].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu_seconds, int(statm.split()[1]) * _PAGE_SIZE
+
+
+class FFmpegBusy(Exception):
+    pass
+
+
+class ProcessHandle:
+    _ids = itertools.count(1)
+
+    __slots__ = ('id', 'guild_id', 'priority', 'source', 'process', 'preempt', 'started',
+                 'released', 'cpu_seconds', 'cpu_percent', 'rss', '_sampled')
+
+    def __init__(self, guild_id, priority, process, preempt):
+        self.id = next(self._ids)
+        self.guild_id = guild_id
+        self.priority = priority
+        self.source = None
+        self.process = process    # subprocess.Popen；非 FFmpeg 音源為 None
+        self.preempt = preempt    # 需要讓出名額時呼叫，參數為 source
+        self.started = time.monotonic()
+        self.released = False
+        self.cpu_seconds = None
+        self.cpu_percent = None
+        self.rss = None
+        self._sampled = None      # (cpu_seconds, monotonic)
+
+    @property
+    def role(self) -> str:
+        return ROLES.get(self.priority, str(self.priority))
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+
+# 受管理的音源：cleanup 時（可能在語音執行緒中）歸還名額
+class ManagedSource(discord.AudioSource):
+    def __init__(self, original: discord.AudioSource, handle: ProcessHandle, supervisor):
+        self.original = original
+        self.handle = handle
+        self.supervisor = supervisor
+
+    @property
+    def closed(self) -> bool:
+        return self.handle.released
+
+    def read(self) -> bytes:
+        return self.original.read()
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self):
+        try:
+            self.original.cleanup()
+        finally:
+            self.supervisor.release(self.handle)
+
+
+# FFmpeg 行程的集中管理：
+# - 全域最多 max_processes 個解碼行程（0 表示不限制），名額用完時依優先順序排隊，
+#   等待播放的請求會先讓預先載入的行程讓出名額
+# - 記錄每個行程的 CPU 與記憶體用量（sample）
+# - 清除沒有被任何播放器使用的行程（reap）
+class FFmpegSupervisor:
+    def __init__(self, max_processes: int = 0, acquire_timeout: float = 30.0):
+        self.max_processes = max_processes
+        self.acquire_timeout = acquire_timeout
+        self.handles = {}       # id -> ProcessHandle
+        self._reserved = 0      # 已占用的名額（含正在啟動中的行程）
+        self._waiters = []      # heap: (priority, 序號, future)
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+
+        self.spawned = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.preempted = 0
+        self.reaped = 0
+
+    @property
+    def in_use(self) -> int:
+        return self._reserved
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _has_slot(self) -> bool:
+        return self.max_processes <= 0 or self._reserved < self.max_processes
+
+    async def _acquire(self, priority: int):
+        if self._has_slot() and not self.waiting:
+            self._reserved += 1
+            return
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.waits += 1
+        if priority == PRIORITY_PLAY:
+            self._preempt()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise FFmpegBusy(f'FFmpeg 行程已達上限（{self.max_processes}），等待 {self.acquire_timeout:g} 秒仍無空位')
+        except BaseException:
+            # 名額剛好在取消時交給了這個請求，歸還給下一位
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            self.wait_seconds += time.monotonic() - started
+
+    # 請預先載入的行程（最早建立的優先）讓出名額
+    def _preempt(self):
+        candidates = [h for h in self.handles.values() if h.priority > PRIORITY_PLAY and h.preempt and not h.released]
+        if not candidates:
+            return
+        handle = min(candidates, key=lambda h: (-h.priority, h.started))
+        self.preempted += 1
+        logger.info(f"FFmpeg 名額不足，釋放伺服器 {handle.guild_id} 預先載入的音源")
+        try:
+            handle.preempt(handle.source)
+        except Exception as e:
+            logger.warning(f"釋放預先載入的音源時發生錯誤: {e}")
+            handle.source.cleanup()
+
+    def _release_slot(self):
+        self._reserved -= 1
+        while self._waiters and self._has_slot():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._reserved += 1
+            future.set_result(None)
+
+    # 取得名額後呼叫 factory() 建立音源；失敗時立即歸還名額
+    async def open(self, guild_id, priority: int, factory, preempt=None) -> ManagedSource:
+        self._loop = asyncio.get_running_loop()
+        await self._acquire(priority)
+        try:
+            source = await factory()
+        except BaseException:
+            self._release_slot()
+            raise
+        handle = ProcessHandle(guild_id, priority, getattr(source, '_process', None), preempt)
+        handle.source = ManagedSource(source, handle, self)
+        self.handles[handle.id] = handle
+        self.spawned += 1
+        return handle.source
+
+    # 只占用名額、不經過音源的 FFmpeg 行程（例如響度分析）
+    @contextlib.asynccontextmanager
+    async def reserve(self, priority: int = PRIORITY_ANALYSIS):
+        self._loop = asyncio.get_running_loop()
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    # 預先載入的音源開始播放後不再能被搶占
+    def promote(self, source):
+        handle = getattr(source, 'handle', None)
+        if handle is not None:
+            handle.priority = PRIORITY_PLAY
+            handle.preempt = None
+
+    def release(self, handle: ProcessHandle):
+        with self._lock:
+            if handle.released:
+                return
+            handle.released = True
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._finish(handle)
+            return
+        try:
+            loop.call_soon_threadsafe(self._finish, handle)
+        except RuntimeError:
+            pass  # 事件迴圈已關閉
+
+    def _finish(self, handle: ProcessHandle):
+        if self.handles.pop(handle.id, None) is not None:
+            self._release_slot()
+
+    def sample(self):
+        now = time.monotonic()
+        for handle in list(self.handles.values()):
+            if handle.process is None:
+                continue
+            usage = read_process_usage(handle.process.pid)
+            if usage is None:
+                continue
+            cpu_seconds, handle.rss = usage
+            if handle._sampled is not None:
+                previous, sampled_at = handle._sampled
+                if now > sampled_at:
+                    handle.cpu_percent = (cpu_seconds - previous) / (now - sampled_at) * 100
+            handle._sampled = (cpu_seconds, now)
+            handle.cpu_seconds = cpu_seconds
+
+    # is_orphan(handle) 判斷行程是否已沒有播放器在使用；剛建立不到 grace 秒的行程可能還沒交給播放器，不檢查
+    def reap(self, is_orphan, grace: float = 30.0) -> int:
+        now = time.monotonic()
+        reaped = 0
+        for handle in list(self.handles.values()):
+            if handle.released or now - handle.started < grace:
+                continue
+            try:
+                orphan = is_orphan(handle)
+            except Exception as e:
+                logger.warning(f"檢查 FFmpeg 行程時發生錯誤: {e}")
+                continue
+            if orphan:
+                logger.warning(f"清除未被使用的 FFmpeg 行程（伺服器 {handle.guild_id}，PID {handle.pid}，{handle.role}）")
+                handle.source.cleanup()
+                reaped += 1
+        self.reaped += reaped
+        return reaped
+
+    def table(self) -> list:
+        return [
+            {
+                'guild_id': handle.guild_id,
+                'role': handle.role,
+                'pid': handle.pid,
+                'age': time.monotonic() - handle.started,
+                'cpu_percent': handle.cpu_percent,
+                'rss': handle.rss,
+            }
+            for handle in self.handles.values()
+        ]
+
+    def stats(self) -> dict:
+        return {
+            'processes': len(self.handles),
+            'in_use': self._reserved,
+            'max_processes': self.max_processes,
+            'waiting': self.waiting,
+            'spawned': self.spawned,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'preempted': self.preempted,
+            'reaped': self.reaped,
+            'cpu_percent': sum(handle.cpu_percent or 0 for handle in self.handles.values()),
+            'rss': sum(handle.rss or 0 for handle in self.handles.values()),
+        }
+
+    # 關閉時結束所有行程
+    def shutdown(self):
+        for handle in list(self.handles.values()):
+            try:
+                handle.source.cleanup()
+            except Exception as e:
+                logger.warning(f"結束 FFmpeg 行程時發生錯誤: {e}")
@@ -0,0 +1,210 @@
+# 多行程分片啟動器
+#
+# 用法：
+#   python launcher.py --clusters 4 [--shards auto|16] [--ipc-port 0]
+#
+# 把所有分片平均分給多個 bot.py 行程（叢集），每個行程以 AutoShardedBot 執行自己的分片範圍，
+# 各自擁有獨立的播放器、事件迴圈與 CPU 核心。啟動器透過本機 IPC 收集各叢集的狀態、
+# 轉送管理指令，並在叢集意外結束時自動重新啟動。
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from cluster import IPCServer, format_shard_ids, shard_ranges
+from log_setup import setup_logging
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+
+# bot.py 會寫入的檔案與其預設路徑（與 bot.py 相同）；每個叢集改用自己的檔案，
+# 避免多個行程同時讀寫同一個 SQLite 檔，或一個叢集的過期/淘汰刪掉其他叢集仍在使用的資料
+CLUSTER_FILES = {
+    'CACHE_PATH': os.path.join('data', 'metadata_cache.sqlite3'),
+    'COMMAND_SYNC_STATE': os.path.join('data', 'command_sync.json'),
+    'STATE_PATH': os.path.join('data', 'player_state.sqlite3'),
+    'TITLE_INDEX_PATH': os.path.join('data', 'title_index.sqlite3'),
+    'LOUDNESS_PATH': os.path.join('data', 'loudness.sqlite3'),
+}
+
+logger = logging.getLogger('discord')
+
+
+# 向 Discord 查詢建議的分片數量
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            'https://discord.com/api/v10/gateway/bot',
+            headers={'Authorization': f'Bot {token}'}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return int(data['shards'])
+
+
+class ClusterProcess:
+    def __init__(self, cluster_id: int, shard_ids: list, shard_count: int, env: dict):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.env = env
+        self.process = None
+        self.restarts = 0
+        self.started_at = None
+        self.stopping = False
+        self.restart_requested = False
+
+    def cluster_env(self) -> dict:
+        env = dict(os.environ)
+        env.update(self.env)
+        env.update({
+            'SHARD_COUNT': str(self.shard_count),
+            'SHARD_IDS': format_shard_ids(self.shard_ids),
+            'CLUSTER_ID': str(self.cluster_id),
+        })
+        # 每個行程各自的日誌檔、指標埠、音訊快取目錄與資料檔，避免互相覆寫
+        env['LOG_FILE'] = f"bot.cluster{self.cluster_id}.log"
+        for name, default in CLUSTER_FILES.items():
+            path = env.get(name, default)
+            if path:  # 留空表示停用，維持原樣
+                root, ext = os.path.splitext(path)
+                env[name] = f'{root}.cluster{self.cluster_id}{ext}'
+        metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        if metrics_port:
+            env['METRICS_PORT'] = str(metrics_port + self.cluster_id)
+        if os.getenv('AUDIO_CACHE_DIR'):
+            env['AUDIO_CACHE_DIR'] = os.path.join(os.getenv('AUDIO_CACHE_DIR'), f'cluster{self.cluster_id}')
+        return env
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=self.cluster_env(), cwd=os.path.dirname(BOT_SCRIPT)
+        )
+        self.started_at = time.monotonic()
+        logger.info(f"叢集 {self.cluster_id} 已啟動（PID {self.process.pid}，分片 {format_shard_ids(self.shard_ids)}）")
+
+    # 監看行程，意外結束時以遞增的間隔重新啟動
+    async def supervise(self):
+        delay = 5.0
+        while True:
+            code = await self.process.wait()
+            if self.stopping:
+                return
+            if self.restart_requested:
+                self.restart_requested = False
+                logger.info(f"叢集 {self.cluster_id} 依要求重新啟動")
+                wait = 0
+            else:
+                if time.monotonic() - self.started_at > 300:
+                    delay = 5.0  # 穩定執行一段時間後才重設間隔
+                logger.warning(f"叢集 {self.cluster_id} 已結束（代碼 {code}），{delay:.0f} 秒後重新啟動")
+                wait = delay
+                delay = min(delay * 2, 300.0)
+            await asyncio.sleep(wait)
+            if self.stopping:
+                return
+            self.restarts += 1
+            await self.start()
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def run(args):
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        logger.critical("缺少 DISCORD_TOKEN 環境變數。請檢查 .env 文件。")
+        return 1
+
+    shard_count = await recommended_shards(token) if args.shards == 'auto' else int(args.shards)
+    ranges = shard_ranges(shard_count, args.clusters)
+    logger.info(f"共 {shard_count} 個分片，分成 {len(ranges)} 個叢集")
+
+    secret = secrets.token_hex(16)
+    server = IPCServer(secret)
+    clusters = {}
+
+    async def restart_cluster(cluster_id, data):
+        target = clusters.get(int(data['cluster_id']))
+        if target is None:
+            raise ValueError(f"沒有叢集 {data['cluster_id']}")
+        target.restart_requested = True
+        try:
+            await server.request(target.cluster_id, 'shutdown', timeout=10)
+        except Exception:
+            target.terminate()
+        return {'ok': True}
+
+    server.handlers['restart'] = restart_cluster
+    port = await server.start('127.0.0.1', args.ipc_port)
+    env = {'IPC_ADDRESS': f'127.0.0.1:{port}', 'IPC_SECRET': secret, 'CLUSTER_COUNT': str(len(ranges))}
+
+    for cluster_id, shard_ids in enumerate(ranges):
+        clusters[cluster_id] = ClusterProcess(cluster_id, shard_ids, shard_count, env)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows 不支援，改由 KeyboardInterrupt 結束
+
+    supervisors = []
+    for cluster in clusters.values():
+        await cluster.start()
+        supervisors.append(asyncio.create_task(cluster.supervise()))
+        # 依序啟動，避免同時 IDENTIFY 觸發速率限制
+        await asyncio.sleep(args.stagger)
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("正在關閉所有叢集…")
+        for cluster in clusters.values():
+            cluster.stopping = True
+        # 先請各叢集自行關閉（寫入快取），逾時才強制結束
+        await server.broadcast('shutdown', timeout=5)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.process.wait() for c in clusters.values() if c.process)),
+                timeout=20
+            )
+        except asyncio.TimeoutError:
+            for cluster in clusters.values():
+                cluster.terminate()
+        for task in supervisors:
+            task.cancel()
+        server.close()
+    return 0
+
+
+def main():
+    load_dotenv(dotenv_path='api.env')
+    parser = argparse.ArgumentParser(description='以多個行程執行分片叢集')
+    parser.add_argument('--clusters', type=int, default=int(os.getenv('CLUSTER_COUNT', '2')), help='行程數量')
+    parser.add_argument('--shards', default=os.getenv('SHARD_COUNT', 'auto'), help='總分片數，auto 表示依 Discord 建議')
+    parser.add_argument('--ipc-port', type=int, default=int(os.getenv('IPC_PORT', '0')), help='IPC 埠（0 表示自動選擇）')
+    parser.add_argument('--stagger', type=float, default=5.0, help='依序啟動叢集的間隔秒數')
+    args = parser.parse_args()
+
+    setup_logging(
+        directory=os.getenv('LOG_DIR', 'log'),
+        filename='launcher.log',
+        console_level=os.getenv('LOG_CONSOLE_LEVEL', 'INFO'),
+    )
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+# 解析 "name=value,name=value" 格式的設定
+def parse_mapping(text: str) -> dict:
+    result = {}
+    for item in (text or '').split(','):
+        name, sep, value = item.partition('=')
+        if sep and name.strip() and value.strip():
+            result[name.strip()] = value.strip()
+    return result
+
+
+def parse_level(level, default=logging.INFO) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    return value if isinstance(value, int) else default
+
+
+# 對嘈雜的 logger 做速率限制：每個 logger 名稱一個 token bucket，
+# WARNING 以上的紀錄一律放行；被略過的筆數會附加在下一筆放行的紀錄後面
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limits: dict):
+        super().__init__()
+        self.limits = {name: float(rate) for name, rate in limits.items()}
+        self._buckets = {}  # logger 名稱 -> [tokens, 上次補充時間, 略過筆數]
+        self._lock = threading.Lock()
+
+    def _limit_for(self, name: str):
+        # 以最長的前綴比對，例如 discord.gateway 也套用到 discord.gateway.xxx
+        while name:
+            if name in self.limits:
+                return name, self.limits[name]
+            name = name.rpartition('.')[0]
+        return None, None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key, rate = self._limit_for(record.name)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [rate, now, 0]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+        if dropped:
+            record.msg = f'{record.getMessage()} （已略過 {dropped} 筆 {key} 日誌）'
+            record.args = None
+        return True
+
+
+# 不在呼叫端格式化紀錄，格式化與寫檔都交給背景執行緒
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+def _file_handler(path: str, rotate: str, max_bytes: int, backup_count: int, when: str):
+    if rotate == 'time':
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+
+
+# 設定 discord logger：呼叫端只把紀錄放進佇列，由 QueueListener 的背景執行緒寫入檔案與主控台
+def setup_logging(directory: str = 'log', filename: str = 'bot.log', file_level='INFO', console_level='INFO',
+                  rotate: str = 'size', max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  when: str = 'midnight', levels: dict = None, rate_limits: dict = None):
+    handlers = []
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        file_handler = _file_handler(os.path.join(directory, filename), rotate, max_bytes, backup_count, when)
+        file_handler.setLevel(parse_level(file_level))
+        file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+        handlers.append(file_handler)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(parse_level(console_level))
+    console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s'))
+    handlers.append(console_handler)
+
+    queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+    if rate_limits:
+        queue_handler.addFilter(RateLimitFilter(rate_limits))
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+
+    logger = logging.getLogger('discord')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    # logger 本身只放行處理器會用到的最低等級，避免建立沒人要的 DEBUG 紀錄
+    logger.setLevel(min(handler.level for handler in handlers))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    for name, level in (levels or {}).items():
+        logging.getLogger(name).setLevel(parse_level(level))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shlex
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('discord')
+
+_LOUDNORM_JSON = re.compile(rb'\{[^{}]*"input_i"[^{}]*\}')
+
+
+# 以 FFmpeg 的 loudnorm 濾鏡（只分析、不輸出）測量整首歌的整合響度（LUFS）與真峰值（dBTP）
+async def measure_loudness(url: str, before_options: str = None, executable: str = 'ffmpeg',
+                           timeout: float = 300.0):
+    args = [executable, '-hide_banner', '-nostats', '-nostdin']
+    if before_options:
+        args.extend(shlex.split(before_options))
+    args.extend(['-i', url, '-vn', '-af', 'loudnorm=print_format=json', '-f', 'null', '-'])
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        # 逾時或被取消時確保行程結束
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f'FFmpeg 結束代碼 {process.returncode}: {stderr[-300:].decode(errors="ignore")}')
+    match = None
+    for match in _LOUDNORM_JSON.finditer(stderr):
+        pass
+    if match is None:
+        raise RuntimeError('FFmpeg 輸出中找不到 loudnorm 的測量結果')
+    data = json.loads(match.group(0))
+    return float(data['input_i']), float(data['input_tp'])
+
+
+class _Measurement:
+    __slots__ = ('integrated', 'true_peak', 'measured')
+
+    def __init__(self, integrated, true_peak, measured):
+        self.integrated = integrated   # LUFS；無聲的歌曲為 None
+        self.true_peak = true_peak     # dBTP
+        self.measured = measured
+
+
+# 每首歌（影片 ID）的響度測量結果：
+# 第一次播放時在背景測量一次並保存到 SQLite，之後播放只需套用固定增益（volume 濾鏡），不必即時分析
+class LoudnessCache:
+    def __init__(self, path: str = None, target: float = -16.0, max_gain: float = 12.0,
+                 peak_ceiling: float = -1.0, concurrency: int = 1, timeout: float = 300.0,
+                 max_pending: int = 50, retry_after: float = 3600.0):
+        self.path = path
+        self.target = target
+        self.max_gain = max_gain
+        self.peak_ceiling = peak_ceiling
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._entries = {}      # video_id -> _Measurement
+        self._tasks = {}        # video_id -> 測量中的 asyncio.Task
+        self._failed = {}       # video_id -> 失敗時間，一段時間內不再重試
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+        self.measured = 0
+        self.failures = 0
+        self.skipped = 0
+
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    # 套用到這首歌的增益（dB）：拉到目標響度，但不超過上限，也不讓真峰值超過 peak_ceiling；
+    # 尚未測量或差距小於 0.5 dB 時回傳 None（不需要轉碼）
+    def gain(self, video_id: str):
+        entry = self._entries.get(video_id) if video_id else None
+        if entry is None or entry.integrated is None:
+            return None
+        gain = self.target - entry.integrated
+        gain = min(gain, self.max_gain, self.peak_ceiling - entry.true_peak)
+        gain = max(gain, -self.max_gain)
+        return round(gain, 1) if abs(gain) >= 0.5 else None
+
+    def needs_measurement(self, video_id: str) -> bool:
+        if not video_id or video_id in self._entries or video_id in self._tasks:
+            return False
+        failed = self._failed.get(video_id)
+        return failed is None or time.monotonic() - failed >= self.retry_after
+
+    # 在背景測量（reserve 為取得 FFmpeg 名額的非同步 context manager，可為 None）
+    def schedule(self, video_id: str, url: str, before_options: str = None, reserve=None):
+        if not url or not self.needs_measurement(video_id):
+            return
+        if len(self._tasks) >= self.max_pending:
+            self.skipped += 1
+            return
+        task = asyncio.create_task(self._measure(video_id, url, before_options, reserve))
+        self._tasks[video_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(video_id, None))
+
+    async def _measure(self, video_id, url, before_options, reserve):
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                if reserve is not None:
+                    async with reserve():
+                        integrated, true_peak = await measure_loudness(url, before_options, timeout=self.timeout)
+                else:
+                    integrated, true_peak = await measure_loudness(url, before_options, timeout=self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                self._failed[video_id] = time.monotonic()
+                logger.warning(f"測量響度失敗 {video_id}: {e}")
+                return
+        # 完全無聲時 loudnorm 回報 -inf，不套用增益
+        if integrated == float('-inf'):
+            integrated = None
+        self._entries[video_id] = _Measurement(integrated, true_peak, time.time())
+        self._failed.pop(video_id, None)
+        self._dirty.add(video_id)
+        self.measured += 1
+        logger.info(
+            f"已測量 {video_id} 的響度: {integrated} LUFS，真峰值 {true_peak} dBTP，"
+            f"增益 {self.gain(video_id)} dB（{time.perf_counter() - started:.1f} 秒）"
+        )
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'pending': len(self._tasks),
+            'measured': self.measured,
+            'failures': self.failures,
+            'skipped': self.skipped,
+        }
+
+    def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    # --- 持久化 ---
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS loudness ('
+            'video_id TEXT PRIMARY KEY, integrated REAL, true_peak REAL NOT NULL, measured REAL NOT NULL)'
+        )
+        return conn
+
+    def load(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    rows = conn.execute('SELECT video_id, integrated, true_peak, measured FROM loudness').fetchall()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"讀取響度資料時發生錯誤: {e}")
+            return
+        for video_id, integrated, true_peak, measured in rows:
+            self._entries[video_id] = _Measurement(integrated, true_peak, measured)
+        logger.info(f"已從 {self.path} 載入 {len(rows)} 首歌曲的響度資料")
+
+    # 在事件迴圈上收集待寫入的變更，實際寫入交給 write()
+    def collect_changes(self) -> list:
+        rows = [
+            (video_id, entry.integrated, entry.true_peak, entry.measured)
+            for video_id in self._dirty
+            if (entry := self._entries.get(video_id)) is not None
+        ]
+        self._dirty.clear()
+        return rows
+
+    def write(self, rows):
+        if not self.path or not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany('INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?)', rows)
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"寫入響度資料時發生錯誤: {e}")
+
+    def flush(self):
+        self.write(self.collect_changes())
@@ -0,0 +1,215 @@
+import asyncio
+import random
+from collections import deque
+
+
+# 播放清單：以多個小區塊（deque）組成的序列
+# - 頭尾加入、取出為 O(1)
+# - 依索引存取、刪除、插入只需掃過區塊清單再在單一區塊內操作，約為 O(n/BLOCK_SIZE + BLOCK_SIZE)
+# - 每次變更都會遞增 version，供顯示快取等判斷是否需要重新計算
+# - get() 可被等待，隊列為空時會一直等到有新項目加入
+class Playlist:
+    BLOCK_SIZE = 64
+
+    def __init__(self, items=()):
+        self._blocks = []
+        self._len = 0
+        self._waiters = deque()
+        self.version = 0
+        self.extend(items)
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return self.snapshot()[index]
+            return self.slice(start, stop)
+        block, offset = self._locate(index)
+        return self._blocks[block][offset]
+
+    def empty(self) -> bool:
+        return self._len == 0
+
+    def peek(self):
+        return self._blocks[0][0] if self._len else None
+
+    def snapshot(self) -> list:
+        return list(self)
+
+    # 取出 [start, stop) 的項目，只走訪需要的區塊
+    def slice(self, start: int, stop: int) -> list:
+        start = max(0, start)
+        stop = min(self._len, stop)
+        result = []
+        if start >= stop:
+            return result
+        position = 0
+        for block in self._blocks:
+            size = len(block)
+            if position + size <= start:
+                position += size
+                continue
+            first = max(0, start - position)
+            for i in range(first, size):
+                if position + i >= stop:
+                    return result
+                result.append(block[i])
+            position += size
+        return result
+
+    def _locate(self, index: int):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('playlist index out of range')
+        for block_index, block in enumerate(self._blocks):
+            if index < len(block):
+                return block_index, index
+            index -= len(block)
+        raise IndexError('playlist index out of range')
+
+    def _changed(self):
+        self.version += 1
+        self._wakeup()
+
+    # 喚醒一個等待中的 get()
+    def _wakeup(self):
+        while self._waiters and self._len:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    # --- 新增 ---
+
+    def append(self, item):
+        if not self._blocks or len(self._blocks[-1]) >= self.BLOCK_SIZE:
+            self._blocks.append(deque())
+        self._blocks[-1].append(item)
+        self._len += 1
+        self._changed()
+
+    def appendleft(self, item):
+        if not self._blocks or len(self._blocks[0]) >= self.BLOCK_SIZE:
+            self._blocks.insert(0, deque())
+        self._blocks[0].appendleft(item)
+        self._len += 1
+        self._changed()
+
+    def extend(self, items):
+        added = False
+        for item in items:
+            if not self._blocks or len(self._blocks[-1]) >= self.BLOCK_SIZE:
+                self._blocks.append(deque())
+            self._blocks[-1].append(item)
+            self._len += 1
+            added = True
+        if added:
+            self._changed()
+
+    def insert(self, index: int, item):
+        if index >= self._len:
+            self.append(item)
+            return
+        if index <= 0:
+            self.appendleft(item)
+            return
+        block_index, offset = self._locate(index)
+        block = self._blocks[block_index]
+        block.insert(offset, item)
+        self._len += 1
+        if len(block) > self.BLOCK_SIZE * 2:
+            # 區塊過大時對半拆開，維持區塊內操作的成本
+            half = deque(block.popleft() for _ in range(len(block) // 2))
+            self._blocks.insert(block_index, half)
+        self._changed()
+
+    # --- 取出/刪除 ---
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError('pop from an empty playlist')
+        block = self._blocks[0]
+        item = block.popleft()
+        if not block:
+            del self._blocks[0]
+        self._len -= 1
+        self.version += 1
+        return item
+
+    def pop(self, index: int = -1):
+        block_index, offset = self._locate(index)
+        block = self._blocks[block_index]
+        if offset == 0:
+            item = block.popleft()
+        elif offset == len(block) - 1:
+            item = block.pop()
+        else:
+            item = block[offset]
+            del block[offset]
+        self._len -= 1
+        if not block:
+            del self._blocks[block_index]
+        elif block_index + 1 < len(self._blocks) and len(block) + len(self._blocks[block_index + 1]) <= self.BLOCK_SIZE:
+            # 相鄰的小區塊合併，避免區塊數量無限增長
+            block.extend(self._blocks.pop(block_index + 1))
+        self.version += 1
+        return item
+
+    # 移除前 count 個項目並回傳（用於跳到指定歌曲）
+    def popleft_many(self, count: int) -> list:
+        count = min(count, self._len)
+        removed = []
+        while len(removed) < count:
+            block = self._blocks[0]
+            take = min(len(block), count - len(removed))
+            if take == len(block):
+                removed.extend(block)
+                del self._blocks[0]
+            else:
+                removed.extend(block.popleft() for _ in range(take))
+        self._len -= count
+        if count:
+            self.version += 1
+        return removed
+
+    def move(self, source: int, destination: int):
+        item = self.pop(source)
+        self.insert(destination, item)
+        return item
+
+    def shuffle(self):
+        items = self.snapshot()
+        random.shuffle(items)
+        self.clear()
+        self.extend(items)
+
+    def clear(self):
+        self._blocks = []
+        self._len = 0
+        self.version += 1
+
+    # --- 等待 ---
+
+    async def get(self):
+        while not self._len:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 被喚醒後才取消時，把機會讓給下一個等待者
+                if waiter.done() and not waiter.cancelled():
+                    self._wakeup()
+                raise
+        return self.popleft()
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('discord')
+
+
+# 播放器狀態的持久化（SQLite WAL）：
+# - 在事件迴圈上以 collect() 比對與上次寫入的差異，只產生需要的寫入操作
+# - 隊列以遞增的序號存放：播放消耗（從頭移除）與加入歌曲（接在尾端）只會刪除/新增對應的列，
+#   其他變動（插入、移動、洗牌）才整個重寫該伺服器的隊列
+# - write() 在背景執行緒中批次寫入
+class PlayerStateStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows = {}       # guild_id -> 上次寫入的播放器資料
+        self._versions = {}   # guild_id -> 上次寫入時的隊列版本
+        self._mirrors = {}    # guild_id -> (上次寫入的歌曲物件列表, 第一首的序號)
+        self._forgotten = set()
+        self._reset = False   # 寫入失敗後，下次收集時整個重寫
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS players ('
+            'guild_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'guild_id INTEGER NOT NULL, seq INTEGER NOT NULL, song TEXT NOT NULL, '
+            'PRIMARY KEY (guild_id, seq))'
+        )
+        return conn
+
+    # --- 讀取（在背景執行緒中呼叫） ---
+
+    def load_players(self) -> list:
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    rows = conn.execute('SELECT guild_id, payload FROM players ORDER BY updated DESC').fetchall()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"讀取播放器狀態時發生錯誤: {e}")
+            return []
+        return [dict(json.loads(payload), guild_id=guild_id) for guild_id, payload in rows]
+
+    def load_queue(self, guild_id: int) -> list:
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    rows = conn.execute(
+                        'SELECT song FROM queue WHERE guild_id = ? ORDER BY seq', (guild_id,)
+                    ).fetchall()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"讀取伺服器 {guild_id} 的隊列時發生錯誤: {e}")
+            return []
+        return [json.loads(song) for song, in rows]
+
+    # --- 收集變更（在事件迴圈上呼叫） ---
+
+    def collect(self, guild_id: int, row: dict, queue, serialize) -> list:
+        if self._reset:
+            self._reset = False
+            self._rows.clear()
+            self._versions.clear()
+            self._mirrors.clear()
+        ops = []
+        self._forgotten.discard(guild_id)
+        if self._rows.get(guild_id) != row:
+            self._rows[guild_id] = row
+            ops.append(('player', guild_id, json.dumps(row, ensure_ascii=False)))
+
+        if self._versions.get(guild_id) == queue.version:
+            return ops
+        self._versions[guild_id] = queue.version
+        songs = queue.snapshot()
+        # 沒有對照（啟動或還原後第一次收集、寫入失敗後）時，資料庫中可能已有該伺服器的舊隊列，必須整個重寫
+        old, first_seq = self._mirrors.get(guild_id, (None, 0))
+
+        consumed = self._consumed(old, songs) if old is not None else None
+        if consumed is None:
+            # 無法以「頭部移除 + 尾端新增」表示，整個重寫
+            ops.append(('replace', guild_id, [json.dumps(serialize(song), ensure_ascii=False) for song in songs]))
+            self._mirrors[guild_id] = (songs, 0)
+            return ops
+
+        kept = len(old) - consumed
+        if consumed:
+            ops.append(('popleft', guild_id, first_seq + consumed))
+        appended = songs[kept:]
+        if appended:
+            start = first_seq + len(old)
+            ops.append(('append', guild_id, [
+                (start + i, json.dumps(serialize(song), ensure_ascii=False)) for i, song in enumerate(appended)
+            ]))
+        self._mirrors[guild_id] = (songs, first_seq + consumed)
+        return ops
+
+    # 若 songs 等於 old 去掉前 k 首再接上新歌曲，回傳 k；否則回傳 None
+    @staticmethod
+    def _consumed(old: list, songs: list):
+        if not old:
+            return 0
+        if not songs:
+            return len(old)
+        first = songs[0]
+        for k, song in enumerate(old):
+            if song is first:
+                break
+        else:
+            # 舊的歌曲已全部播完（或移到其他位置），整段當成新加入的歌曲
+            return len(old)
+        remaining = len(old) - k
+        if len(songs) < remaining:
+            return None
+        for a, b in zip(old[k:], songs):
+            if a is not b:
+                return None
+        return k
+
+    def forget(self, guild_id: int):
+        self._rows.pop(guild_id, None)
+        self._versions.pop(guild_id, None)
+        self._mirrors.pop(guild_id, None)
+        self._forgotten.add(guild_id)
+
+    def collect_forgotten(self) -> list:
+        ops = [('delete', guild_id, None) for guild_id in self._forgotten]
+        self._forgotten.clear()
+        return ops
+
+    # --- 寫入（在背景執行緒中呼叫） ---
+
+    def write(self, ops: list):
+        if not ops:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        for op, guild_id, data in ops:
+                            if op == 'player':
+                                conn.execute('INSERT OR REPLACE INTO players VALUES (?, ?, ?)', (guild_id, data, now))
+                            elif op == 'replace':
+                                conn.execute('DELETE FROM queue WHERE guild_id = ?', (guild_id,))
+                                conn.executemany(
+                                    'INSERT INTO queue VALUES (?, ?, ?)',
+                                    [(guild_id, seq, song) for seq, song in enumerate(data)]
+                                )
+                            elif op == 'popleft':
+                                conn.execute('DELETE FROM queue WHERE guild_id = ? AND seq < ?', (guild_id, data))
+                            elif op == 'append':
+                                conn.executemany(
+                                    'INSERT OR REPLACE INTO queue VALUES (?, ?, ?)',
+                                    [(guild_id, seq, song) for seq, song in data]
+                                )
+                            elif op == 'delete':
+                                conn.execute('DELETE FROM players WHERE guild_id = ?', (guild_id,))
+                                conn.execute('DELETE FROM queue WHERE guild_id = ?', (guild_id,))
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"寫入播放器狀態時發生錯誤: {e}")
+            self._reset = True
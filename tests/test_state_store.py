@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist import Playlist  # noqa: E402
+from state_store import PlayerStateStore  # noqa: E402
+
+
+class Item:
+    def __init__(self, value):
+        self.value = value
+
+
+def serialize(item):
+    return {'value': item.value}
+
+
+class PlayerStateStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'player_state.sqlite3')
+        self.row = {'current': None}
+
+    def sync(self, store, queue, guild_id=1):
+        store.write(store.collect(guild_id, self.row, queue, serialize))
+
+    def saved(self, guild_id=1):
+        return [data['value'] for data in PlayerStateStore(self.path).load_queue(guild_id)]
+
+    def test_consume_and_append(self):
+        store = PlayerStateStore(self.path)
+        queue = Playlist(Item(value) for value in range(4))
+        self.sync(store, queue)
+        queue.popleft()
+        queue.append(Item(4))
+        self.sync(store, queue)
+        self.assertEqual(self.saved(), [1, 2, 3, 4])
+
+    # 重新啟動後以新的 store 恢復隊列，第一次收集必須重寫而不是接在舊資料後面
+    def test_restore_does_not_duplicate_rows(self):
+        store = PlayerStateStore(self.path)
+        self.sync(store, Playlist(Item(value) for value in [6, 7, 8, 9]))
+
+        for expected in ([7, 8, 9], [8, 9]):
+            store = PlayerStateStore(self.path)
+            queue = Playlist(Item(data['value']) for data in store.load_queue(1))
+            queue.popleft()
+            self.sync(store, queue)
+            self.assertEqual(self.saved(), expected)
+
+    def test_rewrite_after_write_failure(self):
+        store = PlayerStateStore(self.path)
+        queue = Playlist(Item(value) for value in range(3))
+        self.sync(store, queue)
+        store._reset = True
+        queue.popleft()
+        self.sync(store, queue)
+        self.assertEqual(self.saved(), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from title_index import TitleIndex  # noqa: E402
+
+
+class TitleIndexSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.index = TitleIndex()
+        self.index.add('https://www.youtube.com/watch?v=aaaaaaaaaaa', '周杰倫稻香')
+        self.index.add('https://www.youtube.com/watch?v=bbbbbbbbbbb', '五月天 突然好想你')
+        self.index.add('https://www.youtube.com/watch?v=ccccccccccc', 'Hello World')
+
+    def titles(self, query):
+        return [title for title, _ in self.index.search(query)]
+
+    # 中文標題不以空白分詞，一、兩個字的查詢要能從標題中間開始比對
+    def test_short_cjk_query_matches_inside_title(self):
+        self.assertEqual(self.titles('稻香'), ['周杰倫稻香'])
+        self.assertEqual(self.titles('想你'), ['五月天 突然好想你'])
+        self.assertEqual(self.titles('香'), ['周杰倫稻香'])
+
+    def test_longer_cjk_query(self):
+        self.assertEqual(self.titles('突然好想'), ['五月天 突然好想你'])
+        self.assertEqual(self.titles('好想你 五月'), ['五月天 突然好想你'])
+
+    def test_short_latin_query_matches_word_start(self):
+        self.assertEqual(self.titles('wo'), ['Hello World'])
+        self.assertEqual(self.titles('or'), [])
+
+    def test_no_match(self):
+        self.assertEqual(self.titles('晴天'), [])
+
+
+class TitleIndexPersistenceTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'title_index.sqlite3')
+
+    def rows(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return sorted(conn.execute('SELECT guild_id, url FROM plays').fetchall())
+        finally:
+            conn.close()
+
+    # 移除歌曲時只刪除本行程記錄的伺服器，同一個檔案中其他行程（叢集）的紀錄保留
+    def test_remove_keeps_rows_of_other_guilds(self):
+        url = 'https://www.youtube.com/watch?v=aaaaaaaaaaa'
+        other = TitleIndex(self.path)
+        other.record_play(url, '周杰倫稻香', 2)
+        other.flush()
+
+        index = TitleIndex()
+        index.path = self.path
+        index.record_play(url, '周杰倫稻香', 1)
+        index.flush()
+        self.assertEqual(self.rows(), [(1, url), (2, url)])
+
+        index.remove(url)
+        index.flush()
+        self.assertEqual(self.rows(), [(2, url)])
+
+
+if __name__ == '__main__':
+    unittest.main()
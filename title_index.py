@@ -0,0 +1,263 @@
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger('discord')
+
+_NON_WORD = re.compile(r'[\W_]+')
+# 中日韓文字：標題通常不以空白分詞，短查詢詞可能從任何位置開始
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]')
+
+
+# 比對用的標題形式：全形半形統一、不分大小寫、標點符號換成空白
+def normalize_title(text: str) -> str:
+    return _NON_WORD.sub(' ', unicodedata.normalize('NFKC', text).casefold()).strip()
+
+
+def trigrams(word: str) -> set:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class _Track:
+    __slots__ = ('url', 'title', 'normalized', 'plays', 'guild_plays', 'last_seen')
+
+    def __init__(self, url, title):
+        self.url = url
+        self.title = title
+        self.normalized = normalize_title(title)
+        self.plays = 0            # 所有伺服器的播放次數
+        self.guild_plays = {}     # guild_id -> 該伺服器的播放次數
+        self.last_seen = 0.0      # 最近一次播放或出現在搜尋結果的時間
+
+
+# /play 自動完成用的標題索引（全部在記憶體中，查詢不經過 yt-dlp）：
+# - 每個詞的三字元片段（trigram）-> 歌曲，用於三個字以上的查詢詞
+# - 每個詞的前一、兩個字 -> 歌曲，用於較短的查詢詞；中日韓文字則是每個位置的一、兩個字
+# 結果依該伺服器的播放次數、全域播放次數排序；播放紀錄可存到 SQLite，
+# 只出現在搜尋結果（沒播放過）的歌曲不保存，啟動時由搜尋快取重新加入
+class TitleIndex:
+    def __init__(self, path: str = None, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._tracks = {}        # url -> _Track
+        self._trigrams = {}      # trigram -> set(url)
+        self._prefixes = {}      # 詞的前一、兩個字 -> set(url)
+        self._guild_tracks = {}  # guild_id -> set(url)，該伺服器播放過的歌曲
+        self._pending = {}       # url -> (標題, 時間)，尚未建立索引的歌曲
+        self._dirty = set()      # (guild_id, url)
+        self._deleted = set()    # (guild_id, url)，只刪除本行程載入或記錄過的列
+        self._lock = threading.Lock()
+
+        if self.path:
+            self.load()
+
+    def __len__(self):
+        self._index_pending()
+        return len(self._tracks)
+
+    def _keys(self, track: _Track):
+        for word in track.normalized.split():
+            yield self._prefixes, word[:1]
+            if len(word) >= 2:
+                yield self._prefixes, word[:2]
+            for i in range(1, len(word)):
+                if _CJK.match(word, i):
+                    yield self._prefixes, word[i]
+                    if i + 1 < len(word):
+                        yield self._prefixes, word[i:i + 2]
+            for gram in trigrams(word):
+                yield self._trigrams, gram
+
+    def _link(self, track: _Track):
+        for table, key in self._keys(track):
+            table.setdefault(key, set()).add(track.url)
+
+    def _unlink(self, track: _Track):
+        for table, key in self._keys(track):
+            urls = table.get(key)
+            if urls is not None:
+                urls.discard(track.url)
+                if not urls:
+                    del table[key]
+
+    def _track(self, url: str, title: str) -> _Track:
+        track = self._tracks.get(url)
+        if track is None:
+            track = _Track(url, title)
+            self._tracks[url] = track
+            self._link(track)
+        elif title and title != track.title:
+            # 影片標題可能被上傳者修改
+            self._unlink(track)
+            track.title = title
+            track.normalized = normalize_title(title)
+            self._link(track)
+        return track
+
+    # 出現在搜尋結果或快取中的歌曲（未播放）
+    # 只先記下來，等到查詢或寫入時才建立索引，不拖慢搜尋本身
+    def add(self, url: str, title: str):
+        if not url or not title:
+            return
+        self._pending[url] = (title, time.time())
+        if len(self._pending) >= self.max_entries:
+            self._index_pending()
+
+    def _index_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        for url, (title, seen) in pending.items():
+            track = self._track(url, title)
+            track.last_seen = max(track.last_seen, seen)
+        self._evict()
+
+    def record_play(self, url: str, title: str, guild_id: int):
+        if not url or not title:
+            return
+        track = self._track(url, title)
+        track.plays += 1
+        track.last_seen = time.time()
+        track.guild_plays[guild_id] = track.guild_plays.get(guild_id, 0) + 1
+        self._guild_tracks.setdefault(guild_id, set()).add(url)
+        self._dirty.add((guild_id, url))
+        self._evict()
+
+    def remove(self, url: str):
+        track = self._tracks.pop(url, None)
+        if track is None:
+            return
+        self._unlink(track)
+        for guild_id in track.guild_plays:
+            urls = self._guild_tracks.get(guild_id)
+            if urls is not None:
+                urls.discard(url)
+                if not urls:
+                    del self._guild_tracks[guild_id]
+        self._deleted.update((guild_id, url) for guild_id in track.guild_plays)
+
+    # 超過上限時一次移除一成（最少播放、最久沒出現的優先），避免每次加入都要排序
+    def _evict(self):
+        if len(self._tracks) <= self.max_entries:
+            return
+        excess = len(self._tracks) - int(self.max_entries * 0.9)
+        for track in heapq.nsmallest(excess, self._tracks.values(), key=lambda t: (t.plays, t.last_seen)):
+            self.remove(track.url)
+
+    def _candidates(self, words: list):
+        sets = []
+        for word in words:
+            if len(word) >= 3:
+                for gram in trigrams(word):
+                    urls = self._trigrams.get(gram)
+                    if not urls:
+                        return set()
+                    sets.append(urls)
+            else:
+                urls = self._prefixes.get(word)
+                if not urls:
+                    return set()
+                sets.append(urls)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for urls in sets[1:]:
+            result &= urls
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, guild_id: int = None, limit: int = 25) -> list:
+        self._index_pending()
+        normalized = normalize_title(query)
+        words = normalized.split()
+        if not words:
+            # 還沒輸入內容：列出這個伺服器最常播放的歌曲，沒有紀錄時改用全域
+            urls = self._guild_tracks.get(guild_id) or (url for url, t in self._tracks.items() if t.plays)
+        else:
+            urls = self._candidates(words)
+
+        def rank(track):
+            return (
+                track.normalized.startswith(normalized),
+                track.guild_plays.get(guild_id, 0),
+                track.plays,
+                track.last_seen,
+            )
+
+        matches = (
+            track for track in map(self._tracks.get, urls)
+            # trigram 只保證片段都出現過，仍需確認每個詞確實出現在標題中
+            if track is not None and all(word in track.normalized for word in words)
+        )
+        return [(track.title, track.url) for track in heapq.nlargest(limit, matches, key=rank)]
+
+    # --- 持久化 ---
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS plays ('
+            'guild_id INTEGER NOT NULL, url TEXT NOT NULL, title TEXT NOT NULL, '
+            'plays INTEGER NOT NULL, last_played REAL NOT NULL, PRIMARY KEY (guild_id, url))'
+        )
+        return conn
+
+    def load(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    rows = conn.execute(
+                        'SELECT guild_id, url, title, plays, last_played FROM plays ORDER BY last_played'
+                    ).fetchall()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"讀取標題索引時發生錯誤: {e}")
+            return
+        for guild_id, url, title, plays, last_played in rows:
+            track = self._track(url, title)
+            track.plays += plays
+            track.last_seen = max(track.last_seen, last_played)
+            track.guild_plays[guild_id] = plays
+            self._guild_tracks.setdefault(guild_id, set()).add(url)
+        self._evict()
+        logger.info(f"已從 {self.path} 載入 {len(self._tracks)} 首歌曲的播放紀錄")
+
+    # 在事件迴圈上收集待寫入的變更，實際寫入交給 write()
+    def collect_changes(self):
+        rows = []
+        for guild_id, url in self._dirty:
+            track = self._tracks.get(url)
+            if track is not None and guild_id in track.guild_plays:
+                rows.append((guild_id, url, track.title, track.guild_plays[guild_id], track.last_seen))
+        deleted = list(self._deleted)
+        self._dirty.clear()
+        self._deleted.clear()
+        return rows, deleted
+
+    def write(self, rows, deleted):
+        if not self.path or (not rows and not deleted):
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany('DELETE FROM plays WHERE guild_id = ? AND url = ?', deleted)
+                        conn.executemany('INSERT OR REPLACE INTO plays VALUES (?, ?, ?, ?, ?)', rows)
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"寫入標題索引時發生錯誤: {e}")
+
+    def flush(self):
+        self.write(*self.collect_changes())